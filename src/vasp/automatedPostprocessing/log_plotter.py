@@ -12,6 +12,11 @@ results.
 Example:
 
 vasp-log-plotter simulation.log --plot-all --save --output-directory Results --figure-size 12,8
+
+Instead of a log file, the telemetry file written by the simulation (telemetry.h5 in the results folder)
+can be given, which is read directly without parsing the log:
+
+vasp-log-plotter results/1/telemetry.h5 --plot-all --save --output-directory Results
 """
 
 import re
@@ -22,6 +27,7 @@ from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple, cast
 import pickle
 
+import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
@@ -201,6 +207,82 @@ def parse_log_file(log_file: str) -> Dict[str, Any]:
     return data
 
 
+def parse_telemetry_file(telemetry_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Read a telemetry file written by the simulation and store the data in the same structure as parse_log_file.
+    Since quantities may be recorded at different steps, the time of each quantity is stored in data["times"].
+
+    Args:
+        telemetry_file (str): Path to the telemetry (HDF5) file.
+
+    Returns:
+        Tuple[dict, dict]: The simulation parameters and a dictionary containing the data.
+    """
+    logging.info(f"--- Reading data from '{telemetry_file}'")
+
+    with h5py.File(telemetry_file, "r") as f:
+        parameters = json.loads(f.attrs.get("parameters", "{}"))
+        records = {name: (group["time"][()], group["values"][()]) for name, group in f.items()}
+
+    def values(name: str) -> np.ndarray:
+        return records[name][1] if name in records else np.array([])
+
+    def times(name: str) -> np.ndarray:
+        return records[name][0] if name in records else np.array([])
+
+    data: Dict[str, Any] = {
+        "time_step": values("time_step").astype(int),
+        "time": times("time_step"),
+        "cpu_time": values("cpu_time"),
+        "ramp_factor": values("ramp_factor"),
+        "pressure": values("pressure"),
+        "newton_iteration": {
+            "atol": values("newton_atol"),
+            "rtol": values("newton_rtol"),
+        },
+        "probe_points": {},
+        "probe_points_displacement": {},
+        "flow_properties": {name: values(name) for name in
+                            ["flow_rate", "velocity_mean", "velocity_min", "velocity_max", "cfl_mean", "cfl_min",
+                             "cfl_max", "reynolds_mean", "reynolds_min", "reynolds_max"]},
+        "min_jacobian": values("min_jacobian"),
+        # Quantities may be recorded at different steps, so each one keeps the times it was recorded at
+        "times": {
+            "cpu_time": times("cpu_time"),
+            "ramp_factor": times("ramp_factor"),
+            "pressure": times("pressure"),
+            "flow_rate": times("flow_rate"),
+            "velocity": times("velocity_mean"),
+            "cfl": times("cfl_mean"),
+            "reynolds": times("reynolds_mean"),
+            "probe_points": times("probe_velocity"),
+            "probe_points_displacement": times("probe_displacement"),
+            "min_jacobian": times("min_jacobian"),
+        },
+    }
+
+    # Probe values are stored with shape (num_records, num_points, value_size)
+    if "probe_velocity" in records and "probe_pressure" in records:
+        velocity = values("probe_velocity")
+        pressure = values("probe_pressure")
+        for probe_point in range(velocity.shape[1]):
+            data["probe_points"][probe_point] = {
+                "velocity": velocity[:, probe_point],
+                "magnitude": np.linalg.norm(velocity[:, probe_point], axis=1),
+                "pressure": pressure[:, probe_point, 0],
+            }
+
+    if "probe_displacement" in records:
+        displacement = values("probe_displacement")
+        for probe_point in range(displacement.shape[1]):
+            data["probe_points_displacement"][probe_point] = {
+                "displacement": displacement[:, probe_point],
+                "displacement_magnitude": np.linalg.norm(displacement[:, probe_point], axis=1),
+            }
+
+    return parameters, data
+
+
 def parse_dictionary_from_log(log_file: str) -> dict:
     """
     Parse a dictionary-like content from a log file and return it as a dictionary.
@@ -920,6 +1002,47 @@ def compute_average_over_cycles(data: np.ndarray, time_steps_per_cycle: int) ->
     return average_over_cycles
 
 
+def get_cycle_range(time: np.ndarray, cycle_length: float, dt: float, start_cycle: int,
+                    end_cycle: int) -> Tuple[int, int]:
+    """
+    Get the range of records that were recorded within a range of cycles.
+
+    Args:
+        time (np.ndarray): The times the records were recorded at.
+        cycle_length (float): The length of a cycle.
+        dt (float): The time step size.
+        start_cycle (int): The first cycle of the range (inclusive).
+        end_cycle (int): The last cycle of the range (inclusive).
+
+    Returns:
+        Tuple[int, int]: The start and end index of the records within the range.
+    """
+    inside = np.flatnonzero((time > (start_cycle - 1) * cycle_length + dt / 2) &
+                            (time <= end_cycle * cycle_length + dt / 2))
+    if inside.size == 0:
+        return 0, 0
+
+    return int(inside[0]), int(inside[-1]) + 1
+
+
+def get_records_per_cycle(time: np.ndarray, cycle_length: float, default: int) -> int:
+    """
+    Get the number of records per cycle from the spacing of the times the records were recorded at.
+
+    Args:
+        time (np.ndarray): The times the records were recorded at.
+        cycle_length (float): The length of a cycle.
+        default (int): The number of records per cycle if there are too few records to tell.
+
+    Returns:
+        int: The number of records per cycle.
+    """
+    if len(time) < 2:
+        return default
+
+    return max(round(cycle_length / np.median(np.diff(time))), 1)
+
+
 def compute_tke(probe_points: Dict[int, Dict[str, Any]], time_steps_per_cycle: int, start_cycle: Optional[int] = None,
                 end_cycle: Optional[int] = None) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
     """
@@ -1108,7 +1231,7 @@ def parse_command_line_args() -> argparse.Namespace:
         argparse.Namespace: Parsed command-line arguments.
     """
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument("log_file", type=str, help="Path to the log file")
+    parser.add_argument("log_file", type=str, help="Path to the log file, or to the telemetry file (.h5)")
     parser.add_argument("--plot-all", action="store_true",
                         help="Plot all data in separate figures (default when no specific --plot options are provided)")
     parser.add_argument("--plot-cpu-time", action="store_true", help="Plot CPU time")
@@ -1164,24 +1287,25 @@ def main() -> None:
         logging.warning("WARNING: Select either --compute-average or --compare-cycles, not both.")
         args.compare_cycles = False
 
-    # Parse log data
-    parsed_dict = parse_dictionary_from_log(args.log_file)
-    parsed_data = parse_log_file(args.log_file)
+    # Read telemetry data, or parse log data
+    if Path(args.log_file).suffix == ".h5":
+        parsed_dict, parsed_data = parse_telemetry_file(args.log_file)
+    else:
+        parsed_dict = parse_dictionary_from_log(args.log_file)
+        parsed_data = parse_log_file(args.log_file)
 
     # Extract end time, cycle length and time step size from the parsed dictionary
     end_time = parsed_dict.get("T", 0.951)
-    cycle_length = parsed_dict.get("cardiac_cycle", 0.951)
+    cycle_length = parsed_dict.get("cardiac_cycle", parsed_dict.get("T_Cycle", 0.951))
     dt = parsed_dict.get("dt", 0.001)
 
     # Calculate the number of cycles and the number of time steps per cycle
     num_cycles = int(end_time / cycle_length)
     time_steps_per_cycle = round(cycle_length / dt)
 
-    # Determine start and end range for data
+    # Determine the range of cycles for data
     start_cycle = args.start_cycle
     end_cycle = max(args.end_cycle if args.end_cycle else num_cycles, 1)
-    start = (start_cycle - 1) * time_steps_per_cycle
-    end = min(end_cycle * time_steps_per_cycle, len(parsed_data.get("time", [])))
 
     # Extract variables from the parsed data
     time = parsed_data.get("time", [])
@@ -1204,54 +1328,59 @@ def main() -> None:
     reynolds_max = parsed_data.get("flow_properties", {}).get("reynolds_max", [])
     min_jacobian = parsed_data.get("min_jacobian", [])
 
+    # The telemetry file may record quantities at different steps, so each quantity has its own time, records per
+    # cycle and range of records. Quantities parsed from a log file are recorded at every time step.
+    quantities = ["cpu_time", "ramp_factor", "pressure", "flow_rate", "velocity", "cfl", "reynolds", "probe_points",
+                  "probe_points_displacement", "min_jacobian"]
+    times = {name: np.asarray(parsed_data.get("times", {}).get(name, time)) for name in quantities}
+    records_per_cycle = {name: get_records_per_cycle(times[name], cycle_length, time_steps_per_cycle)
+                         for name in quantities}
+    ranges = {name: get_cycle_range(times[name], cycle_length, dt, start_cycle, end_cycle) for name in quantities}
+
     # Compute average over cycles for all data (except Newton iteration) if enabled
     if args.compute_average:
         logging.info(f"--- Computing average over cycles (cycle {start_cycle}-{end_cycle})")
-        cpu_time = compute_average_over_cycles(cpu_time[start:end], time_steps_per_cycle) \
-            if len(cpu_time) > 0 else cpu_time
-        ramp_factor = compute_average_over_cycles(ramp_factor[start:end], time_steps_per_cycle) \
-            if len(ramp_factor) > 0 else ramp_factor
-        pressure = compute_average_over_cycles(pressure[start:end], time_steps_per_cycle) \
-            if len(pressure) > 0 else pressure
-        flow_rate = compute_average_over_cycles(flow_rate[start:end], time_steps_per_cycle) \
-            if len(flow_rate) > 0 else flow_rate
-        velocity_mean = compute_average_over_cycles(velocity_mean[start:end], time_steps_per_cycle) \
-            if len(velocity_mean) > 0 else velocity_mean
-        velocity_min = compute_average_over_cycles(velocity_min[start:end], time_steps_per_cycle) \
-            if len(velocity_min) > 0 else velocity_min
-        velocity_max = compute_average_over_cycles(velocity_max[start:end], time_steps_per_cycle) \
-            if len(velocity_max) > 0 else velocity_max
-        cfl_mean = compute_average_over_cycles(cfl_mean[start:end], time_steps_per_cycle) \
-            if len(cfl_mean) > 0 else cfl_mean
-        cfl_min = compute_average_over_cycles(cfl_min[start:end], time_steps_per_cycle) \
-            if len(cfl_min) > 0 else cfl_min
-        cfl_max = compute_average_over_cycles(cfl_max[start:end], time_steps_per_cycle) \
-            if len(cfl_max) > 0 else cfl_max
-        reynolds_mean = compute_average_over_cycles(reynolds_mean[start:end], time_steps_per_cycle) \
-            if len(reynolds_mean) > 0 else reynolds_mean
-        reynolds_min = compute_average_over_cycles(reynolds_min[start:end], time_steps_per_cycle) \
-            if len(reynolds_min) > 0 else reynolds_min
-        reynolds_max = compute_average_over_cycles(reynolds_max[start:end], time_steps_per_cycle) \
-            if len(reynolds_max) > 0 else reynolds_max
+
+        def average(name: str, variable: np.ndarray) -> np.ndarray:
+            """Compute the average over the selected cycles of a quantity, using its own range of records."""
+            if len(variable) == 0:
+                return variable
+            start, end = ranges[name]
+            if start == end:
+                raise ValueError(f"No '{name}' data found between cycle {start_cycle} and cycle {end_cycle}")
+            return compute_average_over_cycles(variable[start:end], records_per_cycle[name])
+
+        cpu_time = average("cpu_time", cpu_time)
+        ramp_factor = average("ramp_factor", ramp_factor)
+        pressure = average("pressure", pressure)
+        flow_rate = average("flow_rate", flow_rate)
+        velocity_mean = average("velocity", velocity_mean)
+        velocity_min = average("velocity", velocity_min)
+        velocity_max = average("velocity", velocity_max)
+        cfl_mean = average("cfl", cfl_mean)
+        cfl_min = average("cfl", cfl_min)
+        cfl_max = average("cfl", cfl_max)
+        reynolds_mean = average("reynolds", reynolds_mean)
+        reynolds_min = average("reynolds", reynolds_min)
+        reynolds_max = average("reynolds", reynolds_max)
 
         for probe_point, probe_data in probe_points.items():
-            probe_points[probe_point]["magnitude"] = \
-                compute_average_over_cycles(probe_data["magnitude"][start:end], time_steps_per_cycle) \
-                if len(probe_data["magnitude"]) > 0 else probe_data["magnitude"]
-            probe_points[probe_point]["pressure"] = \
-                compute_average_over_cycles(probe_data["pressure"][start:end], time_steps_per_cycle) \
-                if len(probe_data["pressure"]) > 0 else probe_data["pressure"]
+            probe_points[probe_point]["magnitude"] = average("probe_points", probe_data["magnitude"])
+            probe_points[probe_point]["pressure"] = average("probe_points", probe_data["pressure"])
 
         for probe_point, probe_data in probe_points_displacement.items():
             probe_points_displacement[probe_point]["displacement_magnitude"] = \
-                compute_average_over_cycles(probe_data["displacement_magnitude"][start:end], time_steps_per_cycle) \
-                if len(probe_data["displacement_magnitude"]) > 0 else probe_data["displacement_magnitude"]
+                average("probe_points_displacement", probe_data["displacement_magnitude"])
 
-        time = time[start:start + len(cpu_time)]
+        # The averaged data spans a single cycle, starting at the first record of the range
+        for name in quantities:
+            start = ranges[name][0]
+            times[name] = times[name][start:start + records_per_cycle[name]]
+            ranges[name] = (0, len(times[name]))
 
-        # Update start and end range for data
-        start = 0
-        end = len(cpu_time)
+    def select(name: str) -> Tuple[np.ndarray, int, int, int]:
+        """Get the time, the range of records and the number of records per cycle of a quantity."""
+        return times[name], ranges[name][0], ranges[name][1], records_per_cycle[name]
 
     def check_and_warn_empty(variable_name, variable_data, condition):
         """Check if a variable's data is empty, print a warning, and set the condition to False if it's empty."""
@@ -1261,9 +1390,10 @@ def main() -> None:
         return condition
 
     if check_and_warn_empty("CPU Time", cpu_time, args.plot_all or args.plot_cpu_time):
+        time, start, end, steps_per_cycle = select("cpu_time")
         if args.compare_cycles:
             # Call the plot function to plot CPU time comparison across multiple cycles
-            plot_variable_comparison(cpu_time, "CPU Time", time_steps_per_cycle, save_to_file=args.save,
+            plot_variable_comparison(cpu_time, "CPU Time", steps_per_cycle, save_to_file=args.save,
                                      output_directory=args.output_directory, figure_size=args.figure_size,
                                      start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1273,9 +1403,10 @@ def main() -> None:
                                   start=start, end=end)
 
     if check_and_warn_empty("Ramp Factor", ramp_factor, args.plot_all or args.plot_ramp_factor):
+        time, start, end, steps_per_cycle = select("ramp_factor")
         if args.compare_cycles:
             # Call the plot function to plot ramp factor comparison across multiple cycles
-            plot_variable_comparison(ramp_factor, "Ramp Factor", time_steps_per_cycle, save_to_file=args.save,
+            plot_variable_comparison(ramp_factor, "Ramp Factor", steps_per_cycle, save_to_file=args.save,
                                      output_directory=args.output_directory, figure_size=args.figure_size,
                                      start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1285,9 +1416,10 @@ def main() -> None:
                                   start=start, end=end)
 
     if check_and_warn_empty("Pressure", pressure, args.plot_all or args.plot_pressure):
+        time, start, end, steps_per_cycle = select("pressure")
         if args.compare_cycles:
             # Call the plot function to plot pressure comparison across multiple cycles
-            plot_variable_comparison(pressure, "Pressure", time_steps_per_cycle, save_to_file=args.save,
+            plot_variable_comparison(pressure, "Pressure", steps_per_cycle, save_to_file=args.save,
                                      output_directory=args.output_directory, figure_size=args.figure_size,
                                      start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1309,9 +1441,10 @@ def main() -> None:
                               output_directory=args.output_directory, figure_size=args.figure_size)
 
     if check_and_warn_empty("Flow Rate", flow_rate, args.plot_all or args.plot_flow_rate):
+        time, start, end, steps_per_cycle = select("flow_rate")
         if args.compare_cycles:
             # Call the plot function to plot flow rate comparison across multiple cycles
-            plot_variable_comparison(flow_rate, "Flow Rate", time_steps_per_cycle, save_to_file=args.save,
+            plot_variable_comparison(flow_rate, "Flow Rate", steps_per_cycle, save_to_file=args.save,
                                      output_directory=args.output_directory, figure_size=args.figure_size,
                                      start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1321,10 +1454,11 @@ def main() -> None:
                                   start=start, end=end)
 
     if check_and_warn_empty("Velocity", velocity_mean, args.plot_all or args.plot_velocity):
+        time, start, end, steps_per_cycle = select("velocity")
         if args.compare_cycles:
             # Call the plot function to plot velocity comparison across multiple cycles
             plot_multiple_variables_comparison(velocity_mean, velocity_min, velocity_max, "Velocity",
-                                               time_steps_per_cycle, save_to_file=args.save,
+                                               steps_per_cycle, save_to_file=args.save,
                                                output_directory=args.output_directory, figure_size=args.figure_size,
                                                start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1334,10 +1468,11 @@ def main() -> None:
                                             figure_size=args.figure_size, start=start, end=end)
 
     if check_and_warn_empty("CFL", cfl_mean, args.plot_all or args.plot_cfl):
+        time, start, end, steps_per_cycle = select("cfl")
         if args.compare_cycles:
             # Call the plot function to plot velocity comparison across multiple cycles
             plot_multiple_variables_comparison(cfl_mean, cfl_min, cfl_max, "CFL",
-                                               time_steps_per_cycle, save_to_file=args.save,
+                                               steps_per_cycle, save_to_file=args.save,
                                                output_directory=args.output_directory, figure_size=args.figure_size,
                                                start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1347,10 +1482,11 @@ def main() -> None:
                                             start=start, end=end)
 
     if check_and_warn_empty("Reynolds Numbers", reynolds_mean, args.plot_all or args.plot_reynolds):
+        time, start, end, steps_per_cycle = select("reynolds")
         if args.compare_cycles:
             # Call the plot function to plot velocity comparison across multiple cycles
             plot_multiple_variables_comparison(reynolds_mean, reynolds_min, reynolds_max, "Reynolds Numbers",
-                                               time_steps_per_cycle, save_to_file=args.save,
+                                               steps_per_cycle, save_to_file=args.save,
                                                output_directory=args.output_directory, figure_size=args.figure_size,
                                                start_cycle=start_cycle, end_cycle=end_cycle)
         else:
@@ -1360,6 +1496,7 @@ def main() -> None:
                                             figure_size=args.figure_size, start=start, end=end)
 
     if check_and_warn_empty("Probe Points", probe_points, args.plot_all or args.plot_probe_points):
+        time, start, end, steps_per_cycle = select("probe_points")
         if args.save_probes:
             # Save probe points data to files
             save_probe_points_data_to_file(probe_points, args.output_directory, time, start=start, end=end)
@@ -1368,7 +1505,7 @@ def main() -> None:
 
         elif args.compare_cycles:
             # Call the plot function to plot probe points comparison across multiple cycles
-            plot_probe_points_comparison(probe_points, time_steps_per_cycle, selected_probe_points=args.probe_points,
+            plot_probe_points_comparison(probe_points, steps_per_cycle, selected_probe_points=args.probe_points,
                                          save_to_file=args.save, figure_size=args.figure_size,
                                          output_directory=args.output_directory, start_cycle=start_cycle,
                                          end_cycle=end_cycle)
@@ -1380,6 +1517,7 @@ def main() -> None:
 
     if check_and_warn_empty("Probe Points Displacement", probe_points_displacement,
                             args.plot_all or args.plot_probe_points_displacement):
+        time, start, end, steps_per_cycle = select("probe_points_displacement")
         if args.save_probes:
             # Save probe points displacement data to files
             save_probe_points_displacement_data_to_file(probe_points_displacement, args.output_directory, time,
@@ -1389,7 +1527,7 @@ def main() -> None:
 
         elif args.compare_cycles:
             # Call the plot function to plot probe points comparison across multiple cycles
-            plot_probe_points_displacement_comparison(probe_points_displacement, time_steps_per_cycle,
+            plot_probe_points_displacement_comparison(probe_points_displacement, steps_per_cycle,
                                                       selected_probe_points=args.probe_points, save_to_file=args.save,
                                                       figure_size=args.figure_size,
                                                       output_directory=args.output_directory, start_cycle=start_cycle,
@@ -1401,19 +1539,20 @@ def main() -> None:
                                            output_directory=args.output_directory, start=start, end=end)
 
     if check_and_warn_empty("Probe Points", probe_points, args.plot_all or args.plot_probe_points_tke):
+        time, start, end, steps_per_cycle = select("probe_points")
         # Compute TKE data for probe points
-        tke_data = compute_tke(probe_points, time_steps_per_cycle, start_cycle=start_cycle, end_cycle=end_cycle)
+        tke_data = compute_tke(probe_points, steps_per_cycle, start_cycle=start_cycle, end_cycle=end_cycle)
 
         if args.compute_average:
             for i, (probe_point, (mean_velocities, fluctuating_velocities, tke_values)) in enumerate(tke_data.items()):
                 tke_data[probe_point] = \
                     (mean_velocities, fluctuating_velocities,
-                     compute_average_over_cycles(tke_values, time_steps_per_cycle)) \
+                     compute_average_over_cycles(tke_values, steps_per_cycle)) \
                     if len(tke_values) > 0 else (mean_velocities, fluctuating_velocities, tke_values)
 
         if args.compare_cycles:
             # Call the plot function to plot probe points comparison across multiple cycles
-            plot_probe_points_tke_comparison(tke_data, time_steps_per_cycle, selected_probe_points=args.probe_points,
+            plot_probe_points_tke_comparison(tke_data, steps_per_cycle, selected_probe_points=args.probe_points,
                                              save_to_file=args.save, figure_size=args.figure_size,
                                              output_directory=args.output_directory)
         else:
@@ -1423,9 +1562,10 @@ def main() -> None:
                                   start=start, end=end)
 
     if check_and_warn_empty("Minimum Jacobian", min_jacobian, args.plot_all or args.plot_min_jacobian):
+        time, start, end, steps_per_cycle = select("min_jacobian")
         if args.compare_cycles:
             # Call the plot function to plot minimum Jacobian comparison across multiple cycles
-            plot_variable_comparison(min_jacobian, "Minimum Jacobian", time_steps_per_cycle, save_to_file=args.save,
+            plot_variable_comparison(min_jacobian, "Minimum Jacobian", steps_per_cycle, save_to_file=args.save,
                                      output_directory=args.output_directory, figure_size=args.figure_size,
                                      start_cycle=start_cycle, end_cycle=end_cycle)
         else:
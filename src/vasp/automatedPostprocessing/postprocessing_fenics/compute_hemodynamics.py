@@ -73,10 +73,12 @@ class InterpolateDG:
         self.dof_coords = V.tabulate_dof_coordinates()
         self.fa = FunctionAssigner(V_sub, self.Ws)
 
-    def __call__(self, u_vec: np.ndarray) -> Function:
-        """interpolate DG function from the domain to the boundary"""
-
-        for k, (coords_k, vec, sub_dofmap) in enumerate(zip(self.sub_coords, self.w_sub_copy, self.sub_dofmaps)):
+        # The mapping between the dofs only depends on the meshes, so it is computed once and reused for each call
+        self.sub_dofs = []
+        self.copy_dofs = []
+        for k, (coords_k, sub_dofmap) in enumerate(zip(self.sub_coords, self.sub_dofmaps)):
+            sub_dofs_k = []
+            copy_dofs_k = []
             for i, facet in enumerate(self.sub_map):
                 cells = self.f_to_c(facet)
                 # Get closure dofs on parent facet
@@ -90,9 +92,17 @@ class InterpolateDG:
                         if np.allclose(self.dof_coords[dof], sub_coord):
                             copy_dofs[j] = dof
                             break
-                sub_dofs = sub_dofmap.cell_dofs(i)
-                vec[sub_dofs] = u_vec[copy_dofs]
+                sub_dofs_k.append(sub_dofs)
+                copy_dofs_k.append(copy_dofs)
+
+            self.sub_dofs.append(np.concatenate(sub_dofs_k) if sub_dofs_k else np.empty(0, dtype=np.int32))
+            self.copy_dofs.append(np.concatenate(copy_dofs_k) if copy_dofs_k else np.empty(0, dtype=np.int32))
 
+    def __call__(self, u_vec: np.ndarray) -> Function:
+        """interpolate DG function from the domain to the boundary"""
+
+        for k, (vec, sub_dofs, copy_dofs) in enumerate(zip(self.w_sub_copy, self.sub_dofs, self.copy_dofs)):
+            vec[sub_dofs] = u_vec[copy_dofs]
             self.ws[k].vector().set_local(vec)
 
         self.fa.assign(self.v_sub, self.ws)
@@ -119,11 +129,17 @@ class SurfaceProjector:
         self.A.ident_zeros()
         self.u_ = Function(V)
         self.solver = LUSolver(self.A)
+        self.f = None
 
     def __call__(self, f: Function) -> Function:
-        v = TestFunction(self.u_.function_space())
-        self.b_proj = inner(f, v) * ds
-        self.b = assemble(self.b_proj)
+        # The right-hand side form and vector are only created once when projecting the same expression repeatedly
+        if f is not self.f:
+            v = TestFunction(self.u_.function_space())
+            self.f = f
+            self.b_proj = inner(f, v) * ds
+            self.b = assemble(self.b_proj)
+        else:
+            assemble(self.b_proj, tensor=self.b)
         self.solver.solve(self.u_.vector(), self.b)
         return self.u_
 
@@ -4,19 +4,27 @@
 
 """
 This script reads the displacement and velocity data from turtleFSI output and reformats the data so that it can be read
-in fenics. The output files are saved in the Visualization_separate_domain folder.
+in fenics. The output files are saved in the Visualization_separate_domain folder. When run with several processes,
+each process converts its own range of time steps into a segment file, and the segments are combined into the output
+files with virtual datasets, e.g.
+
+    mpirun -np 16 vasp-create-hdf5 --folder aneurysm_results/1
 """
 
+import os
+import shutil
 import numpy as np
 import h5py
 from pathlib import Path
 import json
 import logging
 import argparse
+from typing import List, Union
 from tqdm import tqdm
 
 from vasp.automatedPostprocessing.postprocessing_common import get_domain_ids, output_file_lists
-from dolfin import Mesh, HDF5File, VectorFunctionSpace, Function, MPI, parameters
+from dolfin import Mesh, HDF5File, VectorFunctionSpace, FunctionSpace, MPI, parameters, vertex_to_dof_map
+from mpi4py import MPI as mpi
 
 
 # set compiler arguments
@@ -46,8 +54,74 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
+class HDF5FunctionWriter:
+    """
+    Writer of a time series of a function in the layout of `HDF5File.write(u, name, t)` in dolfin, i.e. the function
+    basis in /<name>/cells, /<name>/cell_dofs and /<name>/x_cell_dofs, and one dataset /<name>/vector_%d with a
+    timestamp attribute per time step, written directly from the vertex values with h5py. The layout and the mapping
+    from vertex values to dofs are computed once, and the file is kept open, such that several time steps can be
+    written per call without copying the values into a dolfin Function. Only runs in serial, e.g. on MPI.comm_self.
+    """
+    def __init__(self, V: FunctionSpace, output_path: Union[str, Path], name: str) -> None:
+        """
+        Initialize the writer, and create the output file with the function basis.
+
+        Args:
+            V (dolfin.FunctionSpace): Continuous linear (vector) function space of the written function.
+            output_path (str or Path): Path to the output file, overwritten if it exists.
+            name (str): Name of the function in the output file, e.g. velocity or displacement.
+        """
+        mesh = V.mesh()
+        tdim = mesh.topology().dim()
+        dofmap = V.dofmap()
+        num_cells = mesh.num_cells()
+        # The cell dofs keep the integer type of the dofmap (la_index), as written by HDF5File
+        cell_dofs = np.concatenate([dofmap.cell_dofs(i) for i in range(num_cells)])
+        dofs_per_cell = len(cell_dofs) // max(num_cells, 1)
+
+        # Position of the value of each vertex and component in the vector
+        self.vertex_dofs = vertex_to_dof_map(V)
+        self.vector_size = V.dim()
+        self.name = name
+        self.count = 0
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        self.file = h5py.File(output_path, "w")
+        self.group = self.file.create_group(name)
+        self.group["cells"] = mesh.topology().global_indices(tdim).astype(np.uint64)
+        self.group["cell_dofs"] = cell_dofs
+        self.group["x_cell_dofs"] = np.arange(0, num_cells * dofs_per_cell + 1, dofs_per_cell, dtype=np.uint64)
+        self.group.attrs["signature"] = np.bytes_(V.element().signature())
+        self.group.attrs.create("count", 0, dtype=np.uint64)
+
+    def write(self, times: List[float], values: np.ndarray) -> None:
+        """
+        Append time steps of the function, given by its values at the mesh vertices.
+
+        Args:
+            times (list): Times of the time steps.
+            values (np.ndarray): Values with shape (num_times, num_vertices, value_size).
+        """
+        for t, vertex_values in zip(times, values):
+            vector = np.empty(self.vector_size)
+            vector[self.vertex_dofs] = np.asarray(vertex_values).ravel()
+            dataset = self.group.create_dataset(f"vector_{self.count}", data=vector)
+            dataset.attrs["timestamp"] = np.float64(t)
+            # Start of the local range of each process that wrote the vector
+            dataset.attrs["partitions"] = np.zeros(1, dtype=np.uint64)
+            self.count += 1
+
+        self.group.attrs.create("count", self.count, dtype=np.uint64)
+
+    def close(self) -> None:
+        """
+        Close the output file.
+        """
+        self.file.close()
+
+
 def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_time, end_time, extract_solid_only,
-                fluid_domain_id, solid_domain_id):
+                fluid_domain_id, solid_domain_id, batch_size=10):
 
     """
     Loads displacement/velocity data from turtleFSI output and reformats the data so that it can be read in fenics.
@@ -62,6 +136,7 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
                                     If False, both the fluid and solid domains are extracted.
         fluid_domain_id (int or list): ID of the fluid domain
         solid_domain_id (int or list): ID of the solid domain
+        batch_size (int): Number of time steps written to the output files at once
     """
 
     # Define mesh path related variables
@@ -77,20 +152,21 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
 
     # Read fluid and solid mesh
     logging.info("--- Reading fluid and solid mesh files \n")
-    mesh_fluid = Mesh()
-    with HDF5File(MPI.comm_world, str(fluid_domain_path), "r") as mesh_file:
+    # Each process reads the whole meshes, and converts its own range of time steps
+    rank = MPI.rank(MPI.comm_world)
+    size = MPI.size(MPI.comm_world)
+    mesh_fluid = Mesh(MPI.comm_self)
+    with HDF5File(MPI.comm_self, str(fluid_domain_path), "r") as mesh_file:
         mesh_file.read(mesh_fluid, "mesh", False)
 
-    mesh_solid = Mesh()
-    with HDF5File(MPI.comm_world, str(solid_domain_path), "r") as mesh_file:
+    mesh_solid = Mesh(MPI.comm_self)
+    with HDF5File(MPI.comm_self, str(solid_domain_path), "r") as mesh_file:
         mesh_file.read(mesh_solid, "mesh", False)
 
     # Define function spaces and functions
     logging.info("--- Defining function spaces and functions \n")
     Vf = VectorFunctionSpace(mesh_fluid, "CG", 1)
     Vs = VectorFunctionSpace(mesh_solid, "CG", 1)
-    u = Function(Vf)
-    d = Function(Vs)
 
     # Define paths for velocity and displacement files
     xdmf_file_v = visualization_path / "velocity.xdmf"
@@ -111,17 +187,9 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
         logging.info("--- Displacement will be extracted for both the fluid and solid domains \n")
         d_ids = all_ids
 
-    # Open up the first velocity.h5 file to get the number of timesteps and nodes for the output data
-    file = visualization_path / h5file_name_list[0]
-    vector_data = h5py.File(str(file))
-    vector_array_all = vector_data['VisualisationVector/0'][:, :]
-    vector_array = vector_array_all[fluid_ids, :]
-
-    # Open up the first displacement.h5 file to get the number of timesteps and nodes for the output data
-    file_d = visualization_path / h5file_name_list_d[0]
-    vector_data_d = h5py.File(str(file_d))
-    vector_array_all_d = vector_data_d['VisualisationVector/0'][:, :]
-    vector_array_d = vector_array_all_d[d_ids, :]
+    # Open up the first velocity.h5 and displacement.h5 files, the files are kept open while they are read
+    vector_data = h5py.File(str(visualization_path / h5file_name_list[0]), "r")
+    vector_data_d = h5py.File(str(visualization_path / h5file_name_list_d[0]), "r")
 
     # Deinfe path to the output files
     visualization_separate_domain_folder = visualization_path.parent / "Visualization_separate_domain"
@@ -131,8 +199,23 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
 
     # save fluid mesh as mesh.h5 for computing flow metrics indices later with VaMPy
     mesh_save_path = visualization_separate_domain_folder / "mesh.h5"
-    with HDF5File(MPI.comm_world, str(mesh_save_path), "w") as mesh_file:
-        mesh_file.write(mesh_fluid, "mesh")
+    if rank == 0:
+        with HDF5File(MPI.comm_self, str(mesh_save_path), "w") as mesh_file:
+            mesh_file.write(mesh_fluid, "mesh")
+
+    # With several processes, each process writes its time steps to a segment file
+    if size > 1:
+        segment_folder = visualization_separate_domain_folder / "segments"
+        # Remove the segments of earlier runs, e.g. with more processes, before any process writes its segment
+        if rank == 0:
+            shutil.rmtree(segment_folder, ignore_errors=True)
+            segment_folder.mkdir(parents=True)
+        MPI.barrier(MPI.comm_world)
+        u_segment_path = segment_folder / f"{u_output_path.stem}_{rank}.h5"
+        d_segment_path = segment_folder / f"{d_output_path.stem}_{rank}.h5"
+    else:
+        u_segment_path = u_output_path
+        d_segment_path = d_output_path
 
     # Initialize h5 file names that might differ during the loop
     h5_file_prev = None
@@ -150,10 +233,19 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
     start_time_index = int(start_time / save_time_step) - 1
     end_time_index = int(end_time / save_time_step)
 
+    # Split the time steps into contiguous ranges, one per process
+    file_counters = np.array_split(np.arange(start_time_index, end_time_index, stride), size)[rank]
+
+    # Write the time steps in batches, with the function basis computed once and the output files kept open
+    if len(file_counters) > 0:
+        u_writer = HDF5FunctionWriter(Vf, u_segment_path, "velocity")
+        d_writer = HDF5FunctionWriter(Vs, d_segment_path, "displacement")
+    times, u_values, d_values = [], [], []
+
     # Initialize tqdm with the total number of iterations
-    progress_bar = tqdm(total=end_time_index - start_time_index, desc="--- Converting data:", unit="step")
+    progress_bar = tqdm(total=len(file_counters), desc="--- Converting data:", unit="step", disable=rank != 0)
 
-    for file_counter in range(start_time_index, end_time_index, stride):
+    for file_counter in file_counters:
 
         time = timevalue_list[file_counter]
 
@@ -165,14 +257,14 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
         h5_file = visualization_path / h5file_name_list[file_counter]
         if h5_file != h5_file_prev:
             vector_data.close()
-            vector_data = h5py.File(str(h5_file))
+            vector_data = h5py.File(str(h5_file), "r")
         h5_file_prev = h5_file
 
         # Open input displacement h5 file
         h5_file_d = visualization_path / h5file_name_list_d[file_counter]
         if h5_file_d != h5_file_prev_d:
             vector_data_d.close()
-            vector_data_d = h5py.File(str(h5_file_d))
+            vector_data_d = h5py.File(str(h5_file_d), "r")
         h5_file_prev_d = h5_file_d
 
         # Open up Vector Arrays from h5 file
@@ -181,28 +273,15 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
         array_name_d = 'VisualisationVector/' + str((index_list_d[file_counter]))
         vector_array_all_d = vector_data_d[array_name_d][:, :]
 
-        vector_array = vector_array_all[fluid_ids, :]
-        vector_array_d = vector_array_all_d[d_ids, :]
-
-        # Flatten the vector array and insert into the function
-        vector_np_flat = vector_array.flatten('F')
-        u.vector().set_local(vector_np_flat)
+        times.append(time)
+        u_values.append(vector_array_all[fluid_ids, :])
+        d_values.append(vector_array_all_d[d_ids, :])
 
-        # Flatten the vector array and insert into the function
-        vector_np_flat_d = vector_array_d.flatten('F')
-        d.vector().set_local(vector_np_flat_d)
-
-        file_mode = "a" if file_counter > start_time_index else "w"
-
-        # Save velocity
-        viz_u_file = HDF5File(MPI.comm_world, str(u_output_path), file_mode=file_mode)
-        viz_u_file.write(u, "/velocity", time)
-        viz_u_file.close()
-
-        # Save displacment
-        viz_d_file = HDF5File(MPI.comm_world, str(d_output_path), file_mode=file_mode)
-        viz_d_file.write(d, "/displacement", time)
-        viz_d_file.close()
+        # Save velocity and displacement
+        if len(times) == batch_size or file_counter == file_counters[-1]:
+            u_writer.write(times, u_values)
+            d_writer.write(times, d_values)
+            times, u_values, d_values = [], [], []
 
         # Update the information in the progress bar
         progress_bar.set_postfix({"Timestep": index_list[file_counter], "Time": timevalue_list[file_counter],
@@ -210,18 +289,71 @@ def create_hdf5(visualization_path, mesh_path, save_time_step, stride, start_tim
         progress_bar.update()
 
     progress_bar.close()
+    vector_data.close()
+    vector_data_d.close()
+    if len(file_counters) > 0:
+        u_writer.close()
+        d_writer.close()
+
+    # Combine the segments of the processes that converted any time steps, in the order of the time steps
+    if size > 1:
+        wrote_segment = mpi.COMM_WORLD.gather(len(file_counters) > 0, root=0)
+        if rank == 0:
+            logging.info("--- Combining the segments of all processes \n")
+            for output_path, name in [(u_output_path, "velocity"), (d_output_path, "displacement")]:
+                segment_paths = [segment_folder / f"{output_path.stem}_{i}.h5" for i in range(size)
+                                 if wrote_segment[i]]
+                stitch_hdf5_segments(segment_paths, output_path, name)
+        MPI.barrier(MPI.comm_world)
 
     logging.info("--- Finished reading solutions")
     logging.info(f"--- Saved u.h5 and d.h5 in {visualization_separate_domain_folder.absolute()}")
 
 
-def main() -> None:
+def stitch_hdf5_segments(segment_paths: List[Path], output_path: Path, name: str) -> None:
+    """
+    Combine segment files written by HDF5FunctionWriter, each with a contiguous range of time steps of the same
+    function, into one file in the same layout, where /<name>/vector_%d are virtual datasets referring to the segments.
+    The function basis (cells, cell_dofs and x_cell_dofs) is copied from the first segment, and the segments have to
+    be kept next to the output file.
 
-    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial."
+    Args:
+        segment_paths (list): Paths to the segment files, in the order of the time steps.
+        output_path (Path): Path to the output file.
+        name (str): Name of the function in the segment files, e.g. velocity or displacement.
+    """
+    with h5py.File(output_path, "w") as output_file:
+        output_group = output_file.create_group(name)
+        count = 0
+        for segment_path in segment_paths:
+            # The source files of the virtual datasets are found relative to the output file
+            source_path = os.path.relpath(segment_path, output_path.parent)
+            with h5py.File(segment_path, "r") as segment_file:
+                segment_group = segment_file[name]
+                if "cells" not in output_group:
+                    for dataset_name in ["cells", "cell_dofs", "x_cell_dofs"]:
+                        segment_file.copy(segment_group[dataset_name], output_group, dataset_name)
+                    for key, value in segment_group.attrs.items():
+                        output_group.attrs[key] = value
+
+                for i in range(int(segment_group.attrs["count"])):
+                    vector = segment_group[f"vector_{i}"]
+                    layout = h5py.VirtualLayout(shape=vector.shape, dtype=vector.dtype)
+                    layout[...] = h5py.VirtualSource(source_path, vector.name, shape=vector.shape)
+                    output_vector = output_group.create_virtual_dataset(f"vector_{count}", layout)
+                    for key, value in vector.attrs.items():
+                        output_vector.attrs[key] = value
+                    count += 1
+
+        output_group.attrs.create("count", count, dtype=np.uint64)
+
+
+def main() -> None:
 
     args = parse_arguments()
 
-    logging.basicConfig(level=args.log_level, format="%(message)s")
+    logging.basicConfig(level=args.log_level if MPI.rank(MPI.comm_world) == 0 else logging.WARNING,
+                        format="%(message)s")
 
     # Define paths for visulization and mesh files
     folder_path = Path(args.folder)
@@ -27,7 +27,7 @@ from vampy.simulation.simulation_common import print_mesh_information
 
 from vasp.automatedPreprocessing.preprocessing_common import generate_mesh, distance_to_spheres_solid_thickness, \
     dist_sphere_spheres, convert_xml_mesh_to_hdf5, convert_vtu_mesh_to_xdmf, edge_length_evaluator, \
-    check_flatten_boundary, map_thickness_to_mesh, update_entity_ids_by_thickness
+    check_flatten_boundary, map_thickness_to_mesh, update_entity_ids_by_thickness, reorder_mesh
 from vasp.simulations.simulation_common import load_mesh_and_data
 
 
@@ -54,7 +54,7 @@ def run_pre_processing(input_model, verbose_print, smoothing_method, smoothing_f
                        remove_all, solid_thickness, solid_thickness_parameters, mesh_format, flow_rate_factor,
                        solid_side_wall_id, interface_fsi_id, solid_outer_wall_id, fluid_volume_id, solid_volume_id,
                        mesh_generation_retries, no_solid, extract_branch, branch_group_ids, branch_ids_offset,
-                       distance_method, thickness_to_entity_id_mapping):
+                       distance_method, thickness_to_entity_id_mapping, reorder_mesh_method=None):
     """
     Automatically generate mesh of surface model in .vtu and .xml format, including prescribed
     flow rates at inlet and outlet based on flow network model.
@@ -88,6 +88,7 @@ def run_pre_processing(input_model, verbose_print, smoothing_method, smoothing_f
         solid_thickness (str): Constant or variable mesh thickness
         solid_thickness_parameters (list): Specify parameters for solid thickness
         mesh_format (str): Specify the format for the generated mesh
+        reorder_mesh_method (str): Renumber the HDF5 mesh with 'rcm' or 'hilbert' ordering, or None to keep the order
         flow_rate_factor (float): Flow rate factor
         solid_side_wall_id (int): ID for solid side wall
         interface_fsi_id (int): ID for the FSI interface
@@ -580,6 +581,10 @@ def run_pre_processing(input_model, verbose_print, smoothing_method, smoothing_f
         print("--- Flattening the inlet/outlet if needed\n")
         check_flatten_boundary(num_inlets_outlets, file_name_hdf5_mesh, threshold_stdev=0.001)
 
+        if reorder_mesh_method is not None:
+            print(f"--- Reordering mesh with {reorder_mesh_method}\n")
+            reorder_mesh(file_name_hdf5_mesh, method=reorder_mesh_method)
+
         # Evaluate edge length for inspection
         print("--- Evaluating edge length\n")
         edge_length_evaluator(file_name_xml_mesh, file_name_edge_length_xdmf)
@@ -866,6 +871,13 @@ def read_command_line(input_path=None):
                         default="hdf5",
                         help="Specify the format for the generated mesh. Available options: 'xml', 'hdf5', 'xdmf'.")
 
+    parser.add_argument('-rm', '--reorder-mesh',
+                        type=str,
+                        choices=["none", "rcm", "hilbert"],
+                        default="none",
+                        help="Renumber the vertices and cells of the HDF5 mesh for cache locality and lower fill-in, " +
+                             "with reverse Cuthill-McKee (rcm) or Hilbert curve (hilbert) ordering.")
+
     parser.add_argument('-fr', '--flow-rate-factor',
                         default=0.31,
                         type=float,
@@ -968,7 +980,8 @@ def read_command_line(input_path=None):
                 solid_volume_id=args.solid_volume_id, mesh_generation_retries=args.mesh_generation_retries,
                 no_solid=args.no_solid, extract_branch=args.extract_branch,
                 branch_group_ids=args.branch_group_ids, branch_ids_offset=args.branch_ids_offset,
-                distance_method=args.distance_method, thickness_to_entity_id_mapping=thickness_to_entity_id_mapping)
+                distance_method=args.distance_method, thickness_to_entity_id_mapping=thickness_to_entity_id_mapping,
+                reorder_mesh_method=None if args.reorder_mesh == "none" else args.reorder_mesh)
 
 
 def main_meshing():
@@ -0,0 +1,45 @@
+"""
+Partition a mesh for a given number of processes and save the partitioned mesh, such that simulations with the same
+number of processes load the partition directly instead of partitioning the mesh at every launch and restart.
+Run with the number of processes of the simulation, e.g.
+
+    mpirun -np 64 vasp-partition-mesh --mesh-path mesh/file_aneurysm.h5
+"""
+import argparse
+from pathlib import Path
+
+from dolfin import MPI, parameters
+
+from vasp.simulations.simulation_common import save_partitioned_mesh
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the mesh file")
+    parser.add_argument("--partition-folder", type=Path, default=None,
+                        help="Folder for the partitioned mesh (default: <mesh folder>/Partitions)")
+    parser.add_argument("--ghost-mode", type=str, default="shared_vertex",
+                        choices=["none", "shared_facet", "shared_vertex"],
+                        help="Ghost mode of the simulation, set in the problem file")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    assert args.mesh_path.exists(), f"Mesh file {args.mesh_path} does not exist"
+
+    parameters["ghost_mode"] = args.ghost_mode
+    partition_path = save_partitioned_mesh(args.mesh_path, args.partition_folder)
+
+    if MPI.rank(MPI.comm_world) == 0:
+        print(f"--- Saved mesh partitioned for {MPI.size(MPI.comm_world)} processes to {partition_path}")
+
+
+if __name__ == "__main__":
+    main()
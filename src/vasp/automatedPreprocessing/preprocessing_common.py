@@ -1,6 +1,7 @@
 # Copyright (c) 2023 Simula Research Laboratory
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import shutil
 from pathlib import Path
 from typing import Union
 
@@ -8,6 +9,8 @@ import vtk
 import h5py
 import numpy as np
 import meshio
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 from dolfin import Mesh, MeshFunction, File, HDF5File, FunctionSpace, Function, XDMFFile, cells, Edge
 from vmtk import vmtkdistancetospheres, vmtkdijkstradistancetopoints
 from morphman import vmtkscripts, write_polydata
@@ -247,6 +250,162 @@ def convert_xml_mesh_to_hdf5(file_name_xml_mesh: Union[str, Path], scaling_facto
     hdf.write(domains, "/domains")
 
 
+def hilbert_curve_keys(points: np.ndarray, bits: int = 21) -> np.ndarray:
+    """
+    Compute the position of points along a three-dimensional Hilbert curve through their bounding box, using the
+    algorithm of Skilling (2004), "Programming the Hilbert curve".
+
+    Args:
+        points (np.ndarray): Coordinates of the points, with shape (number of points, 3).
+        bits (int): Number of bits of the grid in each direction. At most 21, such that the keys fit in 64 bits.
+
+    Returns:
+        np.ndarray: Hilbert key of each point.
+    """
+    # Map the coordinates to integers on a 2^bits grid
+    lower = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lower, np.finfo(float).tiny)
+    max_index = (1 << bits) - 1
+    X = [np.minimum(((points[:, i] - lower[i]) / extent[i] * max_index).astype(np.uint64), max_index)
+         for i in range(points.shape[1])]
+    num_dims = len(X)
+
+    # Inverse undo of the rotations and reflections
+    Q = np.uint64(1 << (bits - 1))
+    while Q > 1:
+        P = Q - np.uint64(1)
+        for i in range(num_dims):
+            has_bit = (X[i] & Q) != 0
+            t = (X[0] ^ X[i]) & P
+            X[0] = np.where(has_bit, X[0] ^ P, X[0] ^ t)
+            if i > 0:
+                X[i] = np.where(has_bit, X[i], X[i] ^ t)
+        Q >>= np.uint64(1)
+
+    # Gray encode
+    for i in range(1, num_dims):
+        X[i] ^= X[i - 1]
+    t = np.zeros_like(X[0])
+    Q = np.uint64(1 << (bits - 1))
+    while Q > 1:
+        t = np.where((X[-1] & Q) != 0, t ^ (Q - np.uint64(1)), t)
+        Q >>= np.uint64(1)
+    for i in range(num_dims):
+        X[i] ^= t
+
+    # Interleave the bits of the transposed key, most significant bits first
+    keys = np.zeros_like(X[0])
+    for bit in range(bits - 1, -1, -1):
+        for i in range(num_dims):
+            keys = (keys << np.uint64(1)) | ((X[i] >> np.uint64(bit)) & np.uint64(1))
+
+    return keys
+
+
+def mesh_bandwidth(topology: np.ndarray) -> int:
+    """
+    Compute the bandwidth of the vertex adjacency matrix of a mesh, i.e. the largest difference between the indices
+    of two vertices of the same cell. The bandwidth of the matrices assembled on the mesh is proportional to it.
+
+    Args:
+        topology (np.ndarray): Vertex indices of each cell.
+
+    Returns:
+        int: Bandwidth of the mesh.
+    """
+    return int(np.max(topology.max(axis=1) - topology.min(axis=1)))
+
+
+def get_vertex_ordering(coordinates: np.ndarray, topology: np.ndarray, method: str = "rcm") -> np.ndarray:
+    """
+    Compute a new ordering of the vertices of a mesh, either by the reverse Cuthill-McKee algorithm, which minimizes
+    the bandwidth of the vertex adjacency matrix, or along a Hilbert space-filling curve, which keeps vertices that
+    are close in space close in memory.
+
+    Args:
+        coordinates (np.ndarray): Coordinates of the vertices.
+        topology (np.ndarray): Vertex indices of each cell.
+        method (str): "rcm" (reverse Cuthill-McKee) or "hilbert" (Hilbert curve).
+
+    Returns:
+        np.ndarray: Old index of the vertex at each new index.
+    """
+    num_vertices = coordinates.shape[0]
+    if method == "rcm":
+        # Vertices are adjacent if they share a cell
+        rows = np.repeat(topology, topology.shape[1], axis=1).ravel()
+        cols = np.tile(topology, (1, topology.shape[1])).ravel()
+        adjacency = coo_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols)),
+                               shape=(num_vertices, num_vertices)).tocsr()
+        return np.asarray(reverse_cuthill_mckee(adjacency, symmetric_mode=True))
+    elif method == "hilbert":
+        return np.argsort(hilbert_curve_keys(coordinates), kind="stable")
+
+    raise ValueError(f"Unknown mesh ordering '{method}', expected 'rcm' or 'hilbert'")
+
+
+def reorder_mesh(mesh_path: Union[str, Path], output_path: Union[str, Path, None] = None,
+                 method: str = "rcm") -> Path:
+    """
+    Renumber the vertices and cells of an HDF5 mesh for cache locality and lower fill-in of the factorization. The
+    vertices are ordered by `get_vertex_ordering`, and the cells, boundary facets and marked cells are sorted by their
+    (sorted) new vertex indices. The coordinates and topology of `/mesh`, `/boundaries` and `/domains` are rewritten
+    consistently, so the mesh, markers and results are the same up to round-off in the order of summation. The probe
+    point files hold coordinates, and are copied unchanged along with the mesh. Run in serial.
+
+    Args:
+        mesh_path (str or Path): Path to the mesh file, as written by `convert_xml_mesh_to_hdf5`.
+        output_path (str or Path, optional): Path to the reordered mesh file. Defaults to rewriting the mesh file.
+        method (str): "rcm" (reverse Cuthill-McKee) or "hilbert" (Hilbert curve).
+
+    Returns:
+        Path: Path to the reordered mesh file.
+    """
+    mesh_path = Path(mesh_path)
+    output_path = mesh_path if output_path is None else Path(output_path)
+    if output_path != mesh_path:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(mesh_path, output_path)
+        for suffix in ["_probe_point.json", "_solid_probe.json", "_info.json"]:
+            sidecar_path = mesh_path.with_name(mesh_path.stem + suffix)
+            if sidecar_path.exists():
+                output_path.with_name(output_path.stem + suffix).write_text(sidecar_path.read_text())
+
+    with h5py.File(output_path, "r+") as f:
+        coordinates = f["mesh/coordinates"][()]
+        topology = f["mesh/topology"][()]
+        old_bandwidth = mesh_bandwidth(topology)
+
+        order = get_vertex_ordering(coordinates, topology, method)
+        new_index = np.empty_like(order)
+        new_index[order] = np.arange(order.size)
+
+        for name in ["mesh", "boundaries", "domains"]:
+            if name not in f:
+                continue
+            group = f[name]
+            if "coordinates" in group:
+                group["coordinates"][...] = group["coordinates"][()][order]
+
+            # Sort the entities by their sorted vertex indices, such that cells sharing vertices are close
+            entities = new_index[group["topology"][()]]
+            sorted_entities = np.sort(entities, axis=1)
+            entity_order = np.lexsort(sorted_entities.T[::-1])
+            group["topology"][...] = entities[entity_order]
+            if "values" in group:
+                group["values"][...] = group["values"][()][entity_order]
+            if "cell_indices" in group:
+                group["cell_indices"][...] = np.arange(entities.shape[0], dtype=group["cell_indices"].dtype)
+            # The entities are no longer ordered by the processes that wrote them
+            group["topology"].attrs["partition"] = np.zeros(1, dtype=np.uint64)
+
+        new_bandwidth = mesh_bandwidth(f["mesh/topology"][()])
+
+    print(f"--- Reordered {mesh_path.name} with {method}, mesh bandwidth: {old_bandwidth} -> {new_bandwidth}")
+
+    return output_path
+
+
 def convert_vtu_mesh_to_xdmf(file_name_vtu_mesh: Union[str, Path], file_name_xdmf_mesh: Union[str, Path]) -> None:
     """
     Convert a VTU mesh to XDMF format using meshio. This function is intended to run in serial.
@@ -0,0 +1,44 @@
+"""
+Renumber the vertices and cells of a mesh for cache locality during assembly and lower fill-in of the direct
+solver. The vertices are ordered either by the reverse Cuthill-McKee algorithm (rcm), which minimizes the bandwidth,
+or along a Hilbert space-filling curve (hilbert), and the mesh, boundary and domain markers are rewritten
+consistently. Run in serial on a mesh generated with vasp-generate-mesh, e.g.
+
+    vasp-reorder-mesh --mesh-path mesh/file_aneurysm.h5 --method rcm
+"""
+import argparse
+from pathlib import Path
+
+from dolfin import MPI
+
+from vasp.automatedPreprocessing.preprocessing_common import reorder_mesh
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the mesh file")
+    parser.add_argument("--method", type=str, default="rcm", choices=["rcm", "hilbert"],
+                        help="Reverse Cuthill-McKee or Hilbert curve ordering of the vertices")
+    parser.add_argument("--output-path", type=Path, default=None,
+                        help="Path to the reordered mesh file (default: overwrite the mesh file)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial."
+
+    args = parse_arguments()
+    assert args.mesh_path.exists(), f"Mesh file {args.mesh_path} does not exist"
+
+    output_path = reorder_mesh(args.mesh_path, args.output_path, args.method)
+    print(f"--- Saved reordered mesh to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
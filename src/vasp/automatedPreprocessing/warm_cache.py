@@ -0,0 +1,154 @@
+"""
+Populate the just-in-time (JIT) compilation cache of FEniCS with the forms of a problem file, such that a simulation
+starts solving immediately instead of compiling the forms in the first time step. The problem is run by turtleFSI for
+a single time step on the mesh of the simulation, for the chosen element degrees, which compiles the same forms and
+expressions as the simulation, including those of the problem file and of the output. Run before submitting the
+simulation, with the same cache directory (DIJITSO_CACHE_DIR) as the simulation, e.g.
+
+    vasp-warm-cache --problem aneurysm --mesh-path mesh/file_aneurysm.h5 --v-deg 1 2 --mpirun "mpirun -np 8"
+
+Forms with material constants or other parameters compiled as numbers are only reused by simulations with the same
+parameters.
+"""
+import argparse
+import importlib
+import importlib.util
+import itertools
+import shlex
+import shutil
+import subprocess
+from pathlib import Path
+from time import perf_counter
+from types import ModuleType
+from typing import Dict, Optional, List
+
+from dolfin import MPI
+from turtleFSI.problems import default_variables as turtle_default_variables
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", type=str, required=True,
+                        help="Name of a problem file in vasp.simulations (e.g. aneurysm, avf, offset_stenosis), " +
+                             "or path to a problem file")
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the mesh of the simulation")
+    parser.add_argument("--d-deg", type=int, nargs="+", default=None,
+                        help="Degree(s) of the displacement (default: from the problem file)")
+    parser.add_argument("--v-deg", type=int, nargs="+", default=None,
+                        help="Degree(s) of the velocity (default: from the problem file)")
+    parser.add_argument("--p-deg", type=int, nargs="+", default=None,
+                        help="Degree(s) of the pressure (default: from the problem file)")
+    parser.add_argument("--mpirun", type=str, default="mpirun -np 1", help="Command to run turtleFSI with")
+    parser.add_argument("--folder", type=Path, default=Path("warm_cache"), help="Folder for the logs of the runs")
+    return parser.parse_args()
+
+
+def import_problem(problem: str) -> ModuleType:
+    """
+    Import a problem file, either from a path or by name from vasp.simulations.
+
+    Args:
+        problem (str): Path to a problem file, or name of a problem file in vasp.simulations.
+
+    Returns:
+        ModuleType: The imported problem module.
+    """
+    problem_path = Path(problem).with_suffix(".py")
+    if problem_path.exists():
+        spec = importlib.util.spec_from_file_location(problem_path.stem, problem_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return importlib.import_module(f"vasp.simulations.{problem}")
+
+
+def get_problem_parameters(module: ModuleType) -> Dict:
+    """
+    Get the parameters of a problem file, i.e. the default parameters of turtleFSI updated by the problem file.
+
+    Args:
+        module (ModuleType): The imported problem module.
+
+    Returns:
+        dict: Problem parameters.
+    """
+    return module.set_problem_parameters(dict(turtle_default_variables))
+
+
+def warm_up_forms(problem: str, mesh_path: Path, problem_parameters: Dict, mpirun: str, folder: Path) -> None:
+    """
+    Run a problem with turtleFSI for a single time step, which sets up, compiles and assembles the forms of turtleFSI
+    and the problem file, and writes the results and a checkpoint, as in the first time step of the simulation.
+
+    Args:
+        problem (str): Path to a problem file, or name of a problem file in vasp.simulations.
+        mesh_path (Path): Path to the mesh of the simulation.
+        problem_parameters (dict): Problem parameters, including the element degrees.
+        mpirun (str): Command to run turtleFSI with.
+        folder (Path): Folder for the results and the log of the run.
+    """
+    # turtleFSI looks for the problem file in the working directory
+    problem_path = Path(problem).with_suffix(".py")
+    if problem_path.exists():
+        cwd, problem = problem_path.resolve().parent, problem_path.stem
+    else:
+        cwd = Path(__file__).parents[1] / "simulations"
+
+    # The end time is half a time step after the start, so exactly one time step is run
+    dt = problem_parameters["dt"]
+    cmd = (mpirun + f" turtleFSI -p {problem} -dt {dt} -T {0.5 * dt} --folder {folder.resolve()} --sub-folder 1" +
+           f" --new-arguments mesh_path={mesh_path.resolve()} d_deg={problem_parameters['d_deg']}" +
+           f" v_deg={problem_parameters['v_deg']} p_deg={problem_parameters['p_deg']} save_step=1 checkpoint_step=1")
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / "log.txt", "w") as log:
+        subprocess.run(shlex.split(cmd), cwd=cwd, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    # Only the compiled forms in the cache are kept
+    shutil.rmtree(folder / "1")
+
+
+def warm_cache(problem: str, mesh_path: Path, d_degrees: Optional[List[int]] = None,
+               v_degrees: Optional[List[int]] = None, p_degrees: Optional[List[int]] = None,
+               mpirun: str = "mpirun -np 1", folder: Path = Path("warm_cache")) -> None:
+    """
+    Populate the JIT cache with the forms of a problem file for all combinations of the given degrees.
+
+    Args:
+        problem (str): Path to a problem file, or name of a problem file in vasp.simulations.
+        mesh_path (Path): Path to the mesh of the simulation.
+        d_degrees (list, optional): Degrees of the displacement. Defaults to the degree of the problem file.
+        v_degrees (list, optional): Degrees of the velocity. Defaults to the degree of the problem file.
+        p_degrees (list, optional): Degrees of the pressure. Defaults to the degree of the problem file.
+        mpirun (str): Command to run turtleFSI with.
+        folder (Path): Folder for the logs of the runs.
+    """
+    module = import_problem(problem)
+    problem_parameters = get_problem_parameters(module)
+
+    d_degrees = d_degrees or [problem_parameters["d_deg"]]
+    v_degrees = v_degrees or [problem_parameters["v_deg"]]
+    p_degrees = p_degrees or [problem_parameters["p_deg"]]
+    for d_deg, v_deg, p_deg in itertools.product(d_degrees, v_degrees, p_degrees):
+        print(f"--- Compiling forms of {problem} with d_deg={d_deg}, v_deg={v_deg}, p_deg={p_deg}")
+        start = perf_counter()
+        warm_up_forms(problem, mesh_path, dict(problem_parameters, d_deg=d_deg, v_deg=v_deg, p_deg=p_deg), mpirun,
+                      folder / f"d{d_deg}_v{v_deg}_p{p_deg}")
+        print(f"--- Done in {perf_counter() - start:.1f} s")
+
+
+def main() -> None:
+    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial, and launches turtleFSI itself."
+
+    args = parse_arguments()
+    warm_cache(args.problem, args.mesh_path, args.d_deg, args.v_deg, args.p_deg, args.mpirun, args.folder)
+
+
+if __name__ == "__main__":
+    main()
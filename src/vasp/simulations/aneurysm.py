@@ -6,12 +6,25 @@ import numpy as np
 
 from vampy.simulation.Womersley import make_womersley_bcs, compute_boundary_geometry_acrn
 from vampy.simulation.simulation_common import print_mesh_information
-from turtleFSI.problems import *
-from dolfin import HDF5File, Mesh, MeshFunction, facets, assemble, sqrt, FacetNormal, ds, \
-    DirichletBC, Measure, inner, parameters, VectorFunctionSpace, Function, XDMFFile
-
-from vasp.simulations.simulation_common import load_probe_points, calculate_and_print_flow_properties, \
-    print_probe_points, InterfacePressure, compute_minimum_jacobian
+from turtleFSI.problems import *  # noqa: F401
+from dolfin import assemble, FacetNormal, ds, DirichletBC, Measure, inner, parameters
+
+from vasp.simulations.boundary_conditions import InterfacePressure, PeriodicInletCache
+from vasp.simulations.flow_diagnostics import FlowDiagnostics, print_flow_properties
+from vasp.simulations.jacobian_monitor import JacobianMonitor
+from vasp.simulations.jacobian_policy import AdaptiveJacobianPolicy, record_newton_iterations, newton_iterations
+from vasp.simulations.periodic_convergence import PeriodicConvergenceMonitor
+from vasp.simulations.probe_sampler import ProbeSampler
+from vasp.simulations.region_output import RegionWriter
+from vasp.simulations.regions import remark_entities, region_from_parameters
+from vasp.simulations.separate_domain import SeparateDomainWriter, create_separate_domain_meshes
+from vasp.simulations.simulation_common import load_mesh_and_data, load_probe_points, print_probe_points
+from vasp.simulations.solver_strategies import create_linear_solver
+from vasp.simulations.spectral_analysis import SpectralAnalyzer
+from vasp.simulations.streaming_statistics import StreamingStatistics
+from vasp.simulations.telemetry import TelemetryWriter
+from vasp.simulations.timers import StepTimer, DiagnosticsScheduler
+from vasp.simulations.wall_shear_stress import WallShearStress, create_fluid_mesh
 
 # set compiler arguments
 parameters["form_compiler"]["quadrature_degree"] = 6
@@ -21,6 +34,8 @@ parameters["form_compiler"]["optimize"] = True
 # be "shared_vertex", for 2D mesh "shared_facet", the default value is "none"
 parameters["ghost_mode"] = "shared_vertex"
 _compiler_parameters = dict(parameters["form_compiler"])
+# Time spent in the hooks, the Newton solver and the diagnostics, printed when the simulation is finished
+hook_timers = StepTimer()
 
 
 def set_problem_parameters(default_variables, **namespace):
@@ -39,6 +54,7 @@ def set_problem_parameters(default_variables, **namespace):
         theta=0.501,  # Theta scheme parameter
         save_step=1,  # Save frequency of files for visualisation
         save_solution_after_tstep=951,  # Start saving the solution after this time step for the mean value
+        num_phase_bins=0,  # Number of cardiac phase bins for the phase-averaged solution, 0 to disable
         checkpoint_step=50,  # Save frequency of checkpoint files
         # Linear solver parameters
         linear_solver="mumps",
@@ -46,6 +62,10 @@ def set_problem_parameters(default_variables, **namespace):
         rtol=1e-9,  # Relative tolerance in the Newton solver
         recompute=20,  # Recompute the Jacobian matix within time steps
         recompute_tstep=20,  # Recompute the Jacobian matix over time steps
+        adaptive_jacobian=False,  # Recompute the Jacobian based on the Newton convergence instead of recompute_tstep
+        solver_strategy=None,  # Krylov solver strategy replacing linear_solver, see solver_strategies.py
+        solver_options={},  # PETSc options overriding those of the solver strategy
+        preconditioner_reuse=1,  # Number of Jacobians that each preconditioner of the solver strategy is used for
         # boundary condition parameters
         inlet_id=2,  # inlet id for the fluid
         inlet_outlet_s_id=11,  # inlet and outlet id for solid
@@ -56,6 +76,8 @@ def set_problem_parameters(default_variables, **namespace):
         Q_mean=1.25E-06,
         P_mean=11200,
         T_Cycle=0.951,  # Used to define length of flow waveform
+        vel_t_ramp=0.25,  # Time for the cosine ramp of the inlet velocity
+        p_t_ramp_end=0.2,  # End time of the cosine ramp of the interface pressure
         rho_f=1.000E3,  # Fluid density [kg/m3]
         mu_f=3.5E-3,  # Fluid dynamic viscosity [Pa.s]
         dx_f_id=1,  # ID of marker in the fluid domain
@@ -74,52 +96,52 @@ def set_problem_parameters(default_variables, **namespace):
         # Simulation parameters
         folder="aneurysm_results",  # Folder name generated for the simulation
         mesh_path="mesh/file_aneurysm.h5",
+        partition_folder=None,  # Folder of vasp-partition-mesh output, default <mesh folder>/Partitions
         FC_file="FC_MCA_10",  # File name containing the fourier coefficients for the flow waveform
         P_FC_File="FC_Pressure",  # File name containing the fourier coefficients for the pressure waveform
         compiler_parameters=_compiler_parameters,  # Update the defaul values of the compiler arguments (FEniCS)
         save_deg=2,  # Degree of the functions saved for visualisation
         scale_probe=True,  # Scale the probe points to meters
+        min_jacobian_threshold=None,  # Checkpoint and stop if the minimum Jacobian drops to this, None to only monitor
+        periodic_tolerance=0.0,  # Stop when the signals differ less than this from the previous cycle, 0 to disable
+        periodic_cycles=2,  # Number of consecutive periodic cycles before stopping
+        periodic_signals=["flow_rate", "min_jacobian", "probe_pressure"],  # Telemetry records compared per cycle
+        telemetry_flush_step=10,  # Number of time steps between each write to the telemetry file
+        diagnostics_schedule={},  # Cadence of probes, flow_properties and jacobian, e.g. dict(probes=dict(every=10))
+        spectral_window=0,  # Number of time steps per in-situ spectrogram window of the probe signals (0: off)
+        spectral_overlap=0.75,  # Fraction of overlap between consecutive spectrogram windows
+        spectral_bands=None,  # Frequency bands [[f_low, f_high], ...] in Hz, default octave bands
+        roi_region=None,  # Region of interest as fsi_region (sphere, box or cylinder), or "fsi_region"
+        roi_domain_id=None,  # Only include these domain ids in the region of interest, e.g. the fluid domain
+        roi_save_step=1,  # Save frequency of d, v and p at the vertices in the region of interest
+        field_save_step=0,  # Save frequency of d, v and p at all vertices in the same layout, 0 to disable
+        save_separate_domain=False,  # Write u.h5 and d_solid.h5 to Visualization_separate_domain every save_step
+        compute_wss=False,  # Compute WSS and hemodynamic indices after save_solution_after_tstep during the simulation
+        wss_save_step=10,  # Save frequency of the WSS, 0 to only save the time-averaged hemodynamic indices
+        wss_mesh_path=None,  # Fluid mesh from vasp-separate-mesh, default <mesh_path stem>_fluid.h5
     ))
 
     return default_variables
 
 
-def get_mesh_domain_and_boundaries(mesh_path, fsi_region, fsi_id, rigid_id, outer_id, **namespace):
+def get_mesh_domain_and_boundaries(mesh_path, partition_folder, fsi_region, fsi_id, rigid_id, outer_id, **namespace):
 
     # Read mesh
-    mesh = Mesh()
-    hdf = HDF5File(mesh.mpi_comm(), mesh_path, "r")
-    hdf.read(mesh, "/mesh", False)
-    boundaries = MeshFunction("size_t", mesh, 2)
-    hdf.read(boundaries, "/boundaries")
-    domains = MeshFunction("size_t", mesh, 3)
-    hdf.read(domains, "/domains")
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder)
 
     print_mesh_information(mesh)
 
-    # Only consider FSI in domain within this sphere
-    sph_x = fsi_region[0]
-    sph_y = fsi_region[1]
-    sph_z = fsi_region[2]
-    sph_rad = fsi_region[3]
-
-    i = 0
-    for submesh_facet in facets(mesh):
-        idx_facet = boundaries.array()[i]
-        if idx_facet == fsi_id or idx_facet == outer_id:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id  # changed "fsi" idx to "rigid wall" idx
-        i += 1
+    # Only consider FSI in domain within this sphere, i.e. change "fsi" and "outer" idx to "rigid wall" idx outside
+    remark_entities(boundaries, region_from_parameters(fsi_region), {fsi_id: rigid_id, outer_id: rigid_id})
 
     return mesh, domains, boundaries
 
 
-def create_bcs(t, DVP, mesh, boundaries, mu_f,
+@hook_timers.timed
+def create_bcs(t, dt, DVP, mesh, boundaries, mu_f, rho_f,
                fsi_id, inlet_id, inlet_outlet_s_id,
-               rigid_id, psi, F_solid_linear, p_deg, FC_file,
-               Q_mean, P_FC_File, P_mean, T_Cycle, **namespace):
+               rigid_id, psi, F_solid_linear, FC_file,
+               Q_mean, P_FC_File, P_mean, T_Cycle, p_t_ramp_end, folder, **namespace):
 
     # Load fourier coefficients for the velocity and scale by flow rate
     An, Bn = np.loadtxt(Path(__file__).parent / FC_file).T
@@ -130,12 +152,16 @@ def create_bcs(t, DVP, mesh, boundaries, mu_f,
     # Create Womersley boundary condition at inlet
     tmp_element = DVP.sub(1).sub(0).ufl_element()
     inlet = make_womersley_bcs(T_Cycle, None, mu_f, tmp_center, tmp_radius, tmp_normal, tmp_element, Cn=Cn)
-    # Initialize inlet expressions with initial time
-    for uc in inlet:
-        uc.set_t(t)
+
+    # Tabulate the Womersley profiles at the inlet dofs over one cycle, and cache them on disk for later runs
+    signature = "{}:{!r}:{!r}".format((Path(__file__).parent / FC_file).read_text(), Q_mean, mu_f)
+    inlet_cache = PeriodicInletCache(inlet, DVP.sub(1).sub(0).collapse(), boundaries, inlet_id, T_Cycle, dt,
+                                     cache_folder=Path(folder) / "InletCache", signature=signature)
+    # Initialize inlet boundary values with initial time
+    inlet_cache.update(t)
 
     # Create Boundary conditions for the velocity
-    u_inlet = [DirichletBC(DVP.sub(1).sub(i), inlet[i], boundaries, inlet_id) for i in range(3)]
+    u_inlet = [DirichletBC(DVP.sub(1).sub(i), inlet_cache.functions[i], boundaries, inlet_id) for i in range(3)]
     u_inlet_s = DirichletBC(DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, inlet_outlet_s_id)
 
     # Solid Displacement BCs
@@ -152,84 +178,222 @@ def create_bcs(t, DVP, mesh, boundaries, mu_f,
     # Apply pulsatile pressure at the fsi interface by modifying the variational form
     n = FacetNormal(mesh)
     dSS = Measure("dS", domain=mesh, subdomain_data=boundaries)
-    interface_pressure = InterfacePressure(t=0.0, t_ramp_start=0.0, t_ramp_end=0.2, An=An_P,
-                                           Bn=Bn_P, period=T_Cycle, P_mean=P_mean, degree=p_deg)
+    interface_pressure = InterfacePressure(t=0.0, t_ramp_start=0.0, t_ramp_end=p_t_ramp_end, An=An_P,
+                                           Bn=Bn_P, period=T_Cycle, P_mean=P_mean, dt=dt)
     F_solid_linear += interface_pressure * inner(n('+'), psi('+')) * dSS(fsi_id)
 
     # Create inlet subdomain for computing the flow rate inside post_solve
     dsi = ds(inlet_id, domain=mesh, subdomain_data=boundaries)
     inlet_area = assemble(1.0 * dsi)
-    return dict(bcs=bcs, inlet=inlet, interface_pressure=interface_pressure, F_solid_linear=F_solid_linear, n=n,
-                dsi=dsi, inlet_area=inlet_area)
+    flow_diagnostics = FlowDiagnostics(mesh, dt, inlet_area, mu_f, rho_f, n, dsi)
+    return dict(bcs=bcs, inlet_cache=inlet_cache, interface_pressure=interface_pressure, F_solid_linear=F_solid_linear,
+                n=n, dsi=dsi, inlet_area=inlet_area, flow_diagnostics=flow_diagnostics)
 
 
-def initiate(mesh_path, scale_probe, mesh, v_deg, p_deg, **namespace):
+def initiate(mesh_path, scale_probe, mesh, DVP, T_Cycle, num_phase_bins, visualization_folder, restart_folder,
+             min_jacobian_threshold, telemetry_flush_step, default_variables, adaptive_jacobian, verbose, dt,
+             spectral_window, spectral_overlap, spectral_bands, compute_wss, wss_save_step, wss_mesh_path, mu_f,
+             dx_f_id, dx_s_id, domains, fsi_region, roi_region, roi_domain_id, field_save_step, diagnostics_schedule,
+             solver_strategy, solver_options, preconditioner_reuse, periodic_tolerance, periodic_cycles,
+             periodic_signals, save_separate_domain, save_deg, **namespace):
 
     probe_points = load_probe_points(mesh_path)
     # In case the probe points are in mm, scale them to meters
     if scale_probe:
         probe_points = probe_points * 0.001
 
-    Vv = VectorFunctionSpace(mesh, "CG", v_deg)
-    V = FunctionSpace(mesh, "CG", p_deg)
-    d_mean = Function(Vv)
-    u_mean = Function(Vv)
-    p_mean = Function(V)
+    # Locate the probe points once and append the sampled values to a binary time series
+    probe_sampler = ProbeSampler(mesh, probe_points, Path(visualization_folder).parent / "Probes" / "probes.bin")
+
+    # Mean, fluctuations and phase averages of the solution, continued from the checkpoint when restarting
+    spaces = dict(d=DVP.sub(0).collapse(), u=DVP.sub(1).collapse(), p=DVP.sub(2).collapse())
+    statistics = StreamingStatistics(spaces, period=T_Cycle, num_phases=num_phase_bins)
+    if restart_folder is not None:
+        statistics.load(Path(restart_folder) / "Checkpoint")
+
+    jacobian_monitor = JacobianMonitor(mesh, threshold=min_jacobian_threshold)
+
+    # Run the probes, flow properties and Jacobian monitor at their own cadence
+    diagnostics = DiagnosticsScheduler(diagnostics_schedule, hook_timers)
+
+    # Optionally recompute the Jacobian based on the Newton convergence of the previous time step
+    jacobian_policy = AdaptiveJacobianPolicy(verbose=verbose) if adaptive_jacobian else None
+
+    # Optionally write a checkpoint and stop the simulation once the flow is periodic
+    periodic_monitor = None
+    if periodic_tolerance > 0:
+        periodic_monitor = PeriodicConvergenceMonitor(T_Cycle, dt, periodic_tolerance, periodic_cycles,
+                                                      periodic_signals, verbose=verbose)
+
+    # Optionally solve the linear systems of the Newton solver with a preconditioned Krylov solver
+    krylov_solver = create_linear_solver(solver_strategy, DVP, solver_options, preconditioner_reuse)
+
+    # Per time step flow properties, minimum Jacobian and probe values, written to the results folder
+    telemetry = TelemetryWriter(Path(visualization_folder).parent / "telemetry.h5", telemetry_flush_step,
+                                parameters=default_variables)
+
+    # Optionally accumulate spectrograms of the probe signals, without saving the solution at every time step.
+    # The probe signals are sampled at the cadence of the probes
+    spectral_analyzer = None
+    if spectral_window > 0:
+        spectral_analyzer = SpectralAnalyzer(dt * diagnostics.every("probes"), spectral_window,
+                                             Path(visualization_folder).parent / "Spectra" / "spectra.h5",
+                                             overlap=spectral_overlap, bands=spectral_bands)
+
+    # Optionally write d, v and p in a region of interest, and in the whole domain, in a time-major layout
+    region_folder = Path(visualization_folder).parent / "Region"
+    roi_writer = None
+    if roi_region is not None or roi_domain_id is not None:
+        if roi_region == "fsi_region":
+            roi_region = fsi_region
+        region = region_from_parameters(roi_region) if roi_region is not None else None
+        roi_writer = RegionWriter(mesh, region_folder / "region.h5", region=region, domains=domains,
+                                  domain_ids=roi_domain_id)
+    field_writer = RegionWriter(mesh, region_folder / "whole_domain.h5") if field_save_step > 0 else None
+
+    # Optionally compute the WSS and the time-averaged hemodynamic indices without saving the velocity
+    wall_shear_stress = None
+    if compute_wss:
+        if wss_mesh_path is None:
+            wss_mesh_path = create_fluid_mesh(mesh_path, dx_f_id, dx_s_id)
+        wall_shear_stress = WallShearStress(DVP.sub(1).collapse(), wss_mesh_path, mu_f, dt,
+                                            Path(visualization_folder).parent / "Hemodynamic_indices", wss_save_step)
+        if restart_folder is not None:
+            wall_shear_stress.load(Path(restart_folder) / "Checkpoint")
+
+    # Optionally write the fluid velocity and solid displacement for the post-processing, instead of create_hdf5
+    separate_domain_writer = None
+    if save_separate_domain:
+        fluid_mesh_path, solid_mesh_path = create_separate_domain_meshes(mesh_path, dx_f_id, dx_s_id, save_deg)
+        separate_domain_writer = SeparateDomainWriter(
+            DVP.sub(1).collapse(), DVP.sub(0).collapse(), fluid_mesh_path, solid_mesh_path,
+            Path(visualization_folder).parent / "Visualization_separate_domain")
+
+    return dict(probe_points=probe_points, probe_sampler=probe_sampler, statistics=statistics,
+                jacobian_monitor=jacobian_monitor, telemetry=telemetry, jacobian_policy=jacobian_policy,
+                spectral_analyzer=spectral_analyzer, wall_shear_stress=wall_shear_stress,
+                roi_writer=roi_writer, field_writer=field_writer, diagnostics=diagnostics, krylov_solver=krylov_solver,
+                periodic_monitor=periodic_monitor, separate_domain_writer=separate_domain_writer)
+
+
+@hook_timers.timed
+def pre_solve(t, inlet_cache, interface_pressure, jacobian_policy, krylov_solver, up_sol, verbose, vel_t_ramp,
+              **namespace):
+    # Multiply by cosine function to ramp up smoothly over time interval 0-vel_t_ramp
+    if t < vel_t_ramp:
+        scale_value = -0.5 * np.cos(np.pi * t / vel_t_ramp) + 0.5
+    else:
+        scale_value = 1.0
 
-    return dict(probe_points=probe_points, d_mean=d_mean, u_mean=u_mean, p_mean=p_mean)
+    # Update the inlet boundary condition from the tabulated cycle
+    inlet_cache.update(t, scale_value)
 
+    # Update pressure condition
+    interface_pressure.update(t, verbose=verbose)
 
-def pre_solve(t, inlet, interface_pressure, **namespace):
-    for uc in inlet:
-        # Update the time variable used for the inlet boundary condition
-        uc.set_t(t)
+    # Use the Krylov solver instead of the direct solver of turtleFSI
+    if krylov_solver is not None:
+        up_sol = krylov_solver.install(up_sol)
 
-        # Multiply by cosine function to ramp up smoothly over time interval 0-250 ms
-        if t < 0.25:
-            uc.scale_value = -0.5 * np.cos(np.pi * t / 0.25) + 0.5
-        else:
-            uc.scale_value = 1.0
+    # Decide whether to recompute the Jacobian from the Newton convergence of the previous time step
+    jacobian_updates = jacobian_policy(up_sol) if jacobian_policy is not None else {}
+    up_sol = jacobian_updates.pop("up_sol", up_sol)
 
-    # Update pressure condition
-    interface_pressure.update(t)
+    # Time the linear solves and record the Newton iterations of the coming time step for the telemetry
+    up_sol = record_newton_iterations(hook_timers.time_linear_solver(up_sol))
 
-    return dict(inlet=inlet, interface_pressure=interface_pressure)
+    return dict(inlet_cache=inlet_cache, interface_pressure=interface_pressure, up_sol=up_sol, **jacobian_updates)
 
 
-def post_solve(dvp_, n, dsi, dt, mesh, inlet_area, mu_f, rho_f, probe_points, t,
-               save_solution_after_tstep, d_mean, u_mean, p_mean, **namespace):
+@hook_timers.timed
+def post_solve(dvp_, dt, mesh, flow_diagnostics, probe_sampler, jacobian_monitor, interface_pressure, telemetry, t,
+               counter, checkpoint_step, save_solution_after_tstep, statistics, visualization_folder, verbose,
+               spectral_analyzer, wall_shear_stress, roi_writer, field_writer, roi_save_step, field_save_step,
+               diagnostics, periodic_monitor, separate_domain_writer, save_step, up_sol, **namespace):
     d = dvp_["n"].sub(0, deepcopy=True)
     v = dvp_["n"].sub(1, deepcopy=True)
     p = dvp_["n"].sub(2, deepcopy=True)
 
-    print_probe_points(v, p, probe_points)
-    calculate_and_print_flow_properties(dt, mesh, v, inlet_area, mu_f, rho_f, n, dsi)
-    compute_minimum_jacobian(mesh, d)
+    records = dict(time_step=counter, ramp_factor=interface_pressure.ramp_factor, pressure=interface_pressure.P)
+
+    probe_values = diagnostics.run("probes", counter, t, probe_sampler.sample, velocity=v, pressure=p)
+    if probe_values is not None:
+        probe_sampler.write(t, probe_values)
+        records.update(probe_velocity=probe_values["velocity"], probe_pressure=probe_values["pressure"])
+        if verbose:
+            print_probe_points(probe_values["velocity"], probe_values["pressure"])
+
+    flow_properties = diagnostics.run("flow_properties", counter, t, flow_diagnostics, v)
+    if flow_properties is not None:
+        records.update(flow_properties)
+        if verbose:
+            print_flow_properties(flow_properties)
+
+    min_jacobian = diagnostics.run("jacobian", counter, t, jacobian_monitor, d, verbose=verbose)
+    if min_jacobian is not None:
+        records.update(min_jacobian=min_jacobian)
+
+    if periodic_monitor is not None:
+        periodic_differences = periodic_monitor.update(t, **records)
+        if periodic_differences:
+            records.update(periodic_difference=max(periodic_differences.values()))
+    periodic = periodic_monitor is not None and periodic_monitor.converged
+
+    if spectral_analyzer is not None and probe_values is not None:
+        spectral_analyzer.update(t, velocity=np.linalg.norm(probe_values["velocity"], axis=1),
+                                 pressure=probe_values["pressure"])
+
+    if roi_writer is not None and counter % roi_save_step == 0:
+        roi_writer.write(t, d=d, v=v, p=p)
+    if field_writer is not None and counter % field_save_step == 0:
+        field_writer.write(t, d=d, v=v, p=p)
+    if separate_domain_writer is not None and counter % save_step == 0:
+        separate_domain_writer.write(t, v=v, d=d)
 
     if t >= save_solution_after_tstep * dt:
-        # Here, we accumulate the velocity filed in u_mean
-        d_mean.vector().axpy(1, d.vector())
-        u_mean.vector().axpy(1, v.vector())
-        p_mean.vector().axpy(1, p.vector())
-        return dict(u_mean=u_mean, d_mean=d_mean, p_mean=p_mean)
+        # Here, we update the statistics of the displacement, velocity and pressure
+        statistics.update(t, d=d, u=v, p=p)
+        if wall_shear_stress is not None:
+            wall_shear_stress.update(t, v)
+
+    # Wall-clock time of the time step on rank 0 and the Newton iterations, as printed by turtleFSI in the log
+    records.update(cpu_time=hook_timers.step_time())
+    telemetry.record(t, **records)
+    telemetry.record_sequence(t, **newton_iterations(up_sol))
+
+    # Checkpoint the statistics together with the solution
+    if counter % checkpoint_step == 0 or jacobian_monitor.collapsed or periodic:
+        statistics.save(Path(visualization_folder).parent / "Checkpoint")
+        if wall_shear_stress is not None:
+            wall_shear_stress.save(Path(visualization_folder).parent / "Checkpoint")
+        for writer in [roi_writer, field_writer]:
+            if writer is not None:
+                writer.flush()
+                writer.write_xdmf()
+        if separate_domain_writer is not None:
+            separate_domain_writer.flush()
+        telemetry.flush()
+
+    if jacobian_monitor.collapsed or periodic:
+        monitor = jacobian_monitor if jacobian_monitor.collapsed else periodic_monitor
+        return monitor.stop(dvp_=dvp_, dt=dt, mesh=mesh, t=t, counter=counter, checkpoint_step=checkpoint_step,
+                            visualization_folder=visualization_folder, verbose=verbose, **namespace)
     else:
         return None
 
 
-def finished(d_mean, u_mean, p_mean, visualization_folder, save_solution_after_tstep, T, dt, **namespace):
-    # Divide the accumulated vectors by the number of time steps
-    num_steps = T / dt - save_solution_after_tstep + 1
-    for data in [d_mean, u_mean, p_mean]:
-        data.vector()[:] = data.vector()[:] / num_steps
+@hook_timers.timed(report=True)
+def finished(statistics, telemetry, visualization_folder, wall_shear_stress, roi_writer, field_writer,
+             separate_domain_writer, **namespace):
+    telemetry.flush()
+
+    for writer in [roi_writer, field_writer, separate_domain_writer]:
+        if writer is not None:
+            writer.close()
 
-    # Save u_mean as a XDMF file using the checkpoint
-    data_names = [
-        (d_mean, "d_mean.xdmf"),
-        (u_mean, "u_mean.xdmf"),
-        (p_mean, "p_mean.xdmf")
-    ]
+    # Save TAWSS, TWSSG, OSI, RRT and ECAP in the Hemodynamic_indices folder
+    if wall_shear_stress is not None:
+        wall_shear_stress.write()
 
-    for vector, data_name in data_names:
-        file_path = Path(visualization_folder) / data_name
-        with XDMFFile(MPI.comm_world, str(file_path)) as f:
-            f.write_checkpoint(vector, data_name, 0, XDMFFile.Encoding.HDF5)
+    # Save the mean, standard deviation, root mean square and phase averages of d, u and p as XDMF files
+    statistics.write(visualization_folder)
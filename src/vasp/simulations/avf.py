@@ -1,14 +1,23 @@
 """
 Problem file for AVF FSI simulation
 """
+from pathlib import Path
 import numpy as np
 
 from turtleFSI.problems import *
-from dolfin import HDF5File, Mesh, MeshFunction, facets, UserExpression, FacetNormal, ds, \
-    DirichletBC, Measure, inner, parameters, assemble, Constant, SpatialCoordinate
-
-from vasp.simulations.simulation_common import load_probe_points, calculate_and_print_flow_properties, \
-    print_probe_points, compute_minimum_jacobian
+from dolfin import Constant, FacetNormal, ds, DirichletBC, Measure, inner, parameters, assemble
+
+from vasp.simulations.boundary_conditions import ParabolicInletProfile
+from vasp.simulations.flow_diagnostics import FlowDiagnostics, print_flow_properties
+from vasp.simulations.jacobian_monitor import JacobianMonitor
+from vasp.simulations.jacobian_policy import AdaptiveJacobianPolicy, record_newton_iterations, newton_iterations
+from vasp.simulations.periodic_convergence import PeriodicConvergenceMonitor
+from vasp.simulations.probe_sampler import ProbeSampler
+from vasp.simulations.regions import remark_entities, region_from_parameters
+from vasp.simulations.simulation_common import load_mesh_and_data, load_probe_points, print_probe_points
+from vasp.simulations.solver_strategies import create_linear_solver
+from vasp.simulations.telemetry import TelemetryWriter
+from vasp.simulations.timers import StepTimer, DiagnosticsScheduler
 
 # set compiler arguments
 parameters["form_compiler"]["quadrature_degree"] = 6
@@ -18,6 +27,8 @@ parameters["form_compiler"]["optimize"] = True
 # be "shared_vertex", for 2D mesh "shared_facet", the default value is "none"
 parameters["ghost_mode"] = "shared_vertex"
 _compiler_parameters = dict(parameters["form_compiler"])
+# Time spent in the hooks, the Newton solver and the diagnostics, printed when the simulation is finished
+hook_timers = StepTimer()
 
 
 def set_problem_parameters(default_variables, **namespace):
@@ -45,6 +56,10 @@ def set_problem_parameters(default_variables, **namespace):
         rtol=1e-7,  # Relative tolerance in the Newton solver
         recompute=30,  # Recompute the Jacobian matix within time steps
         recompute_tstep=10,  # Number of time steps before recompute Jacobian
+        adaptive_jacobian=False,  # Recompute the Jacobian based on the Newton convergence instead of recompute_tstep
+        solver_strategy=None,  # Krylov solver strategy replacing linear_solver, see solver_strategies.py
+        solver_options={},  # PETSc options overriding those of the solver strategy
+        preconditioner_reuse=1,  # Number of Jacobians that each preconditioner of the solver strategy is used for
         # boundary condition parameters
         inlet_id1=3,  # inlet 1 id (PA)
         inlet_id2=2,  # inlet 2 id (DA)
@@ -83,138 +98,93 @@ def set_problem_parameters(default_variables, **namespace):
         fsi_region=[0.33642, 0.0873934, 0.0369964, 0.002],  # [x, y, z, radius]
         # Simulation parameters
         mesh_path="mesh/avf.h5",
+        partition_folder=None,  # Folder of vasp-partition-mesh output, default <mesh folder>/Partitions
         patient_data_path="avf.csv",
+        waveform_duration=3,  # Duration of the velocity and pressure waveforms in patient_data_path (3 cardiac cycles)
+        T_Cycle=1.0,  # Length of the cardiac cycle, used by the periodic convergence monitor
         folder="avf_results",  # Folder where the results will be stored
         compiler_parameters=_compiler_parameters,  # Update the defaul values of the compiler arguments (FEniCS)
         save_deg=2,  # Degree of the functions saved for visualisation
         scale_probe=True,  # Scale the probe points to meters
+        min_jacobian_threshold=None,  # Checkpoint and stop if the minimum Jacobian drops to this, None to only monitor
+        periodic_tolerance=0.0,  # Stop when the signals differ less than this from the previous cycle, 0 to disable
+        periodic_cycles=2,  # Number of consecutive periodic cycles before stopping
+        periodic_signals=["flow_rate", "min_jacobian", "probe_pressure"],  # Telemetry records compared per cycle
+        telemetry_flush_step=10,  # Number of time steps between each write to the telemetry file
+        diagnostics_schedule={},  # Cadence of probes, flow_properties and jacobian, e.g. dict(probes=dict(every=10))
     ))
 
     return default_variables
 
 
-def get_mesh_domain_and_boundaries(mesh_path, fsi_region, fsi_id, rigid_id, outer_id, **namespace):
+def get_mesh_domain_and_boundaries(mesh_path, partition_folder, fsi_region, fsi_id, rigid_id, outer_id, **namespace):
     # Import mesh file
-    mesh = Mesh()
-    hdf = HDF5File(mesh.mpi_comm(), mesh_path, "r")
-    hdf.read(mesh, "/mesh", False)
-    boundaries = MeshFunction("size_t", mesh, 2)
-    hdf.read(boundaries, "/boundaries")
-    domains = MeshFunction("size_t", mesh, 3)
-    hdf.read(domains, "/domains")
-
-    # Only consider FSI in domain within this sphere
-    sph_x = fsi_region[0]
-    sph_y = fsi_region[1]
-    sph_z = fsi_region[2]
-    sph_rad = fsi_region[3]
-
-    i = 0
-    for submesh_facet in facets(mesh):
-        idx_facet = boundaries.array()[i]
-        if idx_facet == fsi_id[0]:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = np.sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id[0]  # changed "fsi" idx to "rigid wall" idx
-        if idx_facet == fsi_id[1]:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = np.sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id[1]  # changed "fsi" idx to "rigid wall" idx
-        if idx_facet == outer_id[0]:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = np.sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id[0]  # changed "outer" idx to "rigid wall" idx
-        if idx_facet == outer_id[1]:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = np.sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id[1]  # changed "outer" idx to "rigid wall" idx
-        i += 1
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder)
+
+    # Only consider FSI in domain within this sphere, i.e. change "fsi" and "outer" idx to "rigid wall" idx outside
+    id_map = {fsi_id[0]: rigid_id[0], fsi_id[1]: rigid_id[1], outer_id[0]: rigid_id[0], outer_id[1]: rigid_id[1]}
+    remark_entities(boundaries, region_from_parameters(fsi_region), id_map)
 
     return mesh, domains, boundaries
 
 
 # Define velocity inlet parabolic profile
-class VelInPara(UserExpression):
-    def __init__(self, t, dt, vel_t_ramp, n, dsi, mesh, interp_velocity, **kwargs):
+class VelInPara(ParabolicInletProfile):
+    def __init__(self, t, dt, vel_t_ramp, n, dsi, mesh, interp_velocity, V):
         self.t = t
         self.dt = dt
         self.t_ramp = vel_t_ramp
         self.interp_velocity = interp_velocity
         self.number = int(self.t / self.dt)
-        self.n = n  # normal direction
-        self.dsi = dsi  # surface integral element
-        self.d = mesh.geometry().dim()
-        self.x = SpatialCoordinate(mesh)
-        # Compute area of boundary tesselation by integrating 1.0 over all facets
-        self.A = assemble(Constant(1.0, name="one") * self.dsi)
-        # Compute barycenter by integrating x components over all facets
-        self.c = [assemble(self.x[i] * self.dsi) / self.A for i in range(self.d)]
-        # Compute radius by taking max radius of boundary points
-        self.r = np.sqrt(self.A / np.pi)
-        super().__init__(**kwargs)
+        # Tabulate the parabolic profile on V once, the boundary values are then given by self.function
+        super().__init__(V, n, dsi, mesh)
 
     def update(self, t):
         self.t = t
         if self.number + 1 < len(self.interp_velocity):
             self.number = int(self.t / self.dt)
 
-    def eval(self, value, x):
-        # Define the parabola
-        r2 = (x[0] - self.c[0]) ** 2 + (x[1] - self.c[1]) ** 2 + (x[2] - self.c[2]) ** 2  # radius**2
-        fact_r = 1 - (r2 / self.r ** 2)
-
         # Define the velocity ramp with sigmoid
         if (self.t < self.t_ramp) and (self.t_ramp > 0.0):
             fact = self.interp_velocity[self.number] * (-0.5 * np.cos((np.pi / (self.t_ramp)) * (self.t)) + 0.5)
-            value[0] = -self.n[0] * fact_r * fact
-            value[1] = -self.n[1] * fact_r * fact
-            value[2] = -self.n[2] * fact_r * fact
         else:
-            value[0] = -self.n[0] * (self.interp_velocity[self.number]) * fact_r
-            value[1] = -self.n[1] * (self.interp_velocity[self.number]) * fact_r
-            value[2] = -self.n[2] * (self.interp_velocity[self.number]) * fact_r
+            fact = self.interp_velocity[self.number]
 
-    def value_shape(self):
-        return (3,)
+        # Scale the tabulated profile
+        self.set_scale(fact)
 
 
-# Define the pressure profile
-class InnerP(UserExpression):
-    def __init__(self, t, dt, p_t_ramp_start, p_t_ramp_end, interp_P, **kwargs):
+# Define the pressure profile, spatially constant and therefore a Constant updated at each time step
+class InnerP(Constant):
+    def __init__(self, t, dt, p_t_ramp_start, p_t_ramp_end, interp_P):
         self.t = t
         self.dt = dt
         self.interp_P = interp_P
         self.number = int(self.t / self.dt)
         self.p_t_ramp_start = p_t_ramp_start
         self.p_t_ramp_end = p_t_ramp_end
-        super().__init__(**kwargs)
+        super().__init__(0.0)
 
     def update(self, t):
         self.t = t
         if self.number + 1 < len(self.interp_P):
             self.number = int(self.t / self.dt)
 
-    def eval(self, value, x):
         # Define the pressure ramp with sigmoid
         if self.t < self.p_t_ramp_start:
-            value[0] = 0.0
+            value = 0.0
         elif self.t < self.p_t_ramp_end:
-            value[0] = self.interp_P[self.number] * (-0.5 * np.cos((np.pi / (self.p_t_ramp_end - self.p_t_ramp_start))
-                                                                   * (self.t - self.p_t_ramp_start)) + 0.5)
+            value = self.interp_P[self.number] * (-0.5 * np.cos((np.pi / (self.p_t_ramp_end - self.p_t_ramp_start))
+                                                                * (self.t - self.p_t_ramp_start)) + 0.5)
         else:
-            value[0] = self.interp_P[self.number]
-
-    def value_shape(self):
-        return ()
+            value = self.interp_P[self.number]
+        self.assign(value)
 
 
 # Define boundary conditions
-def create_bcs(DVP, mesh, boundaries, T, dt, fsi_id, inlet_id1, inlet_id2, rigid_id, psi, F_solid_linear,
-               vel_t_ramp, p_t_ramp_start, p_t_ramp_end, p_deg, v_deg, patient_data_path, **namespace):
+@hook_timers.timed
+def create_bcs(DVP, mesh, boundaries, waveform_duration, dt, fsi_id, inlet_id1, inlet_id2, rigid_id, psi,
+               F_solid_linear, vel_t_ramp, p_t_ramp_start, p_t_ramp_end, patient_data_path, mu_f, rho_f, **namespace):
 
     if MPI.rank(MPI.comm_world) == 0:
         print("Create bcs")
@@ -241,7 +211,7 @@ def create_bcs(DVP, mesh, boundaries, T, dt, fsi_id, inlet_id1, inlet_id2, rigid
 
     len_v = len(v_PA)
     t_v = np.arange(len(v_PA))
-    num_t = int(T / dt)  # 30.000 timesteps = 3s (T) / 0.0001s (dt)
+    num_t = int(waveform_duration / dt)  # 30.000 timesteps = 3s (waveform_duration) / 0.0001s (dt)
     tnew = np.linspace(0, len_v, num=num_t)
 
     interp_DA = np.array(np.interp(tnew, t_v, v_DA))
@@ -250,13 +220,14 @@ def create_bcs(DVP, mesh, boundaries, T, dt, fsi_id, inlet_id1, inlet_id2, rigid
     interp_P = np.array(np.interp(tnew, t_v, PV))
 
     # Create Parabolic profile for Proximal Artey (PA) and Distal Artey (DA)
+    V = DVP.sub(1).collapse()
     u_inflow_exp1 = VelInPara(t=0.0, dt=dt, vel_t_ramp=vel_t_ramp, n=normal1, dsi=dsi1, mesh=mesh,
-                              interp_velocity=interp_PA, degree=v_deg)
+                              interp_velocity=interp_PA, V=V)
     u_inflow_exp2 = VelInPara(t=0.0, dt=dt, vel_t_ramp=vel_t_ramp, n=normal2, dsi=dsi2, mesh=mesh,
-                              interp_velocity=interp_DA, degree=v_deg)
+                              interp_velocity=interp_DA, V=V)
     # Impose the pulsatile parabolic inlet velocity at the PA and DA
-    u_inlet1 = DirichletBC(DVP.sub(1), u_inflow_exp1, boundaries, inlet_id1)
-    u_inlet2 = DirichletBC(DVP.sub(1), u_inflow_exp2, boundaries, inlet_id2)
+    u_inlet1 = DirichletBC(DVP.sub(1), u_inflow_exp1.function, boundaries, inlet_id1)
+    u_inlet2 = DirichletBC(DVP.sub(1), u_inflow_exp2.function, boundaries, inlet_id2)
     # Impose velocity 0 for rigid solid regions
     u_inlet_s1 = DirichletBC(DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, rigid_id[0])
     u_inlet_s2 = DirichletBC(DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, rigid_id[1])
@@ -269,7 +240,7 @@ def create_bcs(DVP, mesh, boundaries, T, dt, fsi_id, inlet_id1, inlet_id2, rigid
 
     # Assign InnerP on the reference domain (FSI interface)
     p_out_bc_val = InnerP(t=0.0, dt=dt, interp_P=interp_P, p_t_ramp_start=p_t_ramp_start,
-                          p_t_ramp_end=p_t_ramp_end, degree=p_deg)
+                          p_t_ramp_end=p_t_ramp_end)
     dSS = Measure("dS", domain=mesh, subdomain_data=boundaries)
     n = FacetNormal(mesh)
     F_solid_linear += p_out_bc_val * inner(n('+'), psi('+')) * dSS(fsi_id[0]) + p_out_bc_val * \
@@ -280,34 +251,119 @@ def create_bcs(DVP, mesh, boundaries, T, dt, fsi_id, inlet_id1, inlet_id2, rigid
 
     # Create inlet subdomain for computing the flow rate inside post_solve
     inlet_area = assemble(1.0 * dsi1)
+    flow_diagnostics = FlowDiagnostics(mesh, dt, inlet_area, mu_f, rho_f, n, dsi1)
 
     return dict(bcs=bcs, u_inflow_exp1=u_inflow_exp1, u_inflow_exp2=u_inflow_exp2, p_out_bc_val=p_out_bc_val,
-                F_solid_linear=F_solid_linear, n=n, inlet_area=inlet_area, dsi1=dsi1)
+                F_solid_linear=F_solid_linear, n=n, inlet_area=inlet_area, dsi1=dsi1,
+                flow_diagnostics=flow_diagnostics)
 
 
-def initiate(mesh_path, scale_probe, **namespace):
+def initiate(mesh_path, scale_probe, mesh, visualization_folder, min_jacobian_threshold, telemetry_flush_step,
+             default_variables, adaptive_jacobian, verbose, diagnostics_schedule, DVP, solver_strategy, solver_options,
+             preconditioner_reuse, dt, T_Cycle, periodic_tolerance, periodic_cycles, periodic_signals, **namespace):
 
     probe_points = load_probe_points(mesh_path)
     # In case the probe points are in mm, scale them to meters
     if scale_probe:
         probe_points = probe_points * 0.001
 
-    return dict(probe_points=probe_points)
+    # Locate the probe points once and append the sampled values to a binary time series
+    probe_sampler = ProbeSampler(mesh, probe_points, Path(visualization_folder).parent / "Probes" / "probes.bin")
+
+    jacobian_monitor = JacobianMonitor(mesh, threshold=min_jacobian_threshold)
+
+    # Run the probes, flow properties and Jacobian monitor at their own cadence
+    diagnostics = DiagnosticsScheduler(diagnostics_schedule, hook_timers)
+
+    # Optionally recompute the Jacobian based on the Newton convergence of the previous time step
+    jacobian_policy = AdaptiveJacobianPolicy(verbose=verbose) if adaptive_jacobian else None
+
+    # Optionally write a checkpoint and stop the simulation once the flow is periodic
+    periodic_monitor = None
+    if periodic_tolerance > 0:
+        periodic_monitor = PeriodicConvergenceMonitor(T_Cycle, dt, periodic_tolerance, periodic_cycles,
+                                                      periodic_signals, verbose=verbose)
 
+    # Optionally solve the linear systems of the Newton solver with a preconditioned Krylov solver
+    krylov_solver = create_linear_solver(solver_strategy, DVP, solver_options, preconditioner_reuse)
 
-def pre_solve(t, u_inflow_exp1, u_inflow_exp2, p_out_bc_val, **namespace):
+    # Per time step flow properties, minimum Jacobian and probe values, written to the results folder
+    telemetry = TelemetryWriter(Path(visualization_folder).parent / "telemetry.h5", telemetry_flush_step,
+                                parameters=default_variables)
+
+    return dict(probe_points=probe_points, probe_sampler=probe_sampler, jacobian_monitor=jacobian_monitor,
+                telemetry=telemetry, jacobian_policy=jacobian_policy, diagnostics=diagnostics,
+                krylov_solver=krylov_solver, periodic_monitor=periodic_monitor)
+
+
+@hook_timers.timed
+def pre_solve(t, u_inflow_exp1, u_inflow_exp2, p_out_bc_val, jacobian_policy, krylov_solver, up_sol, **namespace):
     # Update the time variable used for the inlet boundary condition
     u_inflow_exp1.update(t)
     u_inflow_exp2.update(t)
     p_out_bc_val.update(t)
-    return dict(u_inflow_exp1=u_inflow_exp1, u_inflow_exp2=u_inflow_exp2, p_out_bc_val=p_out_bc_val)
+
+    # Use the Krylov solver instead of the direct solver of turtleFSI
+    if krylov_solver is not None:
+        up_sol = krylov_solver.install(up_sol)
+
+    # Decide whether to recompute the Jacobian from the Newton convergence of the previous time step
+    jacobian_updates = jacobian_policy(up_sol) if jacobian_policy is not None else {}
+    up_sol = jacobian_updates.pop("up_sol", up_sol)
+
+    # Time the linear solves and record the Newton iterations of the coming time step for the telemetry
+    up_sol = record_newton_iterations(hook_timers.time_linear_solver(up_sol))
+
+    return dict(u_inflow_exp1=u_inflow_exp1, u_inflow_exp2=u_inflow_exp2, p_out_bc_val=p_out_bc_val, up_sol=up_sol,
+                **jacobian_updates)
 
 
-def post_solve(dvp_, n, dsi1, dt, mesh, inlet_area, mu_f, rho_f, probe_points, **namespace):
+@hook_timers.timed
+def post_solve(dvp_, mesh, flow_diagnostics, probe_sampler, jacobian_monitor, telemetry, t, counter, checkpoint_step,
+               verbose, diagnostics, periodic_monitor, up_sol, **namespace):
     d = dvp_["n"].sub(0, deepcopy=True)
     v = dvp_["n"].sub(1, deepcopy=True)
     p = dvp_["n"].sub(2, deepcopy=True)
 
-    print_probe_points(v, p, probe_points)
-    calculate_and_print_flow_properties(dt, mesh, v, inlet_area, mu_f, rho_f, n, dsi1)
-    compute_minimum_jacobian(mesh, d)
+    records = dict(time_step=counter)
+
+    probe_values = diagnostics.run("probes", counter, t, probe_sampler.sample, velocity=v, pressure=p)
+    if probe_values is not None:
+        probe_sampler.write(t, probe_values)
+        records.update(probe_velocity=probe_values["velocity"], probe_pressure=probe_values["pressure"])
+        if verbose:
+            print_probe_points(probe_values["velocity"], probe_values["pressure"])
+
+    flow_properties = diagnostics.run("flow_properties", counter, t, flow_diagnostics, v)
+    if flow_properties is not None:
+        records.update(flow_properties)
+        if verbose:
+            print_flow_properties(flow_properties)
+
+    min_jacobian = diagnostics.run("jacobian", counter, t, jacobian_monitor, d, verbose=verbose)
+    if min_jacobian is not None:
+        records.update(min_jacobian=min_jacobian)
+
+    if periodic_monitor is not None:
+        periodic_differences = periodic_monitor.update(t, **records)
+        if periodic_differences:
+            records.update(periodic_difference=max(periodic_differences.values()))
+    periodic = periodic_monitor is not None and periodic_monitor.converged
+
+    # Wall-clock time of the time step on rank 0 and the Newton iterations, as printed by turtleFSI in the log
+    records.update(cpu_time=hook_timers.step_time())
+    telemetry.record(t, **records)
+    telemetry.record_sequence(t, **newton_iterations(up_sol))
+    if counter % checkpoint_step == 0:
+        telemetry.flush()
+
+    if jacobian_monitor.collapsed or periodic:
+        telemetry.flush()
+        monitor = jacobian_monitor if jacobian_monitor.collapsed else periodic_monitor
+        return monitor.stop(dvp_=dvp_, t=t, counter=counter, checkpoint_step=checkpoint_step, mesh=mesh,
+                            verbose=verbose, **namespace)
+
+
+@hook_timers.timed(report=True)
+def finished(telemetry, **namespace):
+    telemetry.flush()
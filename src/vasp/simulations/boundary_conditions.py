@@ -0,0 +1,311 @@
+"""
+Inlet and interface boundary conditions of the problem files, which are tabulated or precomputed instead of
+evaluating a UserExpression at every boundary dof in each time step.
+"""
+import hashlib
+import os
+from typing import Union, Optional, Callable, Sequence
+from pathlib import Path
+
+import numpy as np
+from dolfin import Mesh, assemble, MPI, Measure, MeshFunction, FunctionSpace, Function, Expression, Constant, \
+    SpatialCoordinate, interpolate, DirichletBC
+
+
+class ParabolicInletProfile:
+    """
+    A parabolic inlet velocity profile with a time-dependent scale. The spatial profile is tabulated once on the
+    velocity function space, and `set_scale` only multiplies the tabulated vector by the scalar waveform value.
+    The boundary values are given by `function`, so no Python code is called back per boundary dof when the
+    Dirichlet boundary condition is applied, as is the case with a UserExpression.
+    """
+    def __init__(self, V: FunctionSpace, n: np.ndarray, dsi: Measure, mesh: Mesh) -> None:
+        """
+        Initialize the inlet profile.
+
+        Args:
+            V (dolfin.FunctionSpace): Collapsed velocity function space, e.g. DVP.sub(1).collapse().
+            n (np.ndarray): Unit normal of the inlet.
+            dsi (dolfin.Measure): Measure for inlet boundary.
+            mesh (dolfin.Mesh): Mesh object.
+        """
+        self.n = n  # normal direction
+        self.dsi = dsi  # surface integral element
+        self.d = mesh.geometry().dim()
+        self.x = SpatialCoordinate(mesh)
+        # Compute area of boundary tesselation by integrating 1.0 over all facets
+        self.A = assemble(Constant(1.0, name="one") * self.dsi)
+        # Compute barycenter by integrating x components over all facets
+        self.c = [assemble(self.x[i] * self.dsi) / self.A for i in range(self.d)]
+        # Compute radius by taking max radius of boundary points
+        self.r = np.sqrt(self.A / np.pi)
+
+        # Tabulate the unit profile -n * (1 - r^2 / R^2) once
+        r2 = " + ".join(f"(x[{i}] - c{i}) * (x[{i}] - c{i})" for i in range(self.d))
+        components = tuple(f"-n{i} * (1 - ({r2}) / (r * r))" for i in range(self.d))
+        coefficients = {f"n{i}": float(self.n[i]) for i in range(self.d)}
+        coefficients.update({f"c{i}": float(self.c[i]) for i in range(self.d)})
+        profile = Expression(components, r=float(self.r), degree=V.ufl_element().degree(), **coefficients)
+        self.profile = interpolate(profile, V)
+
+        # Boundary values used by the Dirichlet boundary condition
+        self.function = Function(V)
+
+    def set_scale(self, value: float) -> None:
+        """
+        Set the boundary values to the tabulated profile multiplied by a scalar.
+
+        Args:
+            value (float): Scale of the profile, i.e. the centerline velocity.
+        """
+        self.function.vector().zero()
+        self.function.vector().axpy(value, self.profile.vector())
+
+
+def fourier_series_magnitude(An: np.ndarray, Bn: np.ndarray, period: float,
+                             t: Union[float, np.ndarray]) -> np.ndarray:
+    """
+    Evaluate the magnitude of a Fourier series with coefficients An and Bn, vectorized over time.
+
+    Args:
+        An (np.ndarray): Cosine coefficients.
+        Bn (np.ndarray): Sine coefficients.
+        period (float): Period of the waveform.
+        t (float or np.ndarray): Time(s) at which to evaluate the series.
+
+    Returns:
+        np.ndarray: |sum_n (An - i Bn) exp(i n omega t)| at each time.
+    """
+    omega = 2.0 * np.pi / period
+    harmonics = np.arange(len(An))
+    Cn = np.asarray(An) - np.asarray(Bn) * 1j
+
+    return np.abs(np.exp(1j * omega * np.outer(np.atleast_1d(t), harmonics)) @ Cn)
+
+
+class PeriodicWaveform:
+    """
+    A periodic waveform tabulated once over one period at the time step of the simulation, such that each time step
+    only looks up a value. If the period is not a multiple of the time step, the waveform is evaluated directly.
+    """
+    def __init__(self, waveform: Callable[[np.ndarray], np.ndarray], period: float, dt: float) -> None:
+        """
+        Initialize the periodic waveform.
+
+        Args:
+            waveform (Callable): Vectorized function mapping an array of times to waveform values.
+            period (float): Period of the waveform.
+            dt (float): Time step size.
+        """
+        self.waveform = waveform
+        self.period = period
+        self.dt = dt
+        steps_per_period = period / dt
+        if abs(steps_per_period - round(steps_per_period)) < 1e-8:
+            self.table: Optional[np.ndarray] = waveform(np.arange(round(steps_per_period)) * dt)
+        else:
+            self.table = None
+
+    def __call__(self, t: float) -> float:
+        """
+        Get the waveform value at a given time.
+
+        Args:
+            t (float): Time.
+
+        Returns:
+            float: Waveform value.
+        """
+        if self.table is None:
+            return float(self.waveform(np.array([t]))[0])
+
+        return float(self.table[int(round(t / self.dt)) % self.table.size])
+
+
+class PeriodicInletCache:
+    """
+    Cache of periodic inlet boundary values, e.g. Womersley profiles, tabulated at the inlet dofs for every time
+    step of one cycle. The expressions are only evaluated during the first cycle, after which each time step copies
+    the tabulated values into `functions`, which are used as boundary values by the Dirichlet boundary conditions.
+    Once a full cycle is tabulated it is saved to a .npy file, keyed by the inlet dof coordinates, the time step and
+    a user given signature (e.g. the content of the Fourier coefficient file), such that restarted runs and later
+    runs on the same mesh partition load the table instead of tabulating it again. The table is memory mapped, both
+    while it is tabulated into a temporary file in the cache folder and when it is loaded, so only the pages of the
+    current time step are kept in memory. Without a cache folder, the table is kept in memory if it is smaller than
+    `max_memory`, and the expressions are evaluated at every time step otherwise.
+    """
+    def __init__(self, expressions: Sequence, V: FunctionSpace, boundaries: MeshFunction, boundary_id: int,
+                 period: float, dt: float, cache_folder: Optional[Union[str, Path]] = None,
+                 signature: str = "", max_memory: int = 256 * 1024**2) -> None:
+        """
+        Initialize the inlet cache.
+
+        Args:
+            expressions (Sequence): Time-dependent expressions, one per velocity component, with `set_t(t)` and
+                `eval(value, x)` methods and an optional `scale_value` attribute, e.g. from make_womersley_bcs.
+            V (dolfin.FunctionSpace): Collapsed scalar function space of a velocity component,
+                e.g. DVP.sub(1).sub(0).collapse().
+            boundaries (dolfin.MeshFunction): Boundary markers.
+            boundary_id (int): ID of the inlet boundary.
+            period (float): Period of the inlet boundary values.
+            dt (float): Time step size.
+            cache_folder (str or Path, optional): Folder of the cached tables. If None, the table is not saved.
+            signature (str): Additional data identifying the boundary values, included in the cache key.
+            max_memory (int): Largest size in bytes of a table kept in memory when no cache folder is given.
+        """
+        self.expressions = list(expressions)
+        self.dt = dt
+        self.functions = [Function(V) for _ in self.expressions]
+
+        # Owned dofs on the inlet and their coordinates
+        n_owned = V.dofmap().ownership_range()[1] - V.dofmap().ownership_range()[0]
+        bc = DirichletBC(V, Constant(0.0), boundaries, boundary_id)
+        dofs = np.fromiter(bc.get_boundary_values().keys(), dtype=np.intc)
+        self.dofs = np.sort(dofs[dofs < n_owned])
+        self.coordinates = V.tabulate_dof_coordinates().reshape(-1, V.mesh().geometry().dim())[self.dofs]
+        self._values = np.zeros(n_owned)
+
+        # Only tabulate if the period is a multiple of the time step
+        steps_per_period = period / dt
+        self.n_steps = int(round(steps_per_period)) if abs(steps_per_period - round(steps_per_period)) < 1e-8 \
+            else 0
+        self.table: Optional[np.ndarray] = None
+        self.tabulated = np.zeros(self.n_steps, dtype=bool)
+        self.cache_path: Optional[Path] = None
+        self._tmp_path: Optional[Path] = None
+        if self.n_steps == 0:
+            return
+
+        if cache_folder is not None and self.dofs.size > 0:
+            key = hashlib.sha1()
+            key.update(np.ascontiguousarray(self.coordinates, dtype=np.float64).tobytes())
+            key.update(f"{dt!r}:{period!r}:{len(self.expressions)}:{signature}".encode())
+            self.cache_path = Path(cache_folder) / f"inlet_{key.hexdigest()}.npy"
+
+        shape = (self.n_steps, len(self.expressions), self.dofs.size)
+        if self.cache_path is not None and self.cache_path.exists():
+            self.table = np.load(self.cache_path, mmap_mode="r")
+            self.tabulated[:] = True
+        elif self.cache_path is not None:
+            # Tabulate into a temporary file, such that an interrupted run never leaves a partial table behind
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._tmp_path = self.cache_path.with_name(f"{self.cache_path.stem}.{os.getpid()}.tmp.npy")
+            self.table = np.lib.format.open_memmap(self._tmp_path, mode="w+", dtype=np.float64, shape=shape)
+        elif np.prod(shape) * np.dtype(np.float64).itemsize <= max_memory:
+            self.table = np.empty(shape)
+
+    def _evaluate(self, t: float) -> np.ndarray:
+        """
+        Evaluate the expressions at the inlet dofs with unit scale.
+
+        Args:
+            t (float): Time.
+
+        Returns:
+            np.ndarray: Values of shape (number of expressions, number of inlet dofs).
+        """
+        values = np.empty((len(self.expressions), self.dofs.size))
+        value = np.zeros(1)
+        for i, expression in enumerate(self.expressions):
+            expression.set_t(t)
+            scale_value = getattr(expression, "scale_value", None)
+            if scale_value is not None:
+                expression.scale_value = 1.0
+            for j, x in enumerate(self.coordinates):
+                expression.eval(value, x)
+                values[i, j] = value[0]
+            if scale_value is not None:
+                expression.scale_value = scale_value
+
+        return values
+
+    def update(self, t: float, scale: float = 1.0) -> None:
+        """
+        Set the boundary values at a given time, evaluating and tabulating them if not already done.
+
+        Args:
+            t (float): Time.
+            scale (float): Scale of the boundary values, e.g. a ramp factor.
+        """
+        if self.table is None:
+            values = self._evaluate(t)
+        else:
+            step = int(round(t / self.dt)) % self.n_steps
+            if not self.tabulated[step]:
+                self.table[step] = self._evaluate(t)
+                self.tabulated[step] = True
+                if self.tabulated.all():
+                    self.save()
+            values = self.table[step]
+
+        for function, component in zip(self.functions, values):
+            self._values[self.dofs] = scale * component
+            function.vector().set_local(self._values)
+            function.vector().apply("insert")
+
+    def save(self) -> None:
+        """
+        Save the tabulated cycle to the cache file, if a cache folder is given.
+        """
+        if self.cache_path is None or self._tmp_path is None or not self.tabulated.all():
+            return
+        assert isinstance(self.table, np.memmap)
+        self.table.flush()
+        os.replace(self._tmp_path, self.cache_path)
+        self._tmp_path = None
+        self.table = np.load(self.cache_path, mmap_mode="r")
+
+
+class InterfacePressure(Constant):
+    """
+    A spatially constant fluid-solid interface pressure based on Fourier coefficients. Since it is a dolfin
+    Constant, the value is pushed into the compiled forms at each update, and the normalized pressure waveform
+    is tabulated once over one period when the time step is given.
+    """
+    def __init__(self, t, t_ramp_start, t_ramp_end, An, Bn, period, P_mean, dt=None):
+        """
+        Initialize the interface pressure.
+        """
+        self.t = t
+        self.t_ramp_start = t_ramp_start
+        self.t_ramp_end = t_ramp_end
+        self.An = An
+        self.Bn = Bn
+        self.omega = (2.0 * np.pi / period)
+        self.P_mean = P_mean
+        self.p_0 = 0.0  # Initial pressure
+        self.P = self.p_0  # Apply initial pressure to inner pressure variable
+        self.ramp_factor = 0.0
+        super().__init__(self.p_0)
+
+        # Normalized pressure from Fourier coefficients, tabulated over one period if dt is known
+        def normalized_pressure(times: np.ndarray) -> np.ndarray:
+            return fourier_series_magnitude(An, Bn, period, times)
+
+        if dt is not None:
+            self.Pn: Callable[[float], float] = PeriodicWaveform(normalized_pressure, period, dt)
+        else:
+            self.Pn = lambda time: float(normalized_pressure(np.array([time]))[0])
+
+    def update(self, t, verbose=True):
+        """
+        Update the interface pressure at a given time, and print the ramp factor and pressure if verbose.
+        """
+        self.t = t
+        # apply a sigmoid ramp to the pressure
+        if self.t < self.t_ramp_start:
+            ramp_factor = 0.0
+        if self.t_ramp_start <= self.t < self.t_ramp_end:
+            ramp_factor = -0.5 * np.cos(np.pi * (self.t - self.t_ramp_start) / (self.t_ramp_end - self.t_ramp_start)) \
+                + 0.5
+        if self.t >= self.t_ramp_end:
+            ramp_factor = 1.0
+        self.ramp_factor = ramp_factor
+        if verbose and MPI.rank(MPI.comm_world) == 0:
+            print("ramp_factor = {} m^3/s".format(ramp_factor))
+
+        # Multiply normalized pressure by mean pressure and ramp factor
+        self.P = ramp_factor * self.Pn(self.t) * self.P_mean
+        self.assign(self.P)
+        if verbose and MPI.rank(MPI.comm_world) == 0:
+            print("Instantaneous normal stress prescribed at the FSI interface {} Pa".format(self.P))
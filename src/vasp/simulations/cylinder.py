@@ -3,10 +3,12 @@ Problem file for tiny cylinder FSI simulation
 """
 import numpy as np
 from turtleFSI.problems import *
-from dolfin import HDF5File, Mesh, MeshFunction, assemble, UserExpression, FacetNormal, ds, \
-    DirichletBC, Measure, inner, parameters, SpatialCoordinate, Constant
+from dolfin import assemble, Constant, FacetNormal, ds, DirichletBC, Measure, inner, parameters
 
-from vasp.simulations.simulation_common import calculate_and_print_flow_properties
+from vasp.simulations.boundary_conditions import ParabolicInletProfile
+from vasp.simulations.flow_diagnostics import FlowDiagnostics, print_flow_properties
+from vasp.simulations.simulation_common import load_mesh_and_data
+from vasp.simulations.solver_strategies import create_linear_solver
 
 # set compiler arguments
 parameters["form_compiler"]["quadrature_degree"] = 6
@@ -39,8 +41,12 @@ def set_problem_parameters(default_variables, **namespace):
             rtol=1e-6,  # Relative tolerance in the Newton solver
             recompute=20,  # Recompute the Jacobian matix within time steps
             recompute_tstep=20,  # Recompute the Jacobian matix over time steps
+            solver_strategy=None,  # Krylov solver strategy replacing linear_solver, see solver_strategies.py
+            solver_options={},  # PETSc options overriding those of the solver strategy
+            preconditioner_reuse=1,  # Number of Jacobians that each preconditioner of the solver strategy is used for
             # boundary condition parameters
             mesh_path="mesh/cylinder.h5",
+            partition_folder=None,  # Folder of vasp-partition-mesh output, default <mesh folder>/Partitions
             inlet_id=2,  # inlet id for the fluid
             inlet_outlet_s_id=11,  # inlet and outlet id for solid
             fsi_id=22,  # id for fsi interface
@@ -69,37 +75,22 @@ def set_problem_parameters(default_variables, **namespace):
     return default_variables
 
 
-def get_mesh_domain_and_boundaries(mesh_path, **namespace):
+def get_mesh_domain_and_boundaries(mesh_path, partition_folder, **namespace):
     if MPI.rank(MPI.comm_world) == 0:
         print("Obtaining mesh, domains and boundaries...")
-    mesh = Mesh()
-    hdf = HDF5File(mesh.mpi_comm(), mesh_path, "r")
-    hdf.read(mesh, "/mesh", False)
-    boundaries = MeshFunction("size_t", mesh, 2)
-    hdf.read(boundaries, "/boundaries")
-    domains = MeshFunction("size_t", mesh, 3)
-    hdf.read(domains, "/domains")
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder)
 
     return mesh, domains, boundaries
 
 
-class VelInPara(UserExpression):
-    def __init__(self, t, t_ramp, v_max_final, n, dsi, mesh, **kwargs):
+class VelInPara(ParabolicInletProfile):
+    def __init__(self, t, t_ramp, v_max_final, n, dsi, mesh, V):
         self.t = t
         self.t_ramp = t_ramp
         self.v_max_final = v_max_final
         self.v = 0.0
-        self.n = n
-        self.dsi = dsi
-        self.d = mesh.geometry().dim()
-        self.x = SpatialCoordinate(mesh)
-        # Compute area of boundary tesselation by integrating 1.0 over all facets
-        self.A = assemble(Constant(1.0, name="one") * self.dsi)
-        # Compute barycenter by integrating x components over all facets
-        self.c = [assemble(self.x[i] * self.dsi) / self.A for i in range(self.d)]
-        # Compute radius by taking max radius of boundary points
-        self.r = np.sqrt(self.A / np.pi)
-        super().__init__(**kwargs)
+        # Tabulate the parabolic profile on V once, the boundary values are then given by self.function
+        super().__init__(V, n, dsi, mesh)
 
     def update(self, t):
         self.t = t
@@ -109,31 +100,19 @@ class VelInPara(UserExpression):
         else:
             ramp_factor = 1.0
         self.v = ramp_factor * self.v_max_final
+        self.set_scale(self.v)
 
         if MPI.rank(MPI.comm_world) == 0:
             print("v (centerline, at inlet) = {} m/s".format(self.v))
 
-    def eval(self, value, x):
-        r2 = (
-            (x[0] - self.c[0]) ** 2 + (x[1] - self.c[1]) ** 2 + (x[2] - self.c[2]) ** 2
-        )  # radius**2
-        fact_r = 1 - (r2 / self.r**2)
 
-        value[0] = -self.n[0] * (self.v) * fact_r  # *self.t
-        value[1] = -self.n[1] * (self.v) * fact_r  # *self.t
-        value[2] = -self.n[2] * (self.v) * fact_r  # *self.t
-
-    def value_shape(self):
-        return (3,)
-
-
-class InnerP(UserExpression):
-    def __init__(self, t, t_ramp, P_final, **kwargs):
+class InnerP(Constant):
+    def __init__(self, t, t_ramp, P_final):
         self.t = t
         self.t_ramp = t_ramp
         self.P_final = P_final
         self.P = 0.0
-        super().__init__(**kwargs)
+        super().__init__(self.P)
 
     def update(self, t):
         self.t = t
@@ -143,22 +122,17 @@ class InnerP(UserExpression):
         else:
             ramp_factor = 1.0
         self.P = ramp_factor * self.P_final
+        self.assign(self.P)
 
         if MPI.rank(MPI.comm_world) == 0:
             print("P = {} Pa".format(self.P))
 
-    def eval(self, value, x):
-        value[0] = self.P
-
-    def value_shape(self):
-        return ()
-
 
-def create_bcs(DVP, mesh, boundaries, P_final, v_max_final, fsi_id, inlet_id,
+def create_bcs(DVP, mesh, boundaries, dt, mu_f, rho_f, P_final, v_max_final, fsi_id, inlet_id,
                inlet_outlet_s_id, rigid_id, psi, F_solid_linear, **namespace):
 
     # Apply pressure at the fsi interface by modifying the variational form
-    p_out_bc_val = InnerP(t=0.0, t_ramp=0.1, P_final=P_final, degree=2)
+    p_out_bc_val = InnerP(t=0.0, t_ramp=0.1, P_final=P_final)
     dSS = Measure("dS", domain=mesh, subdomain_data=boundaries)
     n = FacetNormal(mesh)
     # defined on the reference domain
@@ -174,8 +148,8 @@ def create_bcs(DVP, mesh, boundaries, P_final, v_max_final, fsi_id, inlet_id,
 
     # Parabolic Inlet Velocity Profile
     u_inflow_exp = VelInPara(t=0.0, t_ramp=0.1, v_max_final=v_max_final,
-                             n=normal, dsi=dsi, mesh=mesh, degree=3)
-    u_inlet = DirichletBC(DVP.sub(1), u_inflow_exp, boundaries, inlet_id)
+                             n=normal, dsi=dsi, mesh=mesh, V=DVP.sub(1).collapse())
+    u_inlet = DirichletBC(DVP.sub(1), u_inflow_exp.function, boundaries, inlet_id)
     u_inlet_s = DirichletBC(DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, inlet_outlet_s_id)
 
     # Solid Displacement BCs
@@ -189,19 +163,31 @@ def create_bcs(DVP, mesh, boundaries, P_final, v_max_final, fsi_id, inlet_id,
     # Create inlet subdomain for computing the flow rate inside post_solve
     dsi = ds(inlet_id, domain=mesh, subdomain_data=boundaries)
     inlet_area = assemble(1.0 * dsi)
+    flow_diagnostics = FlowDiagnostics(mesh, dt, inlet_area, mu_f, rho_f, n, dsi)
 
     return dict(bcs=bcs, u_inflow_exp=u_inflow_exp, p_out_bc_val=p_out_bc_val,
-                F_solid_linear=F_solid_linear, dsi=dsi, inlet_area=inlet_area, n=n)
+                F_solid_linear=F_solid_linear, dsi=dsi, inlet_area=inlet_area, n=n, flow_diagnostics=flow_diagnostics)
 
 
-def pre_solve(t, u_inflow_exp, p_out_bc_val, **namespace):
+def initiate(DVP, solver_strategy, solver_options, preconditioner_reuse, **namespace):
+    # Optionally solve the linear systems of the Newton solver with a preconditioned Krylov solver
+    krylov_solver = create_linear_solver(solver_strategy, DVP, solver_options, preconditioner_reuse)
+    return dict(krylov_solver=krylov_solver)
+
+
+def pre_solve(t, u_inflow_exp, p_out_bc_val, krylov_solver, up_sol, **namespace):
     # Update the time variable used for the inlet boundary condition
     u_inflow_exp.update(t)
     p_out_bc_val.update(t)
-    return dict(u_inflow_exp=u_inflow_exp, p_out_bc_val=p_out_bc_val)
+
+    # Use the Krylov solver instead of the direct solver of turtleFSI
+    if krylov_solver is not None:
+        up_sol = krylov_solver.install(up_sol)
+
+    return dict(u_inflow_exp=u_inflow_exp, p_out_bc_val=p_out_bc_val, up_sol=up_sol)
 
 
-def post_solve(dvp_, dt, mesh, inlet_area, mu_f, rho_f, n, dsi, **namespace):
+def post_solve(dvp_, flow_diagnostics, **namespace):
 
     v = dvp_["n"].sub(1, deepcopy=True)
-    calculate_and_print_flow_properties(dt, mesh, v, inlet_area, mu_f, rho_f, n, dsi)
+    print_flow_properties(flow_diagnostics(v))
@@ -0,0 +1,56 @@
+"""
+Problem file for the scaling benchmark of the tiny cylinder FSI simulation, run by vasp-scaling-benchmark.
+The cylinder problem is solved without saving any results, and the time of each phase of the time steps is written
+to a JSON file when the simulation is finished.
+"""
+import numpy as np
+from turtleFSI.problems import *  # noqa: F401
+
+from vasp.simulations import cylinder
+from vasp.simulations.cylinder import get_mesh_domain_and_boundaries, create_bcs  # noqa: F401
+from vasp.simulations.timers import StepTimer
+
+# Time of each phase of the time steps
+step_timer = StepTimer()
+
+
+def set_problem_parameters(default_variables, **namespace):
+    default_variables = cylinder.set_problem_parameters(default_variables, **namespace)
+    default_variables.update(
+        dict(
+            T=0.01,  # Simulation end time
+            dt=0.001,  # Time step size
+            save_step=10 ** 9,  # Do not save files for visualisation
+            checkpoint_step=10 ** 9,  # Do not save checkpoint files
+            benchmark_path="cylinder_benchmark.json",  # Path to the JSON file with the timings
+            benchmark_warmup=1,  # Number of first time steps, where the forms are compiled, left out of the timings
+            refinement_level=0,  # Number of uniform refinements of the mesh, only stored with the timings
+            folder="cylinder_benchmark_results",  # output folder generated for simulation
+        )
+    )
+
+    return default_variables
+
+
+def initiate(benchmark_warmup, **namespace):
+    step_timer.warmup_steps = int(benchmark_warmup)
+    return cylinder.initiate(**namespace)
+
+
+@step_timer.timed
+def pre_solve(**namespace):
+    variables = cylinder.pre_solve(**namespace)
+    return dict(variables, up_sol=step_timer.time_linear_solver(variables["up_sol"]))
+
+
+@step_timer.timed
+def post_solve(**namespace):
+    cylinder.post_solve(**namespace)
+
+
+def finished(benchmark_path, refinement_level, solver_strategy, krylov_solver, mesh, DVP, dt, **namespace):
+    krylov_iterations = krylov_solver.iterations if krylov_solver is not None else []
+    step_timer.write(benchmark_path, problem="cylinder", refinement_level=int(refinement_level),
+                     solver_strategy=solver_strategy or "mumps",
+                     num_cells=mesh.num_entities_global(mesh.topology().dim()), num_dofs=DVP.dim(), dt=dt,
+                     krylov_iterations=float(np.mean(krylov_iterations)) if krylov_iterations else None)
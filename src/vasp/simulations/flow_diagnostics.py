@@ -0,0 +1,160 @@
+"""
+Flow properties of a simulation, i.e. the flow rate at the inlet and the velocity, CFL and Reynolds numbers.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+from dolfin import Mesh, assemble, MPI, Measure, inner, FunctionSpace, Function, sqrt, Expression, TrialFunction, \
+    TestFunction, LocalSolver, dx
+
+
+class FlowDiagnostics:
+    """
+    Compute flow properties (flow rate at the inlet, velocity, CFL and Reynolds numbers) at a small cost per time step.
+    Everything that does not change between time steps, i.e. the factorized DG0 projection of the velocity magnitude,
+    the assembled inlet flux vector, the minimum cell diameter and the inlet diameter, is computed once. The local
+    contributions of all ranks are then combined with a single collective call.
+    """
+    def __init__(self, mesh: Mesh, dt: float, inlet_area: float, mu_f: float, rho_f: float, n: Expression,
+                 dsi: Measure, local_rhs: bool = False) -> None:
+        """
+        Initialize the flow diagnostics.
+
+        Args:
+            mesh (dolfin.Mesh): Mesh object.
+            dt (float): Time step size.
+            inlet_area (float): Inlet area.
+            mu_f (float): Fluid dynamic viscosity.
+            rho_f (float): Fluid density.
+            n (dolfin.Expression): FacetNormal expression.
+            dsi (dolfin.Measure): Measure for inlet boundary.
+            local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
+                If False (default), solve using a global right-hand side assembly.
+        """
+        self.comm = mesh.mpi_comm()
+        self.dt = dt
+        self.mu_f = mu_f
+        self.rho_f = rho_f
+        self.n = n
+        self.dsi = dsi
+        self.local_rhs = local_rhs
+
+        # compute the minimum cell diameter in the mesh and the diameter at the inlet
+        self.h_min = MPI.min(self.comm, mesh.hmin())
+        self.diam_inlet = np.sqrt(4 * inlet_area / np.pi)
+
+        self.DG = FunctionSpace(mesh, "DG", 0)
+        self.v_magnitude = Function(self.DG)
+        # The projection and the inlet flux are set up at the first call, when the velocity function space is known
+        self._v: Optional[Function] = None
+
+    def _setup(self, v: Function) -> None:
+        """
+        Compile and factorize the projection of the velocity magnitude and assemble the inlet flux vector.
+
+        Args:
+            v (dolfin.Function): Velocity field.
+        """
+        V = v.function_space()
+        self._v = Function(V)
+        self.degree = v.ufl_element().degree()
+
+        u = TrialFunction(self.DG)
+        q = TestFunction(self.DG)
+        self.solver = LocalSolver(inner(u, q) * dx, inner(sqrt(inner(self._v, self._v)), q) * dx)
+        self.solver.factorize()
+
+        # The flow rate is linear in v, hence it is the dot product of v with the assembled flux vector
+        self.inlet_flux = assemble(inner(TestFunction(V), self.n) * self.dsi).get_local()
+
+    def __call__(self, v: Function) -> Dict[str, float]:
+        """
+        Calculate flow properties.
+
+        Args:
+            v (dolfin.Function): Velocity field.
+
+        Returns:
+            Dict[str, float]: Flow rate at the inlet, and mean, min, and max of velocity, CFL and Reynolds numbers.
+        """
+        if self._v is None:
+            self._setup(v)
+
+        self._v.vector().zero()
+        self._v.vector().axpy(1, v.vector())
+        self._v.vector().apply("insert")
+
+        # Calculate the DG vector of velocity magnitudes
+        if self.local_rhs:
+            self.solver.solve_local_rhs(self.v_magnitude)
+        else:
+            self.solver.solve_global_rhs(self.v_magnitude)
+        V_vector = self.v_magnitude.vector().get_local()
+
+        # Gather the local sum, size, min, and max of the velocity, and the local inlet flux in one collective call
+        local_stats = np.array([V_vector.sum(), V_vector.size,
+                                V_vector.min() if V_vector.size > 0 else np.inf,
+                                V_vector.max() if V_vector.size > 0 else -np.inf,
+                                np.dot(self.inlet_flux, v.vector().get_local())])
+        stats = np.empty((self.comm.Get_size(), local_stats.size))
+        self.comm.Allgather(local_stats, stats)
+
+        # Calculate mean, min, and max velocities and flow rate at the inlet
+        v_mean = stats[:, 0].sum() / stats[:, 1].sum()
+        v_min = stats[:, 2].min()
+        v_max = stats[:, 3].max()
+        flow_rate_inlet = abs(stats[:, 4].sum())
+
+        # Calculate Reynolds and CFL numbers
+        reynolds = [self.rho_f * value * self.diam_inlet / self.mu_f for value in (v_mean, v_min, v_max)]
+        cfl = [value * self.dt / self.h_min * self.degree for value in (v_mean, v_min, v_max)]
+
+        return dict(flow_rate=flow_rate_inlet,
+                    velocity_mean=v_mean, velocity_min=v_min, velocity_max=v_max,
+                    cfl_mean=cfl[0], cfl_min=cfl[1], cfl_max=cfl[2],
+                    reynolds_mean=reynolds[0], reynolds_min=reynolds[1], reynolds_max=reynolds[2])
+
+
+def print_flow_properties(flow_properties: Dict[str, float]) -> None:
+    """
+    Print flow properties.
+
+    Args:
+        flow_properties (dict): Flow properties as returned by `FlowDiagnostics`.
+
+    Returns:
+        None
+    """
+    if MPI.rank(MPI.comm_world) == 0:
+        fp = flow_properties
+        print("Flow Properties:")
+        print(f"  Flow Rate at Inlet: {fp['flow_rate']}")
+        print(f"  Velocity (mean, min, max): {fp['velocity_mean']}, {fp['velocity_min']}, {fp['velocity_max']}")
+        print(f"  CFL (mean, min, max): {fp['cfl_mean']}, {fp['cfl_min']}, {fp['cfl_max']}")
+        print(f"  Reynolds Numbers (mean, min, max): {fp['reynolds_mean']}, {fp['reynolds_min']}, "
+              f"{fp['reynolds_max']}")
+
+
+def calculate_and_print_flow_properties(dt: float, mesh: Mesh, v: Function, inlet_area: float, mu_f: float,
+                                        rho_f: float, n: Expression, dsi: Measure, local_rhs: bool = False) -> None:
+    """
+    Calculate and print flow properties. This sets up a new `FlowDiagnostics` at every call; inside the time loop,
+    create a `FlowDiagnostics` once and reuse it instead.
+
+    Args:
+        dt (float): Time step size.
+        mesh (dolfin.Mesh): Mesh object.
+        v (dolfin.Function): Velocity field.
+        inlet_area (float): Inlet area.
+        mu_f (float): Fluid dynamic viscosity.
+        rho_f (float): Fluid density.
+        n (dolfin.Expression): FacetNormal expression.
+        dsi (dolfin.Measure): Measure for inlet boundary.
+        local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
+            If False (default), solve using a global right-hand side assembly.
+
+    Returns:
+        None
+    """
+    flow_diagnostics = FlowDiagnostics(mesh, dt, inlet_area, mu_f, rho_f, n, dsi, local_rhs)
+    print_flow_properties(flow_diagnostics(v))
@@ -0,0 +1,132 @@
+"""
+Monitoring of the Jacobian of the mesh deformation, which measures the distortion of the mesh.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+from dolfin import Mesh, MPI, inner, FunctionSpace, Function, TrialFunction, TestFunction, LocalSolver, dx, \
+    FiniteElement
+from turtleFSI.modules.common import J_
+
+from vasp.simulations.simulation_common import checkpoint_and_stop
+
+
+class JacobianMonitor:
+    """
+    Monitor the minimum Jacobian of the mesh deformation, which is a measure of the mesh distortion.
+    The value 1 indicates no distortion, while a value less than 0 indicates mesh entanglement.
+
+    The Jacobian is evaluated at the quadrature points of each cell, and not only as a cell average, by a local
+    projection onto a quadrature space. The form is compiled and the local solver factorized once. If the global
+    minimum drops to or below a given threshold, the monitor flags the run as collapsed, so that the problem file
+    can write a checkpoint and stop the simulation with `stop`.
+    """
+    def __init__(self, mesh: Mesh, threshold: Optional[float] = None, quadrature_degree: int = 2,
+                 local_rhs: bool = False) -> None:
+        """
+        Initialize the Jacobian monitor.
+
+        Args:
+            mesh (dolfin.Mesh): The mesh object.
+            threshold (float, optional): Minimum Jacobian at or below which the run is considered collapsed.
+                If None (default), the Jacobian is only monitored.
+            quadrature_degree (int, optional): Degree of the quadrature rule defining the evaluation points.
+            local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
+        """
+        self.mesh = mesh
+        self.comm = mesh.mpi_comm()
+        self.threshold = threshold
+        self.quadrature_degree = quadrature_degree
+        self.local_rhs = local_rhs
+        self.collapsed = False
+        self.min_jacobian = np.inf
+
+        element = FiniteElement("Quadrature", mesh.ufl_cell(), quadrature_degree, quad_scheme="default")
+        self.Q = FunctionSpace(mesh, element)
+        self.jacobian = Function(self.Q)
+        # The form is set up at the first call, when the displacement function space is known
+        self._d: Optional[Function] = None
+
+    def _setup(self, d: Function) -> None:
+        """
+        Compile the Jacobian form and factorize the local projection onto the quadrature space.
+
+        Args:
+            d (dolfin.Function): The displacement function.
+        """
+        self._d = Function(d.function_space())
+        dx_q = dx(metadata={"quadrature_degree": self.quadrature_degree, "quadrature_rule": "default"})
+        u = TrialFunction(self.Q)
+        v = TestFunction(self.Q)
+        self.solver = LocalSolver(inner(u, v) * dx_q, inner(J_(self._d), v) * dx_q)
+        self.solver.factorize()
+
+    def __call__(self, d: Function, verbose: bool = True) -> float:
+        """
+        Compute and print the global minimum Jacobian of the displacement.
+
+        Args:
+            d (dolfin.Function): The displacement function.
+            verbose (bool): If True, print the minimum Jacobian.
+
+        Returns:
+            float: The global minimum Jacobian of the displacement.
+        """
+        if self._d is None:
+            self._setup(d)
+
+        self._d.vector().zero()
+        self._d.vector().axpy(1, d.vector())
+        self._d.vector().apply("insert")
+
+        if self.local_rhs:
+            self.solver.solve_local_rhs(self.jacobian)
+        else:
+            self.solver.solve_global_rhs(self.jacobian)
+
+        local_values = self.jacobian.vector().get_local()
+        min_jacobian = local_values.min() if local_values.size > 0 else np.inf
+        self.min_jacobian = MPI.min(self.comm, min_jacobian)
+
+        if self.threshold is not None and self.min_jacobian <= self.threshold:
+            self.collapsed = True
+
+        if MPI.rank(self.comm) == 0:
+            if verbose:
+                print(f"Minimum Jacobian: {self.min_jacobian}")
+
+            if self.min_jacobian <= 0:
+                print("Warning: Negative Jacobian detected.")
+
+        return self.min_jacobian
+
+    def stop(self, **namespace) -> Dict[str, bool]:
+        """
+        Write a checkpoint of the current state and tell turtleFSI to stop the time loop.
+
+        Args:
+            **namespace: The turtleFSI namespace, as passed to `post_solve`.
+
+        Returns:
+            dict: Variables to update the turtleFSI namespace with.
+        """
+        return checkpoint_and_stop(f"Minimum Jacobian {self.min_jacobian} is below the threshold {self.threshold}.",
+                                   **namespace)
+
+
+def compute_minimum_jacobian(mesh: Mesh, d: Function, local_rhs: bool = False) -> float:
+    """
+    Compute the minimum Jacobian of the mesh. The minimum Jacobian is a measure of the mesh distortion.
+    The value 1 indicates no distortion, while a value less than 0 indicates mesh entanglement.
+    This sets up a new `JacobianMonitor` at every call; inside the time loop, create a `JacobianMonitor` once and
+    reuse it instead.
+
+    Args:
+        mesh (dolfin.Mesh): The mesh object.
+        d (dolfin.Function): The displacement function.
+        local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
+
+    Returns:
+        float: The global minimum Jacobian of the displacement.
+    """
+    return JacobianMonitor(mesh, local_rhs=local_rhs)(d)
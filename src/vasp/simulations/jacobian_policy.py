@@ -0,0 +1,167 @@
+"""
+Adaptive recomputation of the Jacobian in the Newton solver of turtleFSI, based on the convergence of the Newton
+iterations, and recording of the Newton iterations for the telemetry.
+"""
+from typing import List, Dict, Optional, Sequence
+
+import numpy as np
+from dolfin import MPI
+
+from vasp.simulations.simulation_common import _find_wrapped_solver
+
+
+class _RecordingSolver:
+    """
+    Proxy of the linear solver used by the turtleFSI Newton solver, which records the norm of the residual and of
+    the Newton increment at each solve, and the number of times the operator (i.e. the Jacobian) is set.
+    All other attributes are forwarded to the wrapped solver.
+    """
+    def __init__(self, solver) -> None:
+        self.solver = solver
+        self.residuals: List[float] = []
+        self.increments: List[float] = []
+        self.factorizations = 0
+
+    def set_operator(self, A) -> None:
+        self.factorizations += 1
+        self.solver.set_operator(A)
+
+    def solve(self, *args):
+        # The last two arguments are always the solution and right hand side vectors
+        x, b = args[-2], args[-1]
+        self.residuals.append(b.norm("l2"))
+        result = self.solver.solve(*args)
+        self.increments.append(x.norm("l2"))
+
+        return result
+
+    def reset(self) -> None:
+        self.residuals = []
+        self.increments = []
+        self.factorizations = 0
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+
+class AdaptiveJacobianPolicy:
+    """
+    Policy deciding when the Jacobian is reassembled and refactorized, based on the convergence of the Newton solver
+    in the previous time step instead of a fixed number of time steps (`recompute_tstep`). The Jacobian is kept as
+    long as the Newton solver converges within `max_iterations` iterations and the residual is reduced by at least a
+    factor `max_contraction` per iteration, and refactorized at the next time step otherwise.
+
+    The policy is called in `pre_solve`, and the returned dictionary updates `up_sol`, `recompute_tstep` and
+    `recompute` in the turtleFSI namespace. The linear solver `up_sol` is wrapped to record the residual of each
+    Newton iteration. Within a time step, the Jacobian is still refactorized every `max_iterations` iterations and
+    when the residual increases, as done by turtleFSI.
+    """
+    # turtleFSI refactorizes the Jacobian at time steps where counter % recompute_tstep == 0
+    _NEVER = 2 ** 31 - 1
+
+    def __init__(self, max_contraction: float = 0.2, max_iterations: int = 6, max_age: Optional[int] = None,
+                 verbose: bool = True) -> None:
+        """
+        Initialize the policy.
+
+        Args:
+            max_contraction (float): Largest accepted ratio between the residuals of two consecutive Newton iterations.
+            max_iterations (int): Largest accepted number of Newton iterations in a time step.
+            max_age (int, optional): If given, refactorize the Jacobian at least every max_age time steps.
+            verbose (bool): If True, print the convergence of the previous time step and the decision.
+        """
+        self.max_contraction = max_contraction
+        self.max_iterations = max_iterations
+        self.max_age = max_age
+        self.verbose = verbose
+        self.age = 0
+        self.contraction = 0.0
+        self.iterations = 0
+        self.num_factorizations = 0
+
+    def __call__(self, up_sol, **namespace) -> Dict:
+        """
+        Decide whether the Jacobian is refactorized in the coming time step.
+
+        Args:
+            up_sol: Linear solver of the turtleFSI Newton solver.
+            **namespace: The turtleFSI namespace, as passed to `pre_solve`.
+
+        Returns:
+            dict: Variables to update the turtleFSI namespace with.
+        """
+        # The recording solver may be wrapped by other proxies, e.g. the one of `StepTimer`
+        recorder = _find_wrapped_solver(up_sol, _RecordingSolver)
+        if recorder is None:
+            # First time step, where turtleFSI computes the Jacobian anyway
+            return dict(up_sol=_RecordingSolver(up_sol), recompute_tstep=self._NEVER, recompute=self.max_iterations)
+
+        refactorize = self.refactorize(recorder.residuals, recorder.factorizations)
+        if MPI.rank(MPI.comm_world) == 0 and self.verbose:
+            print(f"Newton iterations: {self.iterations}, contraction rate: {self.contraction:.3e}, "
+                  f"Jacobian age: {self.age}, recompute Jacobian: {refactorize}")
+        recorder.reset()
+
+        return dict(up_sol=up_sol, recompute_tstep=1 if refactorize else self._NEVER, recompute=self.max_iterations)
+
+    def refactorize(self, residuals: Sequence[float], factorizations: int) -> bool:
+        """
+        Update the convergence history with the previous time step, and decide whether to refactorize.
+
+        Args:
+            residuals (Sequence[float]): Residual norm of each Newton iteration in the previous time step.
+            factorizations (int): Number of times the Jacobian was refactorized in the previous time step.
+
+        Returns:
+            bool: True if the Jacobian should be refactorized before the coming time step.
+        """
+        self.num_factorizations += factorizations
+        self.age = 1 if factorizations > 0 else self.age + 1
+        self.iterations = len(residuals)
+        residuals = np.asarray(residuals)
+        if residuals.size > 1:
+            self.contraction = float(np.max(residuals[1:] / np.maximum(residuals[:-1], np.finfo(float).tiny)))
+        else:
+            self.contraction = 0.0
+
+        return bool(self.iterations > self.max_iterations or self.contraction > self.max_contraction
+                    or (self.max_age is not None and self.age >= self.max_age))
+
+
+def record_newton_iterations(up_sol):
+    """
+    Record the Newton iterations of the coming time step, by wrapping the linear solver of the turtleFSI Newton
+    solver once. Call last in `pre_solve`, e.g. after `AdaptiveJacobianPolicy`, and update `up_sol` in the turtleFSI
+    namespace with the returned solver.
+
+    Args:
+        up_sol: Linear solver of the turtleFSI Newton solver.
+
+    Returns:
+        The recording linear solver.
+    """
+    # The recording solver may be wrapped by other proxies, e.g. the one of `StepTimer`
+    recorder = _find_wrapped_solver(up_sol, _RecordingSolver)
+    if recorder is None:
+        return _RecordingSolver(up_sol)
+    recorder.reset()
+
+    return up_sol
+
+
+def newton_iterations(up_sol) -> Dict[str, List[float]]:
+    """
+    Get the Newton iterations of the last time step recorded by `record_newton_iterations`, i.e. the norms of the
+    residual and of the increment printed by turtleFSI as "r (atol)" and "r (rel)".
+
+    Args:
+        up_sol: Linear solver of the turtleFSI Newton solver.
+
+    Returns:
+        dict: Norm of the residual (newton_atol) and of the increment (newton_rtol) of each Newton iteration.
+    """
+    recorder = _find_wrapped_solver(up_sol, _RecordingSolver)
+    if recorder is None:
+        return dict(newton_atol=[], newton_rtol=[])
+
+    return dict(newton_atol=list(recorder.residuals), newton_rtol=list(recorder.increments))
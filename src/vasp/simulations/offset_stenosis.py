@@ -7,12 +7,23 @@ import numpy as np
 from vampy.simulation.Womersley import make_womersley_bcs, compute_boundary_geometry_acrn
 from vampy.simulation.simulation_common import print_mesh_information
 from turtleFSI.problems import *  # noqa: F401
-from dolfin import HDF5File, Mesh, MeshFunction, facets, assemble, sqrt, cells, FacetNormal, ds, \
-    DirichletBC, Measure, inner, parameters
-
-from vasp.simulations.simulation_common import load_probe_points, print_probe_points, \
-    calculate_and_print_flow_properties, load_solid_probe_points, print_solid_probe_points, InterfacePressure, \
-    compute_minimum_jacobian
+from dolfin import assemble, FacetNormal, ds, DirichletBC, Measure, inner, parameters
+
+from vasp.simulations.boundary_conditions import InterfacePressure, PeriodicInletCache
+from vasp.simulations.flow_diagnostics import FlowDiagnostics, print_flow_properties
+from vasp.simulations.jacobian_monitor import JacobianMonitor
+from vasp.simulations.jacobian_policy import AdaptiveJacobianPolicy, record_newton_iterations, newton_iterations
+from vasp.simulations.periodic_convergence import PeriodicConvergenceMonitor
+from vasp.simulations.probe_sampler import ProbeSampler
+from vasp.simulations.region_output import RegionWriter
+from vasp.simulations.regions import remark_entities, region_from_parameters, box_region
+from vasp.simulations.separate_domain import SeparateDomainWriter, create_separate_domain_meshes
+from vasp.simulations.simulation_common import load_mesh_and_data, load_probe_points, print_probe_points, \
+    load_solid_probe_points, print_solid_probe_points
+from vasp.simulations.solver_strategies import create_linear_solver
+from vasp.simulations.spectral_analysis import SpectralAnalyzer
+from vasp.simulations.telemetry import TelemetryWriter
+from vasp.simulations.timers import StepTimer, DiagnosticsScheduler
 
 # set compiler arguments
 parameters["form_compiler"]["quadrature_degree"] = 6
@@ -22,6 +33,8 @@ parameters["form_compiler"]["optimize"] = True
 # be "shared_vertex", for 2D mesh "shared_facet", the default value is "none"
 parameters["ghost_mode"] = "shared_vertex"
 _compiler_parameters = dict(parameters["form_compiler"])
+# Time spent in the hooks, the Newton solver and the diagnostics, printed when the simulation is finished
+hook_timers = StepTimer()
 
 
 def set_problem_parameters(default_variables, **namespace):
@@ -46,6 +59,10 @@ def set_problem_parameters(default_variables, **namespace):
         rtol=1e-6,  # Relative tolerance in the Newton solver
         recompute=20,  # Recompute the Jacobian matrix within time steps
         recompute_tstep=20,  # Recompute the Jacobian matrix over time steps
+        adaptive_jacobian=False,  # Recompute the Jacobian based on the Newton convergence instead of recompute_tstep
+        solver_strategy=None,  # Krylov solver strategy replacing linear_solver, see solver_strategies.py
+        solver_options={},  # PETSc options overriding those of the solver strategy
+        preconditioner_reuse=1,  # Number of Jacobians that each preconditioner of the solver strategy is used for
         # boundary condition parameters
         inlet_id=3,  # inlet id for the fluid
         inlet_outlet_s_id=11,  # inlet and outlet id for solid
@@ -56,6 +73,8 @@ def set_problem_parameters(default_variables, **namespace):
         Q_mean=2.5E-06,
         P_mean=11200,
         T_Cycle=0.951,  # Used to define length of flow waveform
+        vel_t_ramp=0.25,  # Time for the cosine ramp of the inlet velocity
+        p_t_ramp_end=0.2,  # End time of the cosine ramp of the interface pressure
         rho_f=[1.000E3, 1.000E3],  # Fluid density [kg/m3]
         mu_f=[1.5E-3, 1.0E-2],  # Fluid dynamic viscosity [Pa.s]
         dx_f_id=[1, 1001],  # ID of marker in the fluid domain
@@ -73,85 +92,125 @@ def set_problem_parameters(default_variables, **namespace):
         # Simulation parameters
         folder="offset_stenosis_results",  # Folder name generated for the simulation
         mesh_path="mesh/file_stenosis.h5",
+        partition_folder=None,  # Folder of vasp-partition-mesh output, default <mesh folder>/Partitions
         FC_file="FC_MCA_10",  # File name containing the Fourier coefficients for the flow waveform
         P_FC_File="FC_Pressure",  # File name containing the Fourier coefficients for the pressure waveform
         compiler_parameters=_compiler_parameters,  # Update the default values of the compiler arguments (FEniCS)
         save_deg=2,  # Degree of the functions saved for visualisation
+        min_jacobian_threshold=None,  # Checkpoint and stop if the minimum Jacobian drops to this, None to only monitor
+        periodic_tolerance=0.0,  # Stop when the signals differ less than this from the previous cycle, 0 to disable
+        periodic_cycles=2,  # Number of consecutive periodic cycles before stopping
+        periodic_signals=["flow_rate", "min_jacobian", "probe_pressure"],  # Telemetry records compared per cycle
+        telemetry_flush_step=10,  # Number of time steps between each write to the telemetry file
+        diagnostics_schedule={},  # Cadence of probes, flow_properties and jacobian, e.g. dict(probes=dict(every=10))
+        spectral_window=0,  # Number of time steps per in-situ spectrogram window of the probe signals (0: off)
+        spectral_overlap=0.75,  # Fraction of overlap between consecutive spectrogram windows
+        spectral_bands=None,  # Frequency bands [[f_low, f_high], ...] in Hz, default octave bands
+        roi_region=None,  # Region of interest as fsi_region (sphere, box or cylinder), or "fsi_region"
+        roi_domain_id=None,  # Only include these domain ids in the region of interest, e.g. the fluid domain
+        roi_save_step=1,  # Save frequency of d, v and p at the vertices in the region of interest
+        field_save_step=0,  # Save frequency of d, v and p at all vertices in the same layout, 0 to disable
+        save_separate_domain=False,  # Write u.h5 and d_solid.h5 to Visualization_separate_domain every save_step
     ))
 
     return default_variables
 
 
-def get_mesh_domain_and_boundaries(mesh_path, fsi_region, dx_f_id, fsi_id, rigid_id, outer_id, **namespace):
+def get_mesh_domain_and_boundaries(mesh_path, partition_folder, fsi_region, dx_f_id, fsi_id, rigid_id, outer_id,
+                                   **namespace):
 
     # Read mesh
-    mesh = Mesh()
-    hdf = HDF5File(mesh.mpi_comm(), mesh_path, "r")
-    hdf.read(mesh, "/mesh", False)
-    boundaries = MeshFunction("size_t", mesh, 2)
-    hdf.read(boundaries, "/boundaries")
-    domains = MeshFunction("size_t", mesh, 3)
-    hdf.read(domains, "/domains")
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder)
 
     print_mesh_information(mesh)
 
-    # Only consider FSI in domain within this sphere
-    sph_x = fsi_region[0]
-    sph_y = fsi_region[1]
-    sph_z = fsi_region[2]
-    sph_rad = fsi_region[3]
-
-    i = 0
-    for submesh_facet in facets(mesh):
-        idx_facet = boundaries.array()[i]
-        if idx_facet == fsi_id or idx_facet == outer_id:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id  # changed "fsi" idx to "rigid wall" idx
-        i += 1
-
-    # NOTE: Instead of using a sphere, we can also use a box to define the FSI region as follows
-    # Only consider FSI in domain within fsi_x_range, fsi_y_range, fsi_z_range
-    # i = 0
-    # for submesh_facet in facets(mesh):
-    #     idx_facet = boundaries.array()[i]
-    #     if idx_facet == fsi_id or idx_facet == outer_id:
-    #         mid = submesh_facet.midpoint()
-    #         if mid.x() < fsi_region[0] or mid.x() > fsi_region[1]:
-    #             boundaries.array()[i] = rigid_id  # changed "fsi" id to "rigid wall" id
-    #         elif mid.y() < fsi_region[2] or mid.y() > fsi_region[3]:
-    #             boundaries.array()[i] = rigid_id
-    #         elif mid.z() < fsi_region[4] or mid.z() > fsi_region[5]:
-    #             boundaries.array()[i] = rigid_id
-    #     i += 1
+    # Only consider FSI in domain within fsi_region, i.e. change "fsi" and "outer" idx to "rigid wall" idx outside.
+    # fsi_region is a sphere [x, y, z, radius], but a box [x_min, x_max, y_min, y_max, z_min, z_max],
+    # a cylinder [x_start, y_start, z_start, x_end, y_end, z_end, radius] or a list of those can also be used
+    remark_entities(boundaries, region_from_parameters(fsi_region), {fsi_id: rigid_id, outer_id: rigid_id})
 
     # In this region, make fluid more viscous
     x_min = 0.024
-    i = 0
-    for cell in cells(mesh):
-        idx_cell = domains.array()[i]
-        if idx_cell == dx_f_id[0]:
-            mid = cell.midpoint()
-            if mid.x() > x_min:
-                domains.array()[i] = dx_f_id[1]
-        i += 1
+    viscous_region = box_region([x_min, -np.inf, -np.inf], [np.inf, np.inf, np.inf])
+    remark_entities(domains, viscous_region, {dx_f_id[0]: dx_f_id[1]}, inside=True)
 
     return mesh, domains, boundaries
 
 
-def initiate(mesh_path, **namespace):
+def initiate(mesh_path, mesh, visualization_folder, min_jacobian_threshold, telemetry_flush_step, default_variables,
+             adaptive_jacobian, verbose, dt, spectral_window, spectral_overlap, spectral_bands, domains, fsi_region,
+             roi_region, roi_domain_id, field_save_step, diagnostics_schedule, DVP, solver_strategy, solver_options,
+             preconditioner_reuse, T_Cycle, periodic_tolerance, periodic_cycles, periodic_signals, save_separate_domain,
+             save_deg, dx_f_id, dx_s_id, **namespace):
 
     probe_points = load_probe_points(mesh_path)
     solid_probe_points = load_solid_probe_points(mesh_path)
 
-    return dict(probe_points=probe_points, solid_probe_points=solid_probe_points)
-
-
-def create_bcs(t, DVP, mesh, boundaries, mu_f,
+    # Locate the probe points once and append the sampled values to binary time series
+    probe_folder = Path(visualization_folder).parent / "Probes"
+    probe_sampler = ProbeSampler(mesh, probe_points, probe_folder / "probes.bin")
+    solid_probe_sampler = ProbeSampler(mesh, solid_probe_points, probe_folder / "solid_probes.bin")
+
+    jacobian_monitor = JacobianMonitor(mesh, threshold=min_jacobian_threshold)
+
+    # Run the probes, flow properties and Jacobian monitor at their own cadence
+    diagnostics = DiagnosticsScheduler(diagnostics_schedule, hook_timers)
+
+    # Optionally recompute the Jacobian based on the Newton convergence of the previous time step
+    jacobian_policy = AdaptiveJacobianPolicy(verbose=verbose) if adaptive_jacobian else None
+
+    # Optionally write a checkpoint and stop the simulation once the flow is periodic
+    periodic_monitor = None
+    if periodic_tolerance > 0:
+        periodic_monitor = PeriodicConvergenceMonitor(T_Cycle, dt, periodic_tolerance, periodic_cycles,
+                                                      periodic_signals, verbose=verbose)
+
+    # Optionally solve the linear systems of the Newton solver with a preconditioned Krylov solver
+    krylov_solver = create_linear_solver(solver_strategy, DVP, solver_options, preconditioner_reuse)
+
+    # Per time step flow properties, minimum Jacobian and probe values, written to the results folder
+    telemetry = TelemetryWriter(Path(visualization_folder).parent / "telemetry.h5", telemetry_flush_step,
+                                parameters=default_variables)
+
+    # Optionally accumulate spectrograms of the probe signals, without saving the solution at every time step.
+    # The probe signals are sampled at the cadence of the probes
+    spectral_analyzer = None
+    if spectral_window > 0:
+        spectral_analyzer = SpectralAnalyzer(dt * diagnostics.every("probes"), spectral_window,
+                                             probe_folder.parent / "Spectra" / "spectra.h5",
+                                             overlap=spectral_overlap, bands=spectral_bands)
+
+    # Optionally write d, v and p in a region of interest, and in the whole domain, in a time-major layout
+    region_folder = Path(visualization_folder).parent / "Region"
+    roi_writer = None
+    if roi_region is not None or roi_domain_id is not None:
+        if roi_region == "fsi_region":
+            roi_region = fsi_region
+        region = region_from_parameters(roi_region) if roi_region is not None else None
+        roi_writer = RegionWriter(mesh, region_folder / "region.h5", region=region, domains=domains,
+                                  domain_ids=roi_domain_id)
+    field_writer = RegionWriter(mesh, region_folder / "whole_domain.h5") if field_save_step > 0 else None
+
+    # Optionally write the fluid velocity and solid displacement for the post-processing, instead of create_hdf5
+    separate_domain_writer = None
+    if save_separate_domain:
+        fluid_mesh_path, solid_mesh_path = create_separate_domain_meshes(mesh_path, dx_f_id, dx_s_id, save_deg)
+        separate_domain_writer = SeparateDomainWriter(
+            DVP.sub(1).collapse(), DVP.sub(0).collapse(), fluid_mesh_path, solid_mesh_path,
+            probe_folder.parent / "Visualization_separate_domain")
+
+    return dict(probe_points=probe_points, solid_probe_points=solid_probe_points, probe_sampler=probe_sampler,
+                solid_probe_sampler=solid_probe_sampler, jacobian_monitor=jacobian_monitor, telemetry=telemetry,
+                jacobian_policy=jacobian_policy, spectral_analyzer=spectral_analyzer, roi_writer=roi_writer,
+                field_writer=field_writer, diagnostics=diagnostics, krylov_solver=krylov_solver,
+                periodic_monitor=periodic_monitor, separate_domain_writer=separate_domain_writer)
+
+
+@hook_timers.timed
+def create_bcs(t, dt, DVP, mesh, boundaries, mu_f, rho_f,
                fsi_id, inlet_id, inlet_outlet_s_id,
-               rigid_id, psi, F_solid_linear, p_deg, FC_file,
-               Q_mean, P_FC_File, P_mean, T_Cycle, **namespace):
+               rigid_id, psi, F_solid_linear, FC_file,
+               Q_mean, P_FC_File, P_mean, T_Cycle, p_t_ramp_end, folder, **namespace):
 
     # Load Fourier coefficients for the velocity and scale by flow rate
     An, Bn = np.loadtxt(Path(__file__).parent / FC_file).T
@@ -162,12 +221,16 @@ def create_bcs(t, DVP, mesh, boundaries, mu_f,
     # Create Womersley boundary condition at inlet
     tmp_element = DVP.sub(1).sub(0).ufl_element()
     inlet = make_womersley_bcs(T_Cycle, None, mu_f[0], tmp_center, tmp_radius, tmp_normal, tmp_element, Cn=Cn)
-    # Initialize inlet expressions with initial time
-    for uc in inlet:
-        uc.set_t(t)
+
+    # Tabulate the Womersley profiles at the inlet dofs over one cycle, and cache them on disk for later runs
+    signature = "{}:{!r}:{!r}".format((Path(__file__).parent / FC_file).read_text(), Q_mean, mu_f[0])
+    inlet_cache = PeriodicInletCache(inlet, DVP.sub(1).sub(0).collapse(), boundaries, inlet_id, T_Cycle, dt,
+                                     cache_folder=Path(folder) / "InletCache", signature=signature)
+    # Initialize inlet boundary values with initial time
+    inlet_cache.update(t)
 
     # Create Boundary conditions for the velocity
-    u_inlet = [DirichletBC(DVP.sub(1).sub(i), inlet[i], boundaries, inlet_id) for i in range(3)]
+    u_inlet = [DirichletBC(DVP.sub(1).sub(i), inlet_cache.functions[i], boundaries, inlet_id) for i in range(3)]
     u_inlet_s = DirichletBC(DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, inlet_outlet_s_id)
 
     # Solid Displacement BCs
@@ -184,40 +247,123 @@ def create_bcs(t, DVP, mesh, boundaries, mu_f,
     # Apply pulsatile pressure at the fsi interface by modifying the variational form
     n = FacetNormal(mesh)
     dSS = Measure("dS", domain=mesh, subdomain_data=boundaries)
-    interface_pressure = InterfacePressure(t=0.0, t_ramp_start=0.0, t_ramp_end=0.2, An=An_P,
-                                           Bn=Bn_P, period=T_Cycle, P_mean=P_mean, degree=p_deg)
+    interface_pressure = InterfacePressure(t=0.0, t_ramp_start=0.0, t_ramp_end=p_t_ramp_end, An=An_P,
+                                           Bn=Bn_P, period=T_Cycle, P_mean=P_mean, dt=dt)
     F_solid_linear += interface_pressure * inner(n('+'), psi('+')) * dSS(fsi_id)
 
     # Create inlet subdomain for computing the flow rate inside post_solve
     dsi = ds(inlet_id, domain=mesh, subdomain_data=boundaries)
     inlet_area = assemble(1.0 * dsi)
-    return dict(bcs=bcs, inlet=inlet, interface_pressure=interface_pressure, F_solid_linear=F_solid_linear, n=n,
-                dsi=dsi, inlet_area=inlet_area)
+    flow_diagnostics = FlowDiagnostics(mesh, dt, inlet_area, mu_f[0], rho_f[0], n, dsi)
+    return dict(bcs=bcs, inlet_cache=inlet_cache, interface_pressure=interface_pressure, F_solid_linear=F_solid_linear,
+                n=n, dsi=dsi, inlet_area=inlet_area, flow_diagnostics=flow_diagnostics)
 
 
-def pre_solve(t, inlet, interface_pressure, **namespace):
-    for uc in inlet:
-        # Update the time variable used for the inlet boundary condition
-        uc.set_t(t)
+@hook_timers.timed
+def pre_solve(t, inlet_cache, interface_pressure, jacobian_policy, krylov_solver, up_sol, verbose, vel_t_ramp,
+              **namespace):
+    # Multiply by cosine function to ramp up smoothly over time interval 0-vel_t_ramp
+    if t < vel_t_ramp:
+        scale_value = -0.5 * np.cos(np.pi * t / vel_t_ramp) + 0.5
+    else:
+        scale_value = 1.0
 
-        # Multiply by cosine function to ramp up smoothly over time interval 0-250 ms
-        if t < 0.25:
-            uc.scale_value = -0.5 * np.cos(np.pi * t / 0.25) + 0.5
-        else:
-            uc.scale_value = 1.0
+    # Update the inlet boundary condition from the tabulated cycle
+    inlet_cache.update(t, scale_value)
 
     # Update pressure condition
-    interface_pressure.update(t)
+    interface_pressure.update(t, verbose=verbose)
+
+    # Use the Krylov solver instead of the direct solver of turtleFSI
+    if krylov_solver is not None:
+        up_sol = krylov_solver.install(up_sol)
+
+    # Decide whether to recompute the Jacobian from the Newton convergence of the previous time step
+    jacobian_updates = jacobian_policy(up_sol) if jacobian_policy is not None else {}
+    up_sol = jacobian_updates.pop("up_sol", up_sol)
+
+    # Time the linear solves and record the Newton iterations of the coming time step for the telemetry
+    up_sol = record_newton_iterations(hook_timers.time_linear_solver(up_sol))
 
-    return dict(inlet=inlet, interface_pressure=interface_pressure)
+    return dict(inlet_cache=inlet_cache, interface_pressure=interface_pressure, up_sol=up_sol, **jacobian_updates)
 
 
-def post_solve(probe_points, solid_probe_points, dvp_, dt, mesh, inlet_area, dsi, mu_f, rho_f, n, **namespace):
+@hook_timers.timed
+def post_solve(probe_sampler, solid_probe_sampler, flow_diagnostics, jacobian_monitor, interface_pressure, telemetry,
+               dvp_, t, counter, checkpoint_step, mesh, verbose, spectral_analyzer, roi_writer, field_writer,
+               roi_save_step, field_save_step, diagnostics, periodic_monitor, separate_domain_writer, save_step, up_sol,
+               **namespace):
     d = dvp_["n"].sub(0, deepcopy=True)
     v = dvp_["n"].sub(1, deepcopy=True)
     p = dvp_["n"].sub(2, deepcopy=True)
 
-    print_probe_points(v, p, probe_points)
-    print_solid_probe_points(d, solid_probe_points)
-    calculate_and_print_flow_properties(dt, mesh, v, inlet_area, mu_f[0], rho_f[0], n, dsi)
-    compute_minimum_jacobian(mesh, d)
+    records = dict(time_step=counter, ramp_factor=interface_pressure.ramp_factor, pressure=interface_pressure.P)
+
+    probe_values = None
+    if diagnostics.due("probes", counter, t):
+        with hook_timers.section("probes"):
+            probe_values = probe_sampler.sample(velocity=v, pressure=p)
+            solid_probe_values = solid_probe_sampler.sample(displacement=d)
+        probe_sampler.write(t, probe_values)
+        solid_probe_sampler.write(t, solid_probe_values)
+        records.update(probe_velocity=probe_values["velocity"], probe_pressure=probe_values["pressure"],
+                       probe_displacement=solid_probe_values["displacement"])
+        if verbose:
+            print_probe_points(probe_values["velocity"], probe_values["pressure"])
+            print_solid_probe_points(solid_probe_values["displacement"])
+
+    flow_properties = diagnostics.run("flow_properties", counter, t, flow_diagnostics, v)
+    if flow_properties is not None:
+        records.update(flow_properties)
+        if verbose:
+            print_flow_properties(flow_properties)
+
+    min_jacobian = diagnostics.run("jacobian", counter, t, jacobian_monitor, d, verbose=verbose)
+    if min_jacobian is not None:
+        records.update(min_jacobian=min_jacobian)
+
+    if periodic_monitor is not None:
+        periodic_differences = periodic_monitor.update(t, **records)
+        if periodic_differences:
+            records.update(periodic_difference=max(periodic_differences.values()))
+    periodic = periodic_monitor is not None and periodic_monitor.converged
+
+    if spectral_analyzer is not None and probe_values is not None:
+        spectral_analyzer.update(t, velocity=np.linalg.norm(probe_values["velocity"], axis=1),
+                                 pressure=probe_values["pressure"],
+                                 displacement=np.linalg.norm(solid_probe_values["displacement"], axis=1))
+
+    if roi_writer is not None and counter % roi_save_step == 0:
+        roi_writer.write(t, d=d, v=v, p=p)
+    if field_writer is not None and counter % field_save_step == 0:
+        field_writer.write(t, d=d, v=v, p=p)
+    if separate_domain_writer is not None and counter % save_step == 0:
+        separate_domain_writer.write(t, v=v, d=d)
+
+    # Wall-clock time of the time step on rank 0 and the Newton iterations, as printed by turtleFSI in the log
+    records.update(cpu_time=hook_timers.step_time())
+    telemetry.record(t, **records)
+    telemetry.record_sequence(t, **newton_iterations(up_sol))
+
+    if counter % checkpoint_step == 0 or periodic:
+        telemetry.flush()
+        for writer in [roi_writer, field_writer]:
+            if writer is not None:
+                writer.flush()
+                writer.write_xdmf()
+        if separate_domain_writer is not None:
+            separate_domain_writer.flush()
+
+    if jacobian_monitor.collapsed or periodic:
+        telemetry.flush()
+        monitor = jacobian_monitor if jacobian_monitor.collapsed else periodic_monitor
+        return monitor.stop(dvp_=dvp_, t=t, counter=counter, checkpoint_step=checkpoint_step, mesh=mesh,
+                            verbose=verbose, **namespace)
+
+
+@hook_timers.timed(report=True)
+def finished(telemetry, roi_writer, field_writer, separate_domain_writer, **namespace):
+    telemetry.flush()
+    for writer in [roi_writer, field_writer, separate_domain_writer]:
+        if writer is not None:
+            writer.close()
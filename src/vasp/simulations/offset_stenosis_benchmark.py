@@ -0,0 +1,60 @@
+"""
+Problem file for the benchmark of the offset stenosis FSI simulation, run by vasp-scaling-benchmark, e.g. to compare
+the linear solver strategies with MUMPS. The offset stenosis problem is solved without saving the solution for
+visualisation, and the time of each phase of the time steps is written to a JSON file when the simulation is finished.
+"""
+import numpy as np
+from turtleFSI.problems import *  # noqa: F401
+
+from vasp.simulations import offset_stenosis
+from vasp.simulations.offset_stenosis import get_mesh_domain_and_boundaries, create_bcs  # noqa: F401
+from vasp.simulations.timers import StepTimer
+
+# Time of each phase of the time steps
+step_timer = StepTimer()
+
+
+def set_problem_parameters(default_variables, **namespace):
+    default_variables = offset_stenosis.set_problem_parameters(default_variables, **namespace)
+    default_variables.update(
+        dict(
+            T=0.01,  # Simulation end time
+            dt=0.001,  # Time step size
+            save_step=10 ** 9,  # Do not save files for visualisation
+            checkpoint_step=10 ** 9,  # Do not save checkpoint files
+            benchmark_path="offset_stenosis_benchmark.json",  # Path to the JSON file with the timings
+            benchmark_warmup=1,  # Number of first time steps, where the forms are compiled, left out of the timings
+            refinement_level=0,  # Number of uniform refinements of the mesh, only stored with the timings
+            folder="offset_stenosis_benchmark_results",  # Folder name generated for the simulation
+        )
+    )
+
+    return default_variables
+
+
+def initiate(benchmark_warmup, **namespace):
+    step_timer.warmup_steps = int(benchmark_warmup)
+    return offset_stenosis.initiate(**namespace)
+
+
+@step_timer.timed
+def pre_solve(**namespace):
+    variables = offset_stenosis.pre_solve(**namespace)
+    return dict(variables, up_sol=step_timer.time_linear_solver(variables["up_sol"]))
+
+
+@step_timer.timed
+def post_solve(**namespace):
+    return offset_stenosis.post_solve(**namespace)
+
+
+def finished(benchmark_path, refinement_level, solver_strategy, krylov_solver, **namespace):
+    offset_stenosis.finished(**namespace)
+
+    mesh, DVP = namespace["mesh"], namespace["DVP"]
+    krylov_iterations = krylov_solver.iterations if krylov_solver is not None else []
+    step_timer.write(benchmark_path, problem="offset_stenosis", refinement_level=int(refinement_level),
+                     solver_strategy=solver_strategy or "mumps",
+                     num_cells=mesh.num_entities_global(mesh.topology().dim()), num_dofs=DVP.dim(),
+                     dt=namespace["dt"],
+                     krylov_iterations=float(np.mean(krylov_iterations)) if krylov_iterations else None)
@@ -0,0 +1,379 @@
+"""
+Parameter sweep of a problem on the same mesh, e.g. over the pressure, the flow rate or the material parameters of
+the solid. The sweep is given as a JSON file, either with a list of values per parameter, where all combinations are
+run, or with a list of variants, each a dictionary of parameters, e.g.
+
+    {"P_mean": [10000, 11200, 12400], "Q_mean": [1.0e-06, 1.25e-06]}
+
+Instead of running each variant as an independent job, the mesh is partitioned once (see vasp-partition-mesh), the
+forms are compiled once into a cache shared by all variants (see vasp-warm-cache), and the variants are run
+`--num-slots` at a time, e.g. one per node allocation. The first variants start from rest, while every later variant
+is restarted from the last checkpoint of the nearest finished variant, and continues at the same phase of the
+cardiac cycle, e.g.
+
+    vasp-parameter-sweep --problem aneurysm --mesh-path mesh/file_aneurysm.h5 --sweep sweep.json \\
+        --num-processes 16 --num-slots 4 --new-arguments periodic_tolerance=1e-3
+
+The Young modulus E_s (and Poisson ratio nu_s) of aneurysm.py and offset_stenosis.py are converted to the Lame
+parameters mu_s and lambda_s of the problem file, while other derived parameters are not recomputed. For avf.py,
+where each solid region has its own material, the solid_properties are swept instead.
+Combined with the periodic convergence monitor (periodic_tolerance), the warm-started variants stop as soon as their
+flow is periodic.
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from dolfin import MPI
+
+from vasp import __version__
+from vasp.automatedPreprocessing.warm_cache import import_problem, get_problem_parameters
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", type=str, required=True,
+                        help="Name of a problem file in vasp.simulations (e.g. aneurysm, avf, offset_stenosis)")
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the mesh shared by all variants")
+    parser.add_argument("--sweep", type=Path, required=True,
+                        help="JSON file with a list of values per parameter, or a list of variants")
+    parser.add_argument("--new-arguments", type=str, nargs="*", default=[],
+                        help="Parameters shared by all variants, as key=value")
+    parser.add_argument("--num-processes", type=int, default=1, help="Number of processes per variant")
+    parser.add_argument("--num-slots", type=int, default=1, help="Number of variants running at the same time")
+    parser.add_argument("--mpirun", type=str, default="mpirun -np {num_processes}",
+                        help="Command to run a variant with a given number of processes, e.g. " +
+                             "'srun --nodes 1 --ntasks {num_processes}' to run each variant on its own node")
+    parser.add_argument("--folder", type=Path, default=Path("parameter_sweep"),
+                        help="Folder for the results of each variant and the summary of the sweep")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="Start every variant from rest instead of from the nearest finished variant")
+    return parser.parse_args()
+
+
+def parse_value(value: str) -> Any:
+    """
+    Parse a parameter value given on the command line as a Python literal, or keep it as a string.
+
+    Args:
+        value (str): Value of the parameter.
+
+    Returns:
+        The parsed value.
+    """
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def get_variants(sweep: Union[Dict[str, Sequence], List[Dict]]) -> List[Dict[str, Any]]:
+    """
+    Get the parameters of each variant of a sweep.
+
+    Args:
+        sweep (dict or list): List of values per parameter, where all combinations are run, or list of variants.
+
+    Returns:
+        list: Parameters of each variant.
+    """
+    if isinstance(sweep, dict):
+        names = list(sweep)
+        return [dict(zip(names, values)) for values in itertools.product(*(sweep[name] for name in names))]
+
+    return [dict(variant) for variant in sweep]
+
+
+def convert_young_modulus(variant: Dict[str, Any], problem_parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replace the Young modulus E_s of a variant by the Lame parameters mu_s and lambda_s used by the problem files,
+    with the Poisson ratio nu_s of the variant or the problem file. Problems with a material per solid region
+    (solid_properties, e.g. avf.py) have to sweep the solid_properties instead.
+
+    Args:
+        variant (dict): Parameters of the variant.
+        problem_parameters (dict): Default parameters of the problem file.
+
+    Returns:
+        dict: Parameters of the variant, with mu_s and lambda_s instead of E_s.
+    """
+    if "E_s" not in variant:
+        return dict(variant)
+    if "solid_properties" in variant or "solid_properties" in problem_parameters:
+        raise ValueError("The Young modulus E_s cannot be swept for problems with solid_properties, where each " +
+                         "solid region has its own material parameters. Sweep the solid_properties instead.")
+
+    variant = dict(variant)
+    E_s = variant.pop("E_s")
+    nu_s = variant.get("nu_s", problem_parameters.get("nu_s"))
+    assert nu_s is not None, "The Young modulus E_s requires the Poisson ratio nu_s"
+    variant["mu_s"] = E_s / (2 * (1 + nu_s))
+    variant["lambda_s"] = nu_s * 2. * variant["mu_s"] / (1. - 2. * nu_s)
+
+    return variant
+
+
+def _flatten(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """
+    Flatten nested dictionaries and lists of parameter values, e.g. the solid_properties of avf.py.
+
+    Args:
+        value: Parameter value.
+        prefix (str): Name of the value.
+
+    Returns:
+        dict: Values that are not dictionaries or lists, keyed by their path.
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    else:
+        return {prefix: value}
+
+    flat = {}
+    for key, item in items:
+        flat.update(_flatten(item, f"{prefix}/{key}"))
+
+    return flat
+
+
+def parameter_distance(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """
+    Distance between the parameters of two variants, as the sum of the squared relative differences of the numbers,
+    and one for every other value that differs.
+
+    Args:
+        a (dict): Parameters of the first variant.
+        b (dict): Parameters of the second variant.
+
+    Returns:
+        float: Distance between the variants.
+    """
+    flat_a, flat_b = _flatten(a), _flatten(b)
+    distance = 0.0
+    for key in flat_a.keys() | flat_b.keys():
+        x, y = flat_a.get(key), flat_b.get(key)
+        numbers = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (x, y))
+        if numbers:
+            scale = max(abs(x), abs(y))
+            distance += ((x - y) / scale) ** 2 if scale > 0 else 0.0
+        elif x != y:
+            distance += 1.0
+
+    return distance
+
+
+def find_last_checkpoint(folder: Path) -> Optional[Tuple[Path, float]]:
+    """
+    Find the checkpoint folder with the latest time among the results of a variant. The checkpoint the variant was
+    warm started from is not a result of the variant, and is skipped.
+
+    Args:
+        folder (Path): Results folder of the variant.
+
+    Returns:
+        tuple: Checkpoint folder and its time, or None if the variant has no checkpoint.
+    """
+    checkpoints = []
+    for path in folder.rglob("Checkpoint/default_variables.json"):
+        if "warm_start" in path.relative_to(folder).parts:
+            continue
+        with open(path) as f:
+            checkpoints.append((path.parent, float(json.load(f).get("t", 0.0))))
+
+    return max(checkpoints, key=lambda checkpoint: checkpoint[1]) if checkpoints else None
+
+
+def prepare_warm_start(checkpoint_folder: Path, t: float, restart_folder: Path, variables: Dict[str, Any]) -> None:
+    """
+    Copy the checkpoint of a finished variant to the restart folder of another variant on the same mesh, with the
+    parameters of the other variant. Periodic problems are continued from the same phase of the cardiac cycle in the
+    second cycle, i.e. after the ramp of the boundary conditions.
+
+    Args:
+        checkpoint_folder (Path): Checkpoint folder of the finished variant.
+        t (float): Time of the checkpoint.
+        restart_folder (Path): Restart folder of the variant, the checkpoint is written to its Checkpoint folder.
+        variables (dict): Parameters of the variant, including the time step size dt.
+    """
+    output_folder = restart_folder / "Checkpoint"
+    output_folder.mkdir(parents=True, exist_ok=True)
+    # The XDMF files refer to the HDF5 files by name
+    for path in checkpoint_folder.glob("checkpoint_*"):
+        shutil.copyfile(path, output_folder / path.name)
+
+    with open(checkpoint_folder / "default_variables.json") as f:
+        default_variables = json.load(f)
+
+    if "T_Cycle" in variables:
+        t = variables["T_Cycle"] + t % variables["T_Cycle"]
+    default_variables.update(variables, t=t, counter=int(round(t / variables["dt"])))
+    with open(output_folder / "default_variables.json", "w") as f:
+        json.dump(default_variables, f, indent=4)
+
+
+def build_command(mpirun: str, num_processes: int, problem: str, variant_folder: Path,
+                  restart_folder: Optional[Path], variables: Dict[str, Any]) -> List[str]:
+    """
+    Build the command to run a variant, either from rest with the parameters as new arguments, or from a restart
+    folder, where the parameters are stored with the checkpoint.
+
+    Args:
+        mpirun (str): Command to run with a given number of processes, formatted with `num_processes`.
+        num_processes (int): Number of processes.
+        problem (str): Name of the problem file.
+        variant_folder (Path): Results folder of the variant.
+        restart_folder (Path, optional): Restart folder of a warm-started variant.
+        variables (dict): Parameters of the variant, without the default parameters of the problem file.
+
+    Returns:
+        list: Command to run.
+    """
+    cmd = mpirun.format(num_processes=num_processes).split() + ["turtleFSI", "-p", problem]
+    if restart_folder is not None:
+        return cmd + ["--restart-folder", str(restart_folder)]
+
+    return (cmd + ["--folder", str(variant_folder), "--sub-folder", "1", "--new-arguments"] +
+            [f"{key}={value!r}" for key, value in variables.items()])
+
+
+def run_sweep(problem: str, mesh_path: Path, variants: List[Dict[str, Any]], shared_parameters: Dict[str, Any],
+              num_processes: int, num_slots: int, mpirun: str, folder: Path, cold_start: bool = False) -> Dict:
+    """
+    Partition the mesh, compile the forms, and run the variants of a sweep, `num_slots` at a time.
+
+    Args:
+        problem (str): Name of a problem file in vasp.simulations.
+        mesh_path (Path): Path to the mesh shared by all variants.
+        variants (list): Parameters of each variant.
+        shared_parameters (dict): Parameters shared by all variants.
+        num_processes (int): Number of processes per variant.
+        num_slots (int): Number of variants running at the same time.
+        mpirun (str): Command to run with a given number of processes, formatted with `num_processes`.
+        folder (Path): Folder for the results of each variant.
+        cold_start (bool): Start every variant from rest.
+
+    Returns:
+        dict: Description of the sweep, with the parameters, warm start and wall time of each variant.
+    """
+    folder = folder.resolve()
+    folder.mkdir(parents=True, exist_ok=True)
+    mesh_path = mesh_path.resolve()
+    start = time.perf_counter()
+
+    # All variants share the JIT cache, and the forms are compiled before the variants are started
+    env = dict(os.environ)
+    env.setdefault("DIJITSO_CACHE_DIR", str(folder / "jit_cache"))
+    print(f"--- Partitioning {mesh_path.name} for {num_processes} processes")
+    subprocess.run(mpirun.format(num_processes=num_processes).split() +
+                   ["vasp-partition-mesh", "--mesh-path", str(mesh_path)], env=env, check=True)
+    print(f"--- Compiling the forms of {problem} into {env['DIJITSO_CACHE_DIR']}")
+    subprocess.run(["vasp-warm-cache", "--problem", problem, "--mesh-path", str(mesh_path), "--mpirun",
+                    mpirun.format(num_processes=num_processes), "--folder", str(folder / "warm_cache")],
+                   env=env, check=True)
+
+    problem_parameters = get_problem_parameters(import_problem(problem))
+    runs = [dict(name=f"variant_{i:03d}",
+                 parameters=dict(shared_parameters, mesh_path=str(mesh_path),
+                                 **convert_young_modulus(variant, problem_parameters)),
+                 sweep_parameters=variant) for i, variant in enumerate(variants)]
+    pending = list(runs)
+    running: List[Tuple[Dict, subprocess.Popen, Any]] = []
+    finished: List[Dict] = []
+    while pending or running:
+        # Collect the finished variants
+        for run, process, log in list(running):
+            if process.poll() is not None:
+                log.close()
+                run.update(returncode=process.returncode, wall_time=time.perf_counter() - run.pop("start"))
+                print(f"--- {run['name']} finished with return code {run['returncode']} in "
+                      f"{run['wall_time']:.1f} s")
+                running.remove((run, process, log))
+                finished.append(run)
+
+        # Start the variant closest to a successfully finished variant, or from rest
+        sources = [] if cold_start else [other for other in finished if other["returncode"] == 0]
+        while pending and len(running) < num_slots:
+            if sources:
+                run, source = min(itertools.product(pending, sources),
+                                  key=lambda pair: parameter_distance(pair[0]["sweep_parameters"],
+                                                                      pair[1]["sweep_parameters"]))
+                checkpoint = find_last_checkpoint(folder / source["name"])
+            else:
+                run, source, checkpoint = pending[0], None, None
+
+            variant_folder = folder / run["name"]
+            restart_folder = None
+            if checkpoint is not None:
+                restart_folder = variant_folder / "warm_start"
+                variables = dict(problem_parameters, **run["parameters"])
+                prepare_warm_start(checkpoint[0], checkpoint[1], restart_folder,
+                                   dict(run["parameters"], dt=variables["dt"], T=variables["T"],
+                                        folder=str(variant_folder), **({"T_Cycle": variables["T_Cycle"]}
+                                                                       if "T_Cycle" in variables else {})))
+                run["warm_start"] = source["name"]
+            else:
+                run["warm_start"] = None
+
+            cmd = build_command(mpirun, num_processes, problem, variant_folder, restart_folder, run["parameters"])
+            variant_folder.mkdir(parents=True, exist_ok=True)
+            print(f"--- Starting {run['name']}" + (f" from {run['warm_start']}" if run["warm_start"] else "") +
+                  f": {' '.join(cmd)}")
+            log = open(variant_folder / "log.txt", "w")
+            run["start"] = time.perf_counter()
+            # turtleFSI looks for the problem file in the working directory
+            process = subprocess.Popen(cmd, cwd=Path(__file__).parent, env=env, stdout=log,
+                                       stderr=subprocess.STDOUT)
+            pending.remove(run)
+            running.append((run, process, log))
+
+        time.sleep(1)
+
+    return dict(
+        vasp_version=__version__,
+        date=datetime.now().isoformat(timespec="seconds"),
+        problem=problem,
+        mesh_path=str(mesh_path),
+        num_processes=num_processes,
+        num_slots=num_slots,
+        wall_time=time.perf_counter() - start,
+        variants=[{key: run[key] for key in ["name", "sweep_parameters", "warm_start", "returncode", "wall_time"]}
+                  for run in finished],
+    )
+
+
+def main() -> None:
+    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial, and launches the parallel runs itself."
+
+    args = parse_arguments()
+    with open(args.sweep) as f:
+        variants = get_variants(json.load(f))
+    shared_parameters = {key: parse_value(value) for key, value in
+                         (argument.split("=", 1) for argument in args.new_arguments)}
+
+    sweep = run_sweep(args.problem, args.mesh_path, variants, shared_parameters, args.num_processes, args.num_slots,
+                      args.mpirun, args.folder, args.cold_start)
+
+    output = args.folder / "sweep.json"
+    with open(output, "w") as f:
+        json.dump(sweep, f, indent=4)
+    print(f"--- Ran {len(variants)} variants in {sweep['wall_time']:.1f} s, saved the summary to {output}")
+
+
+if __name__ == "__main__":
+    main()
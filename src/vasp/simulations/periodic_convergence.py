@@ -0,0 +1,127 @@
+"""
+Detection of a periodic flow, which stops a simulation once consecutive cardiac cycles agree.
+"""
+from typing import Union, Dict, Optional, Sequence
+
+import numpy as np
+from dolfin import MPI
+
+from vasp.simulations.simulation_common import checkpoint_and_stop
+
+
+class PeriodicConvergenceMonitor:
+    """
+    Monitor whether the flow has reached a periodic state, by comparing global signals, e.g. the inlet flow rate, the
+    minimum Jacobian and the probe pressures, phase by phase against the previous cycle. The signals are stored at the
+    phase of the time step they are recorded at, so signals recorded at different cadences are compared at the phases
+    where they were recorded in both cycles. When the relative difference of all signals has been below the tolerance
+    for `num_cycles` consecutive cycles, the monitor flags the run as converged, so that the problem file can write a
+    checkpoint and stop the simulation with `stop`. The signals must be global, i.e. equal on all ranks, such that all
+    ranks stop at the same time step.
+    """
+    def __init__(self, period: float, dt: float, tolerance: float, num_cycles: int = 2,
+                 signals: Sequence[str] = ("flow_rate", "min_jacobian", "probe_pressure"),
+                 verbose: bool = True) -> None:
+        """
+        Initialize the monitor.
+
+        Args:
+            period (float): Length of a cycle, which should be a multiple of `dt`.
+            dt (float): Time step size.
+            tolerance (float): Largest relative L2 difference between two consecutive cycles of a periodic signal.
+            num_cycles (int): Number of consecutive periodic cycles before the run is flagged as converged.
+            signals (list): Names of the signals to compare, e.g. the names of the telemetry records.
+            verbose (bool): Print the differences after each cycle.
+        """
+        self.dt = dt
+        self.steps_per_cycle = max(int(round(period / dt)), 1)
+        self.tolerance = tolerance
+        self.num_cycles = max(int(num_cycles), 1)
+        self.signals = list(signals)
+        self.verbose = verbose
+
+        self.cycle: Optional[int] = None
+        self.current: Dict[str, np.ndarray] = {}
+        self.previous: Dict[str, np.ndarray] = {}
+        self.num_periodic_cycles = 0
+        self.converged = False
+
+    def update(self, t: float, **values: Union[float, np.ndarray, None]) -> Optional[Dict[str, float]]:
+        """
+        Store the signals at the phase of the current time step, and compare the previous cycle with the cycle before
+        it when a new cycle starts.
+
+        Args:
+            t (float): Time.
+            **values (float or np.ndarray): Values of the signals, keyed by name. Other values are ignored, so all
+                telemetry records can be passed.
+
+        Returns:
+            dict: Relative difference of each signal between the last two cycles if a cycle was completed, else None.
+        """
+        # The first cycle covers time steps 1 to steps_per_cycle
+        cycle, phase = divmod(int(round(t / self.dt)) - 1, self.steps_per_cycle)
+
+        differences = None
+        if self.cycle is not None and cycle != self.cycle:
+            differences = self._compare_cycles()
+        self.cycle = cycle
+
+        for name in self.signals:
+            if values.get(name) is None:
+                continue
+            value = np.asarray(values[name], dtype=np.float64).ravel()
+            if name not in self.current:
+                self.current[name] = np.full((self.steps_per_cycle, value.size), np.nan)
+            self.current[name][phase] = value
+
+        return differences
+
+    def _compare_cycles(self) -> Dict[str, float]:
+        """
+        Compare the completed cycle with the cycle before it, and update the number of consecutive periodic cycles.
+
+        Returns:
+            dict: Relative L2 difference of each signal between the two cycles.
+        """
+        differences = {}
+        for name, current in self.current.items():
+            previous = self.previous.get(name)
+            if previous is None or previous.shape != current.shape:
+                continue
+            # Phases where the signal was recorded in both cycles, and probes inside the mesh
+            recorded = ~np.isnan(current) & ~np.isnan(previous)
+            if not recorded.any():
+                continue
+            difference = np.linalg.norm(current[recorded] - previous[recorded])
+            scale = np.linalg.norm(current[recorded])
+            differences[name] = float(difference / scale if scale > 0 else difference)
+
+        self.previous = self.current
+        self.current = {}
+        if not differences:
+            return differences
+
+        periodic = max(differences.values()) <= self.tolerance
+        self.num_periodic_cycles = self.num_periodic_cycles + 1 if periodic else 0
+        self.converged = self.num_periodic_cycles >= self.num_cycles
+
+        if self.verbose and MPI.rank(MPI.comm_world) == 0:
+            print(f"Cycle {self.cycle} differs from the previous cycle by " +
+                  ", ".join(f"{name}: {value:.3e}" for name, value in differences.items()) +
+                  f" ({self.num_periodic_cycles} consecutive periodic cycles)")
+
+        return differences
+
+    def stop(self, **namespace) -> Dict[str, bool]:
+        """
+        Write a checkpoint of the current state and tell turtleFSI to stop the time loop.
+
+        Args:
+            **namespace: The turtleFSI namespace, as passed to `post_solve`.
+
+        Returns:
+            dict: Variables to update the turtleFSI namespace with.
+        """
+        return checkpoint_and_stop(f"The flow has been periodic for {self.num_periodic_cycles} consecutive cycles "
+                                   f"with tolerance {self.tolerance}.", **namespace)
@@ -6,8 +6,11 @@ this deformation as an approximate "zero-pressure" geometry, using "predeform_me
 """
 import numpy as np
 from turtleFSI.problems import *
-from dolfin import HDF5File, Mesh, MeshFunction, assemble, UserExpression, FacetNormal, ds, \
-    DirichletBC, Measure, inner, parameters, SpatialCoordinate, Constant, facets, sqrt
+from dolfin import assemble, Constant, FacetNormal, ds, DirichletBC, Measure, inner, parameters
+
+from vasp.simulations.boundary_conditions import ParabolicInletProfile
+from vasp.simulations.regions import remark_entities, region_from_parameters
+from vasp.simulations.simulation_common import load_mesh_and_data
 
 # set compiler arguments
 parameters["form_compiler"]["quadrature_degree"] = 6
@@ -42,6 +45,7 @@ def set_problem_parameters(default_variables, **namespace):
             recompute_tstep=20,  # Recompute the Jacobian matix over time steps
             # boundary condition parameters
             mesh_path="mesh/cylinder.h5",
+            partition_folder=None,  # Folder of vasp-partition-mesh output, default <mesh folder>/Partitions
             inlet_id=2,  # inlet id for the fluid
             inlet_outlet_s_id=11,  # inlet and outlet id for solid
             fsi_id=22,  # id for fsi interface
@@ -79,54 +83,27 @@ def set_problem_parameters(default_variables, **namespace):
     return default_variables
 
 
-def get_mesh_domain_and_boundaries(mesh_path, fsi_region, fsi_id, rigid_id, outer_wall_id, **namespace):
+def get_mesh_domain_and_boundaries(mesh_path, partition_folder, fsi_region, fsi_id, rigid_id, outer_wall_id,
+                                   **namespace):
 
     # Read mesh
-    mesh = Mesh()
-    hdf = HDF5File(mesh.mpi_comm(), mesh_path, "r")
-    hdf.read(mesh, "/mesh", False)
-    boundaries = MeshFunction("size_t", mesh, 2)
-    hdf.read(boundaries, "/boundaries")
-    domains = MeshFunction("size_t", mesh, 3)
-    hdf.read(domains, "/domains")
-
-    # Only consider FSI in domain within this sphere
-    sph_x = fsi_region[0]
-    sph_y = fsi_region[1]
-    sph_z = fsi_region[2]
-    sph_rad = fsi_region[3]
-
-    i = 0
-    for submesh_facet in facets(mesh):
-        idx_facet = boundaries.array()[i]
-        if idx_facet == fsi_id or idx_facet == outer_wall_id:
-            mid = submesh_facet.midpoint()
-            dist_sph_center = sqrt((mid.x() - sph_x) ** 2 + (mid.y() - sph_y) ** 2 + (mid.z() - sph_z) ** 2)
-            if dist_sph_center > sph_rad:
-                boundaries.array()[i] = rigid_id  # changed "fsi" idx to "rigid wall" idx
-        i += 1
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder)
+
+    # Only consider FSI in domain within this sphere, i.e. change "fsi" and "outer" idx to "rigid wall" idx outside
+    remark_entities(boundaries, region_from_parameters(fsi_region), {fsi_id: rigid_id, outer_wall_id: rigid_id})
 
     return mesh, domains, boundaries
 
 
-class VelInPara(UserExpression):
-    def __init__(self, t, t_start, t_end, v_max_final, n, dsi, mesh, **kwargs):
+class VelInPara(ParabolicInletProfile):
+    def __init__(self, t, t_start, t_end, v_max_final, n, dsi, mesh, V):
         self.t = t
         self.t_start = t_start
         self.t_end = t_end
         self.v_max_final = v_max_final
         self.v = 0.0
-        self.n = n
-        self.dsi = dsi
-        self.d = mesh.geometry().dim()
-        self.x = SpatialCoordinate(mesh)
-        # Compute area of boundary tesselation by integrating 1.0 over all facets
-        self.A = assemble(Constant(1.0, name="one") * self.dsi)
-        # Compute barycenter by integrating x components over all facets
-        self.c = [assemble(self.x[i] * self.dsi) / self.A for i in range(self.d)]
-        # Compute radius by taking max radius of boundary points
-        self.r = np.sqrt(self.A / np.pi)
-        super().__init__(**kwargs)
+        # Tabulate the parabolic profile on V once, the boundary values are then given by self.function
+        super().__init__(V, n, dsi, mesh)
 
     def update(self, t):
         self.t = t
@@ -138,32 +115,20 @@ class VelInPara(UserExpression):
         else:
             ramp_factor = 1.0
         self.v = ramp_factor * self.v_max_final
+        self.set_scale(self.v)
 
         if MPI.rank(MPI.comm_world) == 0:
             print("v (centerline, at inlet) = {} m/s".format(self.v))
 
-    def eval(self, value, x):
-        r2 = (
-            (x[0] - self.c[0]) ** 2 + (x[1] - self.c[1]) ** 2 + (x[2] - self.c[2]) ** 2
-        )  # radius**2
-        fact_r = 1 - (r2 / self.r**2)
-
-        value[0] = -self.n[0] * (self.v) * fact_r  # *self.t
-        value[1] = -self.n[1] * (self.v) * fact_r  # *self.t
-        value[2] = -self.n[2] * (self.v) * fact_r  # *self.t
-
-    def value_shape(self):
-        return (3,)
 
-
-class InnerP(UserExpression):
-    def __init__(self, t, t_start, t_end, P_final, **kwargs):
+class InnerP(Constant):
+    def __init__(self, t, t_start, t_end, P_final):
         self.t = t
         self.t_start = t_start
         self.t_end = t_end
         self.P_final = P_final
         self.P = 0.0
-        super().__init__(**kwargs)
+        super().__init__(self.P)
 
     def update(self, t):
         self.t = t
@@ -175,21 +140,16 @@ class InnerP(UserExpression):
         else:
             ramp_factor = 1.0
         self.P = ramp_factor * self.P_final
+        self.assign(self.P)
 
         if MPI.rank(MPI.comm_world) == 0:
             print("P = {} Pa".format(self.P))
 
-    def eval(self, value, x):
-        value[0] = self.P
-
-    def value_shape(self):
-        return ()
-
 
 def create_bcs(DVP, mesh, boundaries, t_start_v, t_end_v, t_start_p, t_end_p, P_final,
                v_max_final, fsi_id, inlet_id, inlet_outlet_s_id, rigid_id, psi, F_solid_linear, **namespace):
     # Apply pressure at the fsi interface by modifying the variational form
-    p_out_bc_val = InnerP(t=0.0, t_start=t_start_p, t_end=t_end_p, P_final=P_final, degree=2)
+    p_out_bc_val = InnerP(t=0.0, t_start=t_start_p, t_end=t_end_p, P_final=P_final)
     dSS = Measure("dS", domain=mesh, subdomain_data=boundaries)
     n = FacetNormal(mesh)
     # defined on the reference domain
@@ -205,8 +165,8 @@ def create_bcs(DVP, mesh, boundaries, t_start_v, t_end_v, t_start_p, t_end_p, P_
 
     # Parabolic Inlet Velocity Profile
     u_inflow_exp = VelInPara(t=0.0, t_start=t_start_v, t_end=t_end_v, v_max_final=v_max_final,
-                             n=normal, dsi=dsi, mesh=mesh, degree=3)
-    u_inlet = DirichletBC(DVP.sub(1), u_inflow_exp, boundaries, inlet_id)
+                             n=normal, dsi=dsi, mesh=mesh, V=DVP.sub(1).collapse())
+    u_inlet = DirichletBC(DVP.sub(1), u_inflow_exp.function, boundaries, inlet_id)
     u_inlet_s = DirichletBC(
         DVP.sub(1), ((0.0, 0.0, 0.0)), boundaries, inlet_outlet_s_id)
 
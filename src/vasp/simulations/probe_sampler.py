@@ -0,0 +1,197 @@
+"""
+Sampling of the solution at probe points, with one collective evaluation of all points per time step.
+"""
+import json
+from typing import Union, Tuple, Dict, Optional
+from pathlib import Path
+
+import numpy as np
+from mpi4py import MPI as mpi
+from dolfin import Mesh, Function, Point, Cell
+
+
+class ProbeSampler:
+    """
+    Batched and collective evaluation of functions at a fixed set of probe points.
+
+    The cell (and thereby the rank) owning each probe point is located once with the bounding box tree of the mesh,
+    and the basis functions of the owning cells are tabulated once per finite element. Each call to `sample` then
+    evaluates all locally owned points in one vectorized pass and combines the values from all ranks with a single
+    reduction, instead of one reduction (and one caught RuntimeError on every non-owning rank) per point and function.
+    """
+    def __init__(self, mesh: Mesh, probe_points: np.ndarray, output_path: Optional[Union[str, Path]] = None) -> None:
+        """
+        Initialize the probe sampler.
+
+        Args:
+            mesh (dolfin.Mesh): Mesh on which the sampled functions are defined.
+            probe_points (np.ndarray): Array of probe points with shape (num_points, 3).
+            output_path (str or Path, optional): Path to the binary time-series file that `write` appends to.
+                A JSON header with the same name and suffix ".json" describes the records. If None, nothing is written.
+        """
+        self.comm = mesh.mpi_comm()
+        self.rank = self.comm.Get_rank()
+        self.probe_points = np.asarray(probe_points, dtype=float).reshape(-1, mesh.geometry().dim())
+        self.num_points = self.probe_points.shape[0]
+        self.output_path = Path(output_path) if output_path is not None else None
+
+        # Only consider cells owned by this rank, such that each point is evaluated on a single rank
+        tdim = mesh.topology().dim()
+        num_owned_cells = mesh.topology().ghost_offset(tdim)
+        tree = mesh.bounding_box_tree()
+        local_cells = np.full(self.num_points, -1, dtype=np.int64)
+        for i, point in enumerate(self.probe_points):
+            cell_index = tree.compute_first_entity_collision(Point(*point))
+            if cell_index < num_owned_cells:
+                local_cells[i] = cell_index
+
+        # Points located on a partition boundary are assigned to the lowest rank containing them
+        num_ranks = self.comm.Get_size()
+        candidate_owner = np.where(local_cells >= 0, self.rank, num_ranks).astype(np.int32)
+        owner = np.empty_like(candidate_owner)
+        self.comm.Allreduce(candidate_owner, owner, op=mpi.MIN)
+
+        self.points_found = owner < num_ranks
+        self._local_points = np.flatnonzero(owner == self.rank)
+        self._local_cells = local_cells[self._local_points]
+        self._mesh = mesh
+        self._tabulated: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+        if self.rank == 0 and not self.points_found.all():
+            print(f"Warning: Probe points {np.flatnonzero(~self.points_found).tolist()} are outside the mesh.")
+
+    def _tabulate(self, f: Function) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tabulate the cell dofs and basis function values at the locally owned probe points.
+        The result is cached per finite element, so that functions living in (possibly re-created) function spaces
+        with the same element share the tabulation.
+
+        Args:
+            f (dolfin.Function): Function to be evaluated.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Cell dofs with shape (num_local_points, space_dim) and basis function
+                values with shape (num_local_points, value_size, space_dim).
+        """
+        V = f.function_space()
+        element = V.element()
+        key = element.signature()
+        if key not in self._tabulated:
+            value_size = f.value_size()
+            space_dim = element.space_dimension()
+            dofmap = V.dofmap()
+            cell_dofs = np.empty((len(self._local_cells), space_dim), dtype=np.intc)
+            basis = np.empty((len(self._local_cells), value_size, space_dim))
+            for k, (point_index, cell_index) in enumerate(zip(self._local_points, self._local_cells)):
+                cell = Cell(self._mesh, int(cell_index))
+                values = element.evaluate_basis_all(self.probe_points[point_index], cell.get_vertex_coordinates(),
+                                                    cell.orientation())
+                basis[k] = values.reshape(space_dim, value_size).T
+                cell_dofs[k] = dofmap.cell_dofs(int(cell_index))
+            self._tabulated[key] = (cell_dofs, basis)
+
+        return self._tabulated[key]
+
+    def _evaluate_local(self, f: Function) -> np.ndarray:
+        """
+        Evaluate a function at the locally owned probe points.
+
+        Args:
+            f (dolfin.Function): Function to be evaluated.
+
+        Returns:
+            np.ndarray: Function values with shape (num_local_points, value_size).
+        """
+        cell_dofs, basis = self._tabulate(f)
+        if cell_dofs.size == 0:
+            return np.zeros((0, f.value_size()))
+
+        # Local indices also cover ghost dofs of cells on the partition boundary
+        coefficients = f.vector().get_local(cell_dofs.ravel()).reshape(cell_dofs.shape)
+
+        return np.einsum("pvd,pd->pv", basis, coefficients)
+
+    def sample(self, **functions: Function) -> Dict[str, np.ndarray]:
+        """
+        Evaluate functions at all probe points with a single collective reduction.
+
+        Args:
+            **functions (dolfin.Function): Functions to be evaluated, keyed by the name used in the output.
+
+        Returns:
+            Dict[str, np.ndarray]: Values of each function with shape (num_points, value_size), available on all
+                ranks. Points outside the mesh are set to NaN.
+        """
+        names = list(functions.keys())
+        value_sizes = [functions[name].value_size() for name in names]
+        local_values = np.zeros((self.num_points, sum(value_sizes)))
+        offset = 0
+        for name, value_size in zip(names, value_sizes):
+            local_values[self._local_points, offset:offset + value_size] = self._evaluate_local(functions[name])
+            offset += value_size
+
+        global_values = np.zeros_like(local_values)
+        self.comm.Allreduce(local_values, global_values, op=mpi.SUM)
+        global_values[~self.points_found] = np.nan
+
+        split_values = np.split(global_values, np.cumsum(value_sizes)[:-1], axis=1)
+
+        return dict(zip(names, split_values))
+
+    def write(self, t: float, values: Dict[str, np.ndarray]) -> None:
+        """
+        Append one time step of sampled values to the binary time-series file. Each record consists of the time
+        followed by the flattened values of each function, stored as float64. The layout of the records is
+        described by the JSON header, which is created together with the file. Restarted simulations keep
+        appending to the same file.
+
+        Args:
+            t (float): Current time.
+            values (Dict[str, np.ndarray]): Sampled values as returned by `sample`.
+        """
+        if self.output_path is None or self.rank != 0:
+            return
+
+        header = {"num_points": self.num_points,
+                  "fields": [[name, int(value.shape[1])] for name, value in values.items()]}
+        header_path = self.output_path.with_suffix(".json")
+        if not header_path.exists():
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(header_path, "w") as f:
+                json.dump(header, f)
+
+        record = np.concatenate([[t]] + [value.ravel() for value in values.values()]).astype(np.float64)
+        with open(self.output_path, "ab") as f:
+            record.tofile(f)
+
+
+def load_probe_time_series(output_path: Union[str, Path]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Load a binary probe time-series file written by `ProbeSampler.write`.
+
+    Args:
+        output_path (str or Path): Path to the binary time-series file.
+
+    Returns:
+        Tuple[np.ndarray, Dict[str, np.ndarray]]:
+            A tuple containing:
+            - times (np.ndarray): Time of each record with shape (num_records,).
+            - values (dict): Values of each function with shape (num_records, num_points, value_size).
+    """
+    output_path = Path(output_path)
+    with open(output_path.with_suffix(".json")) as f:
+        header = json.load(f)
+
+    num_points = header["num_points"]
+    record_size = 1 + num_points * sum(value_size for _, value_size in header["fields"])
+    records = np.fromfile(output_path, dtype=np.float64)
+    records = records[:records.size - records.size % record_size].reshape(-1, record_size)
+
+    values = {}
+    offset = 1
+    for name, value_size in header["fields"]:
+        size = num_points * value_size
+        values[name] = records[:, offset:offset + size].reshape(-1, num_points, value_size)
+        offset += size
+
+    return records[:, 0], values
@@ -0,0 +1,214 @@
+"""
+Output of the solution at the mesh vertices inside a region of interest, at a higher cadence than the visualization
+output of the whole domain.
+"""
+from typing import List, Union, Tuple, Dict, Optional, Sequence
+from pathlib import Path
+
+import h5py
+import numpy as np
+from dolfin import Mesh, MeshFunction, Function
+
+from vasp.simulations.regions import Region
+
+
+class RegionWriter:
+    """
+    Output of fields at the mesh vertices inside a region of interest, e.g. the aneurysm sac, in a compact
+    time-major layout. This allows writing the region at a high temporal resolution, while the whole domain is only
+    written at a low cadence. The vertices are selected with a region predicate and/or domain ids, or all vertices
+    are written if neither is given. The values are read directly from the vertex dofs, gathered on rank 0, and
+    appended every `flush_interval` calls to `write` to an HDF5 file with the datasets "coordinates" with shape
+    (num_vertices, 3), "time" with shape (num_times,), and one dataset per field with shape
+    (num_times, num_vertices, value_size). An XDMF file with the same name, written by `write_xdmf`, describes each
+    time step as a point cloud for visualization in ParaView.
+    """
+    def __init__(self, mesh: Mesh, output_path: Union[str, Path], region: Optional[Region] = None,
+                 domains: Optional[MeshFunction] = None, domain_ids: Optional[Sequence[int]] = None,
+                 flush_interval: int = 10) -> None:
+        """
+        Initialize the region writer.
+
+        Args:
+            mesh (dolfin.Mesh): Mesh on which the written functions are defined.
+            output_path (str or Path): Path to the HDF5 file. Time steps are appended if the file already exists.
+            region (Region, optional): Region predicate, e.g. from `region_from_parameters`.
+            domains (dolfin.MeshFunction, optional): Cell markers, used together with `domain_ids`.
+            domain_ids (list, optional): Only write the vertices of cells marked with one of these ids.
+            flush_interval (int): Number of calls to `write` between each write to the file.
+        """
+        self.mesh = mesh
+        self.comm = mesh.mpi_comm()
+        self.rank = self.comm.Get_rank()
+        self.output_path = Path(output_path)
+        self.flush_interval = max(int(flush_interval), 1)
+
+        # Only regular (non-ghost) vertices are considered, vertices shared between ranks are removed on rank 0
+        num_vertices = mesh.topology().ghost_offset(0)
+        selected = np.ones(num_vertices, dtype=bool)
+        if domain_ids is not None:
+            tdim = mesh.topology().dim()
+            mesh.init(tdim, 0)
+            cell_vertices = mesh.topology()(tdim, 0)().reshape(-1, tdim + 1)
+            cells = np.isin(domains.array(), np.atleast_1d(domain_ids))
+            in_domain = np.zeros(mesh.num_vertices(), dtype=bool)
+            in_domain[cell_vertices[cells].ravel()] = True
+            selected &= in_domain[:num_vertices]
+        if region is not None:
+            selected &= region(mesh.coordinates()[:num_vertices])
+        self.vertices = np.flatnonzero(selected).astype(np.uintp)
+
+        global_indices = mesh.topology().global_indices(0)[self.vertices].astype(np.int64)
+        all_global_indices = self.comm.gather(global_indices, root=0)
+        all_coordinates = self.comm.gather(mesh.coordinates()[self.vertices], root=0)
+        self.num_local = self.comm.gather(len(self.vertices), root=0)
+        if self.rank == 0:
+            unique_indices, self._positions = np.unique(np.concatenate(all_global_indices), return_inverse=True)
+            self.num_points = len(unique_indices)
+            self.coordinates = np.empty((self.num_points, mesh.geometry().dim()))
+            self.coordinates[self._positions] = np.concatenate(all_coordinates)
+
+        self._vertex_dofs: Dict[str, np.ndarray] = {}
+        self._times: List[float] = []
+        self._buffer: Dict[str, List[np.ndarray]] = {}
+
+    def _dofs(self, f: Function) -> np.ndarray:
+        """
+        Get the local dofs at the selected vertices, cached per function space.
+
+        Args:
+            f (dolfin.Function): Function with dofs at the vertices, e.g. a continuous Lagrange function.
+
+        Returns:
+            np.ndarray: Local dofs with shape (num_local_vertices, value_size).
+        """
+        V = f.function_space()
+        key = V.element().signature()
+        if key not in self._vertex_dofs:
+            dofs = V.dofmap().entity_dofs(self.mesh, 0, self.vertices)
+            self._vertex_dofs[key] = np.asarray(dofs, dtype=np.intc).reshape(len(self.vertices), -1)
+
+        return self._vertex_dofs[key]
+
+    def write(self, t: float, **functions: Function) -> None:
+        """
+        Add the values of functions at the selected vertices at a given time.
+
+        Args:
+            t (float): Time.
+            **functions (dolfin.Function): Functions to be written, keyed by the dataset name.
+        """
+        for name, f in functions.items():
+            dofs = self._dofs(f)
+            local_values = f.vector().get_local(dofs.ravel()).reshape(dofs.shape)
+            all_values = self.comm.gather(local_values, root=0)
+            if self.rank == 0:
+                values = np.empty((self.num_points, dofs.shape[1]))
+                values[self._positions] = np.concatenate(all_values)
+                self._buffer.setdefault(name, []).append(values)
+
+        if self.rank == 0:
+            self._times.append(t)
+            if len(self._times) >= self.flush_interval:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Append the buffered time steps to the HDF5 file.
+        """
+        if self.rank != 0 or not self._times:
+            return
+
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.output_path, "a") as f:
+            if "coordinates" not in f:
+                f["coordinates"] = self.coordinates
+                f.create_dataset("time", shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(1024,))
+            elif f["coordinates"].shape != self.coordinates.shape:
+                raise ValueError(f"{self.output_path} contains {f['coordinates'].shape[0]} vertices, "
+                                 f"expected {self.num_points}.")
+
+            size = f["time"].shape[0]
+            f["time"].resize((size + len(self._times),))
+            f["time"][size:] = self._times
+            for name, rows in self._buffer.items():
+                values = np.stack(rows)
+                if name not in f:
+                    # One chunk holds a block of time steps of all vertices, matching the time-major layout
+                    chunk_steps = min(self.flush_interval, max(1, 2 ** 19 // values[0].size))
+                    f.create_dataset(name, shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                                     dtype=np.float64, chunks=(chunk_steps,) + values.shape[1:])
+                f[name].resize(size + len(rows), axis=0)
+                f[name][size:] = values
+
+        self._times = []
+        self._buffer = {}
+
+    def write_xdmf(self) -> None:
+        """
+        Write the XDMF file describing each time step in the HDF5 file as a point cloud, with a hyperslab of the
+        field datasets per time step. Since the XDMF file grows with the number of time steps, it is only
+        rewritten when calling this function, e.g. at checkpoints and at the end of the simulation.
+        """
+        if self.rank != 0 or not self.output_path.exists():
+            return
+
+        with h5py.File(self.output_path, "r") as f:
+            times = f["time"][()]
+            fields = {name: f[name].shape[2] for name in f if name not in ["coordinates", "time"]}
+
+        h5_name = self.output_path.name
+        num_points = self.num_points
+        num_times = len(times)
+        grids = []
+        for i, t in enumerate(times):
+            attributes = []
+            for name, value_size in fields.items():
+                attribute_type = "Scalar" if value_size == 1 else "Vector"
+                attributes.append(f"""
+        <Attribute Name="{name}" AttributeType="{attribute_type}" Center="Node">
+          <DataItem ItemType="HyperSlab" Dimensions="{num_points} {value_size}">
+            <DataItem Dimensions="3 3" Format="XML">{i} 0 0 1 1 1 1 {num_points} {value_size}</DataItem>
+            <DataItem Dimensions="{num_times} {num_points} {value_size}" Format="HDF">{h5_name}:/{name}</DataItem>
+          </DataItem>
+        </Attribute>""")
+            grids.append(f"""
+      <Grid Name="region" GridType="Uniform">
+        <Time Value="{float(t)!r}"/>
+        <Topology TopologyType="Polyvertex" NumberOfElements="{num_points}"/>
+        <Geometry GeometryType="XYZ">
+          <DataItem Dimensions="{num_points} 3" Format="HDF">{h5_name}:/coordinates</DataItem>
+        </Geometry>{"".join(attributes)}
+      </Grid>""")
+
+        self.output_path.with_suffix(".xdmf").write_text(f"""<?xml version="1.0"?>
+<Xdmf Version="3.0">
+  <Domain>
+    <Grid Name="TimeSeries" GridType="Collection" CollectionType="Temporal">{"".join(grids)}
+    </Grid>
+  </Domain>
+</Xdmf>
+""")
+
+    def close(self) -> None:
+        """
+        Append the buffered time steps to the HDF5 file and write the XDMF file.
+        """
+        self.flush()
+        self.write_xdmf()
+
+
+def load_region_output(output_path: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Load the output written by `RegionWriter`.
+
+    Args:
+        output_path (str or Path): Path to the HDF5 file.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]: Coordinates with shape (num_vertices, 3), times with
+            shape (num_times,), and values of each field with shape (num_times, num_vertices, value_size).
+    """
+    with h5py.File(output_path, "r") as f:
+        fields = {name: f[name][()] for name in f if name not in ["coordinates", "time"]}
+        return f["coordinates"][()], f["time"][()], fields
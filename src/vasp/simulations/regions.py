@@ -0,0 +1,171 @@
+"""
+Regions of the mesh given as predicates of the coordinates, e.g. spheres, boxes and cylinders, and vectorized
+re-marking of the mesh entities inside them.
+"""
+from typing import Dict, Optional, Callable, Sequence
+
+import numpy as np
+from dolfin import Mesh, MeshFunction
+
+
+Region = Callable[[np.ndarray], np.ndarray]
+
+
+def sphere_region(center: Sequence[float], radius: float) -> Region:
+    """
+    Create a predicate for points inside a sphere.
+
+    Args:
+        center (list): x, y, and z coordinate of the sphere center.
+        radius (float): Radius of the sphere.
+
+    Returns:
+        Region: Function mapping an array of points with shape (num_points, 3) to a boolean mask.
+    """
+    center_array = np.asarray(center, dtype=float)
+
+    def inside(points: np.ndarray) -> np.ndarray:
+        return np.sum((points - center_array) ** 2, axis=1) <= radius ** 2
+
+    return inside
+
+
+def box_region(lower: Sequence[float], upper: Sequence[float]) -> Region:
+    """
+    Create a predicate for points inside an axis-aligned box. Use +/- np.inf to leave a direction unbounded.
+
+    Args:
+        lower (list): Lower x, y, and z bounds of the box.
+        upper (list): Upper x, y, and z bounds of the box.
+
+    Returns:
+        Region: Function mapping an array of points with shape (num_points, 3) to a boolean mask.
+    """
+    lower_array = np.asarray(lower, dtype=float)
+    upper_array = np.asarray(upper, dtype=float)
+
+    def inside(points: np.ndarray) -> np.ndarray:
+        return np.all((points >= lower_array) & (points <= upper_array), axis=1)
+
+    return inside
+
+
+def cylinder_region(start: Sequence[float], end: Sequence[float], radius: float) -> Region:
+    """
+    Create a predicate for points inside a finite cylinder.
+
+    Args:
+        start (list): x, y, and z coordinate of the center of the first end cap.
+        end (list): x, y, and z coordinate of the center of the second end cap.
+        radius (float): Radius of the cylinder.
+
+    Returns:
+        Region: Function mapping an array of points with shape (num_points, 3) to a boolean mask.
+    """
+    start_array = np.asarray(start, dtype=float)
+    axis = np.asarray(end, dtype=float) - start_array
+    length_squared = np.dot(axis, axis)
+
+    def inside(points: np.ndarray) -> np.ndarray:
+        relative = points - start_array
+        # Normalized position along the axis, 0 at start and 1 at end
+        s = relative @ axis / length_squared
+        distance_squared = np.sum(relative ** 2, axis=1) - s ** 2 * length_squared
+        return (s >= 0) & (s <= 1) & (distance_squared <= radius ** 2)
+
+    return inside
+
+
+def union_region(*regions: Region) -> Region:
+    """
+    Create a predicate for points inside any of the given regions.
+
+    Args:
+        *regions (Region): Regions to combine.
+
+    Returns:
+        Region: Function mapping an array of points with shape (num_points, 3) to a boolean mask.
+    """
+    def inside(points: np.ndarray) -> np.ndarray:
+        mask = np.zeros(points.shape[0], dtype=bool)
+        for region in regions:
+            mask |= region(points)
+        return mask
+
+    return inside
+
+
+def region_from_parameters(region: Sequence) -> Region:
+    """
+    Create a region predicate from a problem parameter such as `fsi_region`. The type of region is given by the
+    number of values:
+
+        - 4 values: sphere, [x, y, z, radius]
+        - 6 values: box, [x_min, x_max, y_min, y_max, z_min, z_max]
+        - 7 values: cylinder, [x_start, y_start, z_start, x_end, y_end, z_end, radius]
+
+    A list of such lists defines the union of the regions.
+
+    Args:
+        region (list): Region parameters.
+
+    Returns:
+        Region: Function mapping an array of points with shape (num_points, 3) to a boolean mask.
+    """
+    if len(region) > 0 and isinstance(region[0], (list, tuple)):
+        return union_region(*[region_from_parameters(sub_region) for sub_region in region])
+
+    if len(region) == 4:
+        return sphere_region(region[:3], region[3])
+    elif len(region) == 6:
+        return box_region(region[0::2], region[1::2])
+    elif len(region) == 7:
+        return cylinder_region(region[:3], region[3:6], region[6])
+    else:
+        raise ValueError(f"Region {region} should have 4 (sphere), 6 (box) or 7 (cylinder) values.")
+
+
+def compute_entity_midpoints(mesh: Mesh, dim: int, entities: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compute the midpoints of mesh entities, i.e. the average of their vertex coordinates, for all entities at once.
+
+    Args:
+        mesh (dolfin.Mesh): Mesh object.
+        dim (int): Topological dimension of the entities (e.g. 2 for facets and 3 for cells of a 3D mesh).
+        entities (np.ndarray, optional): Local indices of the entities. If None, all entities of dimension dim.
+
+    Returns:
+        np.ndarray: Midpoints with shape (num_entities, geometric dimension).
+    """
+    mesh.init(dim, 0)
+    connectivity = mesh.topology()(dim, 0)()
+    entity_vertices = connectivity.reshape(-1, dim + 1)
+    if entities is not None:
+        entity_vertices = entity_vertices[entities]
+
+    return mesh.coordinates()[entity_vertices].mean(axis=1)
+
+
+def remark_entities(marker: MeshFunction, region: Region, id_map: Dict[int, int], inside: bool = False) -> None:
+    """
+    Change the markers of the entities whose midpoint lies outside (or inside) a region, e.g. to turn the FSI
+    interface outside the FSI region into rigid wall. Only the entities carrying one of the ids in `id_map` are
+    considered, and their midpoints are computed and tested in one vectorized pass.
+
+    Args:
+        marker (dolfin.MeshFunction): Facet or cell markers, modified in place.
+        region (Region): Region predicate, e.g. from `region_from_parameters`.
+        id_map (dict): Mapping from the old to the new id of the marked entities.
+        inside (bool, optional): If True, re-mark the entities inside the region instead of outside.
+    """
+    values = marker.array()
+    old_ids = np.array(list(id_map.keys()), dtype=values.dtype)
+    candidates = np.flatnonzero(np.isin(values, old_ids))
+    if candidates.size == 0:
+        return
+
+    midpoints = compute_entity_midpoints(marker.mesh(), marker.dim(), candidates)
+    selected = candidates[region(midpoints) == inside]
+    selected_ids = values[selected]
+    for old_id, new_id in id_map.items():
+        values[selected[selected_ids == old_id]] = new_id
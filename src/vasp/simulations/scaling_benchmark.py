@@ -0,0 +1,221 @@
+"""
+Strong and weak scaling benchmark of VaSP and turtleFSI, built on the tiny cylinder problem by default. The mesh is
+uniformly refined to the requested levels, and the problem (see cylinder_benchmark.py) is run for a fixed number of
+time steps with each requested number of processes. The time per time step, split into assembly, linear solve,
+pre_solve and post_solve, is written to a JSON file together with the speedup and parallel efficiency.
+
+For strong scaling, every refinement level is run with every number of processes, e.g.
+
+    vasp-scaling-benchmark --mesh-path tests/test_data/cylinder/cylinder.h5 --num-processes 1 2 4 8 \\
+        --refinement-levels 0 1
+
+For weak scaling, the numbers of processes and refinement levels are paired, such that the number of cells per
+process is constant when the number of processes grows by a factor eight per level, e.g.
+
+    vasp-scaling-benchmark --mesh-path tests/test_data/cylinder/cylinder.h5 --mode weak --num-processes 1 8 64 \\
+        --refinement-levels 0 1 2
+
+The linear solver strategies of solver_strategies.py can be compared with MUMPS on the same runs, also on the offset
+stenosis problem (see offset_stenosis_benchmark.py), e.g.
+
+    vasp-scaling-benchmark --problem offset_stenosis --mesh-path tests/test_data/offset_stenosis/offset_stenosis.h5 \\
+        --num-processes 1 4 --solver-strategies mumps gmres_asm fgmres_schur
+"""
+import argparse
+import itertools
+import json
+import platform
+import shlex
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from dolfin import MPI
+
+from vasp import __version__
+from vasp.simulations.simulation_common import refine_mesh_and_data
+from vasp.simulations.solver_strategies import SOLVER_STRATEGIES
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", type=str, default="cylinder", choices=["cylinder", "offset_stenosis"],
+                        help="Problem to run, see <problem>_benchmark.py")
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the mesh of the problem")
+    parser.add_argument("--mode", type=str, default="strong", choices=["strong", "weak"],
+                        help="Strong scaling runs all combinations of processes and refinement levels, weak " +
+                             "scaling pairs them")
+    parser.add_argument("--num-processes", type=int, nargs="+", default=[1, 2, 4],
+                        help="Number(s) of processes")
+    parser.add_argument("--refinement-levels", type=int, nargs="+", default=[0],
+                        help="Number(s) of uniform refinements of the mesh")
+    parser.add_argument("--solver-strategies", type=str, nargs="+", default=["mumps"],
+                        choices=list(SOLVER_STRATEGIES), help="Linear solver strategies to run")
+    parser.add_argument("--num-steps", type=int, default=10, help="Number of timed time steps per run")
+    parser.add_argument("--warmup-steps", type=int, default=1,
+                        help="Number of time steps before the timed time steps, where the forms are compiled")
+    parser.add_argument("--dt", type=float, default=0.001, help="Time step size")
+    parser.add_argument("--mpirun", type=str, default="mpirun -np {num_processes}",
+                        help="Command to run with a given number of processes")
+    parser.add_argument("--folder", type=Path, default=Path("scaling_benchmark"),
+                        help="Folder for the refined meshes, the logs and the results")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Path to the JSON file with the results (default: <folder>/<problem>_scaling_<mode>.json)")
+    return parser.parse_args()
+
+
+def get_runs(mode: str, num_processes: List[int], refinement_levels: List[int],
+             solver_strategies: Sequence[str] = ("mumps",)) -> List[Dict]:
+    """
+    Get the number of processes, refinement level and solver strategy of each run of the benchmark.
+
+    Args:
+        mode (str): "strong" for all combinations of processes and refinement levels, "weak" to pair them.
+        num_processes (list): Numbers of processes.
+        refinement_levels (list): Numbers of uniform refinements of the mesh.
+        solver_strategies (list): Linear solver strategies, each run with all processes and refinement levels.
+
+    Returns:
+        list: Number of processes, refinement level and solver strategy of each run.
+    """
+    if mode == "weak":
+        assert len(num_processes) == len(refinement_levels), \
+            "Weak scaling requires one refinement level per number of processes"
+        pairs = list(zip(refinement_levels, num_processes))
+    else:
+        pairs = list(itertools.product(refinement_levels, num_processes))
+
+    return [dict(refinement_level=level, num_processes=processes, solver_strategy=strategy)
+            for strategy in solver_strategies for level, processes in pairs]
+
+
+def add_scaling_metrics(mode: str, results: List[Dict]) -> None:
+    """
+    Add the speedup and parallel efficiency of each run, based on the mean total time per time step, relative to
+    the run with the fewest processes with the same solver strategy (and refinement level for strong scaling).
+    Runs with another solver strategy than MUMPS are also compared with the MUMPS run with the same number of
+    processes and refinement level, if any.
+
+    Args:
+        mode (str): "strong" or "weak".
+        results (list): Results of each run, as written by the benchmark problem files, updated in place.
+    """
+    for result in results:
+        group = [other for other in results if other["solver_strategy"] == result["solver_strategy"] and
+                 (mode == "weak" or other["refinement_level"] == result["refinement_level"])]
+        reference = min(group, key=lambda other: other["num_processes"])
+        time = result["time_per_step"]["total"]["mean"]
+        reference_time = reference["time_per_step"]["total"]["mean"]
+        result["speedup"] = reference_time / time
+        # With weak scaling, the ideal time per time step is constant
+        result["efficiency"] = result["speedup"] if mode == "weak" else \
+            result["speedup"] * reference["num_processes"] / result["num_processes"]
+
+        mumps = [other for other in results if other["solver_strategy"] == "mumps" and
+                 other["num_processes"] == result["num_processes"] and
+                 other["refinement_level"] == result["refinement_level"]]
+        if mumps and result["solver_strategy"] != "mumps":
+            result["speedup_over_mumps"] = mumps[0]["time_per_step"]["total"]["mean"] / time
+
+
+def run_benchmark(problem: str, mesh_path: Path, mode: str, num_processes: List[int], refinement_levels: List[int],
+                  solver_strategies: List[str], num_steps: int, warmup_steps: int, dt: float, mpirun: str,
+                  folder: Path) -> Dict:
+    """
+    Refine the mesh and run the benchmark of a problem for each number of processes, refinement level and solver
+    strategy.
+
+    Args:
+        problem (str): Name of the problem, where <problem>_benchmark.py is the benchmark problem file.
+        mesh_path (Path): Path to the mesh of the problem.
+        mode (str): "strong" or "weak" scaling.
+        num_processes (list): Numbers of processes.
+        refinement_levels (list): Numbers of uniform refinements of the mesh.
+        solver_strategies (list): Linear solver strategies.
+        num_steps (int): Number of timed time steps per run.
+        warmup_steps (int): Number of time steps before the timed time steps.
+        dt (float): Time step size.
+        mpirun (str): Command to run with a given number of processes, formatted with `num_processes`.
+        folder (Path): Folder for the refined meshes, the logs and the results of each run.
+
+    Returns:
+        dict: Description of the benchmark and the results of each run.
+    """
+    mesh_path = mesh_path.resolve()
+    folder = folder.resolve()
+
+    # Refine the mesh once per refinement level
+    mesh_paths = {}
+    for level in sorted(set(refinement_levels)):
+        if level == 0:
+            mesh_paths[level] = mesh_path
+        else:
+            print(f"--- Refining {mesh_path.name} {level} time(s)")
+            mesh_paths[level] = refine_mesh_and_data(
+                mesh_path, folder / "Mesh" / f"{mesh_path.stem}_refined{level}.h5", level)
+
+    results = []
+    for run in get_runs(mode, num_processes, refinement_levels, solver_strategies):
+        name = f"np{run['num_processes']}_refined{run['refinement_level']}_{run['solver_strategy']}"
+        run_folder = folder / name
+        run_folder.mkdir(parents=True, exist_ok=True)
+        benchmark_path = run_folder / "benchmark.json"
+        # The end time is half a time step before the last time step, so exactly warmup_steps + num_steps time
+        # steps are run
+        T = (warmup_steps + num_steps - 0.5) * dt
+        cmd = (mpirun.format(**run) + f" turtleFSI -p {problem}_benchmark -dt {dt} -T {T} --folder {run_folder}" +
+               f" --sub-folder 1 --new-arguments mesh_path={mesh_paths[run['refinement_level']]}" +
+               f" benchmark_path={benchmark_path} benchmark_warmup={warmup_steps}" +
+               f" refinement_level={run['refinement_level']} solver_strategy={run['solver_strategy']}")
+
+        print(f"--- Running {name}: {cmd}")
+        # turtleFSI looks for the problem file in the working directory
+        with open(run_folder / "log.txt", "w") as log:
+            subprocess.run(shlex.split(cmd), cwd=Path(__file__).parent, stdout=log, stderr=subprocess.STDOUT,
+                           check=True)
+
+        with open(benchmark_path) as f:
+            result = json.load(f)
+        print(f"--- Mean time per step: {result['time_per_step']['total']['mean']:.3e} s")
+        results.append(result)
+
+    add_scaling_metrics(mode, results)
+
+    return dict(
+        vasp_version=__version__,
+        date=datetime.now().isoformat(timespec="seconds"),
+        host=platform.node(),
+        problem=problem,
+        mode=mode,
+        mesh_path=str(mesh_path),
+        num_steps=num_steps,
+        warmup_steps=warmup_steps,
+        dt=dt,
+        runs=results,
+    )
+
+
+def main() -> None:
+    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial, and launches the parallel runs itself."
+
+    args = parse_arguments()
+    benchmark = run_benchmark(args.problem, args.mesh_path, args.mode, args.num_processes, args.refinement_levels,
+                              args.solver_strategies, args.num_steps, args.warmup_steps, args.dt, args.mpirun,
+                              args.folder)
+
+    output = args.output if args.output is not None else args.folder / f"{args.problem}_scaling_{args.mode}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(benchmark, f, indent=4)
+    print(f"--- Saved scaling results to {output}")
+
+
+if __name__ == "__main__":
+    main()
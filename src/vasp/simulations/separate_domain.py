@@ -0,0 +1,119 @@
+"""
+Output of the fluid velocity and the solid displacement on separate fluid and solid meshes, as read by the
+post-processing of the fluid and solid domains.
+"""
+from typing import List, Union, Tuple
+from pathlib import Path
+
+from dolfin import Mesh, MPI, HDF5File, FunctionSpace, Function, VectorFunctionSpace, PETScDMCollection
+
+from vasp.simulations.simulation_common import refine_mesh_and_data
+
+
+def create_separate_domain_meshes(mesh_path: Union[str, Path], fluid_domain_id: Union[int, List[int]],
+                                  solid_domain_id: Union[int, List[int]], save_deg: int = 2) -> Tuple[Path, Path]:
+    """
+    Get the fluid and solid meshes that `compute_hemodynamics` and `compute_stress_strain` read the results of the
+    Visualization_separate_domain folder on, i.e. <mesh_path stem>_refined_fluid.h5 and _refined_solid.h5 for
+    save_deg=2, and <mesh_path stem>_fluid.h5 and _solid.h5 otherwise. Missing meshes are created with
+    `refine_mesh_and_data` and `separate_mesh`, which is only supported in serial.
+
+    Args:
+        mesh_path (str or Path): Path to the mesh of the simulation.
+        fluid_domain_id (int or list): ID of the fluid domain.
+        solid_domain_id (int or list): ID of the solid domain.
+        save_deg (int): Degree of the functions saved for visualisation.
+
+    Returns:
+        Tuple[Path, Path]: Paths to the fluid and solid meshes.
+    """
+    # separate_mesh is only imported by simulations writing the separate domains
+    from vasp.automatedPostprocessing.postprocessing_mesh.separate_mesh import separate_mesh
+
+    mesh_path = Path(mesh_path)
+    if save_deg == 2:
+        refined_mesh_path = mesh_path.with_name(mesh_path.stem + "_refined.h5")
+    else:
+        refined_mesh_path = mesh_path
+    fluid_mesh_path = refined_mesh_path.with_name(refined_mesh_path.stem + "_fluid.h5")
+    solid_mesh_path = refined_mesh_path.with_name(refined_mesh_path.stem + "_solid.h5")
+
+    if not fluid_mesh_path.exists() or not solid_mesh_path.exists():
+        assert MPI.size(MPI.comm_world) == 1, f"Fluid and solid meshes {fluid_mesh_path} and {solid_mesh_path} " \
+            "not found. Make sure to create them by running the simulation in serial first."
+        if not refined_mesh_path.exists():
+            refine_mesh_and_data(mesh_path, refined_mesh_path, 1)
+        separate_mesh(refined_mesh_path, fluid_domain_id, solid_domain_id)
+
+    return fluid_mesh_path, solid_mesh_path
+
+
+class SeparateDomainWriter:
+    """
+    Output of the fluid velocity and the solid displacement in the Visualization_separate_domain layout read by
+    `compute_hemodynamics` and `compute_stress_strain`, written directly from the simulation instead of extracting
+    them from the visualization files with `create_hdf5` in serial. The velocity and displacement are interpolated
+    onto continuous linear functions on the fluid and solid meshes from `create_separate_domain_meshes` with transfer
+    matrices assembled once, which for save_deg=2 gives the same values as the visualization files of turtleFSI on
+    the refined mesh, and appended to u.h5 ("/velocity") and d_solid.h5 ("/displacement"). The fluid mesh is
+    written as mesh.h5 in the same folder, as by `create_hdf5`.
+    """
+    def __init__(self, V: FunctionSpace, D: FunctionSpace, fluid_mesh_path: Union[str, Path],
+                 solid_mesh_path: Union[str, Path], output_folder: Union[str, Path]) -> None:
+        """
+        Initialize the separate domain writer, and create the output files.
+
+        Args:
+            V (dolfin.FunctionSpace): Velocity function space on the FSI mesh.
+            D (dolfin.FunctionSpace): Displacement function space on the FSI mesh.
+            fluid_mesh_path (str or Path): Path to the fluid mesh.
+            solid_mesh_path (str or Path): Path to the solid mesh.
+            output_folder (str or Path): Folder for u.h5, d_solid.h5 and mesh.h5, e.g. Visualization_separate_domain.
+        """
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        self.comm = MPI.comm_world
+
+        self.functions = {}
+        self.transfer_matrices = {}
+        self.files = {}
+        for name, space, mesh_path, file_name in [("velocity", V, fluid_mesh_path, "u.h5"),
+                                                  ("displacement", D, solid_mesh_path, "d_solid.h5")]:
+            mesh = Mesh()
+            with HDF5File(self.comm, str(mesh_path), "r") as mesh_file:
+                mesh_file.read(mesh, "mesh", False)
+            if name == "velocity":
+                with HDF5File(self.comm, str(output_folder / "mesh.h5"), "w") as mesh_file:
+                    mesh_file.write(mesh, "mesh")
+
+            self.functions[name] = Function(VectorFunctionSpace(mesh, "CG", 1))
+            self.transfer_matrices[name] = PETScDMCollection.create_transfer_matrix(space, self.functions[name]
+                                                                                    .function_space())
+            self.files[name] = HDF5File(self.comm, str(output_folder / file_name), "w")
+
+    def write(self, t: float, v: Function, d: Function) -> None:
+        """
+        Append the fluid velocity and the solid displacement at a given time.
+
+        Args:
+            t (float): Time.
+            v (dolfin.Function): Velocity on the FSI mesh.
+            d (dolfin.Function): Displacement on the FSI mesh.
+        """
+        for name, f in [("velocity", v), ("displacement", d)]:
+            self.functions[name].vector()[:] = self.transfer_matrices[name] * f.vector()
+            self.files[name].write(self.functions[name], f"/{name}", t)
+
+    def flush(self) -> None:
+        """
+        Flush the output files, e.g. at checkpoints.
+        """
+        for hdf5_file in self.files.values():
+            hdf5_file.flush()
+
+    def close(self) -> None:
+        """
+        Close the output files.
+        """
+        for hdf5_file in self.files.values():
+            hdf5_file.close()
@@ -1,20 +1,29 @@
+import hashlib
 import json
-from typing import List, Union, Tuple, NamedTuple
+from typing import List, Union, Tuple, NamedTuple, Optional, Any, Dict
 from pathlib import Path
 
+import h5py
 import numpy as np
 from mpi4py import MPI as mpi
-from dolfin import Mesh, assemble, MPI, HDF5File, Measure, inner, MeshFunction, FunctionSpace, \
-    Function, sqrt, Expression, TrialFunction, TestFunction, LocalSolver, dx, UserExpression
-from turtleFSI.modules.common import J_
+from dolfin import Mesh, MPI, HDF5File, inner, MeshFunction, FunctionSpace, Function, TrialFunction, TestFunction, \
+    LocalSolver, dx, interpolate, XDMFFile, VectorFunctionSpace, parameters, refine, adapt
+from turtleFSI.utils import checkpoint
 
 
-def load_mesh_and_data(mesh_path: Union[str, Path]) -> Tuple[Mesh, MeshFunction, MeshFunction]:
+def load_mesh_and_data(mesh_path: Union[str, Path], partition_folder: Optional[Union[str, Path]] = None) \
+        -> Tuple[Mesh, MeshFunction, MeshFunction]:
     """
     Load mesh, boundary data, and domain data from an HDF5 file.
 
+    If a partitioned copy of the mesh for the current number of processes and ghost mode exists in the partition
+    folder, see `save_partitioned_mesh`, and it was created from the same mesh file, the mesh is loaded with the
+    stored partition instead of being partitioned again.
+
     Args:
         mesh_path (str or Path): Path to the HDF5 file containing mesh and data.
+        partition_folder (str or Path, optional): Folder with partitioned meshes. Defaults to
+            <mesh folder>/Partitions.
 
     Returns:
         Tuple[Mesh, MeshFunction, MeshFunction]:
@@ -25,26 +34,247 @@ def load_mesh_and_data(mesh_path: Union[str, Path]) -> Tuple[Mesh, MeshFunction,
     """
     mesh_path = Path(mesh_path)
 
+    # Use the stored partition if it is valid for this mesh file, number of processes and ghost mode
+    partition_path = get_partition_path(mesh_path, partition_folder)
+    # Check for the partition on rank 0 only, such that all ranks take the same branch into the collective
+    # is_valid_partition, even if the file system shows the file to some ranks before others
+    partition_exists = partition_path.exists() if MPI.rank(MPI.comm_world) == 0 else None
+    partition_exists = mpi.COMM_WORLD.bcast(partition_exists, root=0)
+    use_partition = partition_exists and is_valid_partition(mesh_path, partition_path)
+    if use_partition:
+        mesh_path = partition_path
+
     # Initialize an empty mesh
     mesh = Mesh()
 
     # Open the HDF5 file in read-only mode
-    hdf5 = HDF5File(mesh.mpi_comm(), str(mesh_path), "r")
-
-    # Read mesh data
-    hdf5.read(mesh, "/mesh", False)
+    with HDF5File(mesh.mpi_comm(), str(mesh_path), "r") as hdf5:
+        # Read mesh data
+        hdf5.read(mesh, "/mesh", use_partition)
 
-    # Create MeshFunction objects for boundaries and domains
-    boundaries = MeshFunction("size_t", mesh, mesh.topology().dim() - 1)
-    domains = MeshFunction("size_t", mesh, mesh.topology().dim())
+        # Create MeshFunction objects for boundaries and domains
+        boundaries = MeshFunction("size_t", mesh, mesh.topology().dim() - 1)
+        domains = MeshFunction("size_t", mesh, mesh.topology().dim())
 
-    # Read boundary and domain data
-    hdf5.read(boundaries, "/boundaries")
-    hdf5.read(domains, "/domains")
+        # Read boundary and domain data
+        hdf5.read(boundaries, "/boundaries")
+        hdf5.read(domains, "/domains")
 
     return mesh, boundaries, domains
 
 
+def compute_file_hash(path: Union[str, Path]) -> str:
+    """
+    Compute the SHA-1 hash of a file on rank 0 and broadcast it to all ranks.
+
+    Args:
+        path (str or Path): Path to the file.
+
+    Returns:
+        str: Hexadecimal SHA-1 hash of the file content.
+    """
+    file_hash = None
+    if MPI.rank(MPI.comm_world) == 0:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 24), b""):
+                sha1.update(block)
+        file_hash = sha1.hexdigest()
+
+    return mpi.COMM_WORLD.bcast(file_hash, root=0)
+
+
+def get_partition_path(mesh_path: Union[str, Path], partition_folder: Optional[Union[str, Path]] = None) -> Path:
+    """
+    Get the path of the partitioned mesh for the current number of processes.
+
+    Args:
+        mesh_path (str or Path): Path to the serial mesh file.
+        partition_folder (str or Path, optional): Folder with partitioned meshes. Defaults to
+            <mesh folder>/Partitions.
+
+    Returns:
+        Path: Path to <partition folder>/<mesh name>_np<number of processes>.h5.
+    """
+    mesh_path = Path(mesh_path)
+    partition_folder = mesh_path.parent / "Partitions" if partition_folder is None else Path(partition_folder)
+
+    return partition_folder / f"{mesh_path.stem}_np{MPI.size(MPI.comm_world)}.h5"
+
+
+def is_valid_partition(mesh_path: Union[str, Path], partition_path: Union[str, Path]) -> bool:
+    """
+    Check that a partitioned mesh was created from the current content of a mesh file, with the current number of
+    processes and ghost mode.
+
+    Args:
+        mesh_path (str or Path): Path to the serial mesh file.
+        partition_path (str or Path): Path to the partitioned mesh file.
+
+    Returns:
+        bool: True if the partitioned mesh can be used.
+    """
+    with h5py.File(partition_path, "r") as f:
+        attributes = dict(f.attrs)
+
+    return attributes.get("num_processes") == MPI.size(MPI.comm_world) and \
+        attributes.get("ghost_mode") == parameters["ghost_mode"] and \
+        attributes.get("mesh_sha1") == compute_file_hash(mesh_path)
+
+
+def save_partitioned_mesh(mesh_path: Union[str, Path], partition_folder: Optional[Union[str, Path]] = None) -> Path:
+    """
+    Partition a mesh with the current number of processes and ghost mode, and save it together with the boundary
+    and domain data, such that later runs with the same number of processes can load it with `load_mesh_and_data`
+    without partitioning it again. The hash of the mesh file is stored with the partition, so that the partition is
+    not used if the mesh file changes.
+
+    Args:
+        mesh_path (str or Path): Path to the serial mesh file.
+        partition_folder (str or Path, optional): Folder with partitioned meshes. Defaults to
+            <mesh folder>/Partitions.
+
+    Returns:
+        Path: Path to the partitioned mesh file.
+    """
+    mesh_path = Path(mesh_path)
+    partition_path = get_partition_path(mesh_path, partition_folder)
+    mesh_hash = compute_file_hash(mesh_path)
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path, partition_folder=partition_folder)
+
+    if MPI.rank(MPI.comm_world) == 0:
+        partition_path.parent.mkdir(parents=True, exist_ok=True)
+    MPI.barrier(MPI.comm_world)
+
+    # The partition of the mesh is stored by HDF5File.write when running in parallel
+    with HDF5File(mesh.mpi_comm(), str(partition_path), "w") as hdf5:
+        hdf5.write(mesh, "/mesh")
+        hdf5.write(boundaries, "/boundaries")
+        hdf5.write(domains, "/domains")
+
+    if MPI.rank(MPI.comm_world) == 0:
+        with h5py.File(partition_path, "a") as f:
+            f.attrs["num_processes"] = MPI.size(MPI.comm_world)
+            f.attrs["ghost_mode"] = parameters["ghost_mode"]
+            f.attrs["mesh_sha1"] = mesh_hash
+    MPI.barrier(MPI.comm_world)
+
+    return partition_path
+
+
+def refine_mesh_and_data(mesh_path: Union[str, Path], output_path: Union[str, Path], levels: int) -> Path:
+    """
+    Uniformly refine a mesh, transfer the boundary and domain markers to the refined mesh, and save it in the same
+    format as the original mesh, such that it can be read with `load_mesh_and_data`. Each level of refinement
+    multiplies the number of cells by eight. The probe point and mesh info files of the mesh are copied along with
+    the refined mesh. Run in serial.
+
+    Args:
+        mesh_path (str or Path): Path to the mesh file.
+        output_path (str or Path): Path to the refined mesh file.
+        levels (int): Number of uniform refinements.
+
+    Returns:
+        Path: Path to the refined mesh file.
+    """
+    mesh, boundaries, domains = load_mesh_and_data(mesh_path)
+    boundary_ids = np.unique(boundaries.array())
+
+    # The parent facets of the refined facets are needed to transfer the boundary markers
+    refinement_algorithm = parameters["refinement_algorithm"]
+    parameters["refinement_algorithm"] = "plaza_with_parent_facets"
+    for _ in range(levels):
+        refined_mesh = refine(mesh, False)
+        boundaries = adapt(boundaries, refined_mesh)
+        domains = adapt(domains, refined_mesh)
+        mesh = refined_mesh
+    parameters["refinement_algorithm"] = refinement_algorithm
+
+    # Facets created inside the original cells have no parent facet, and are left unmarked
+    values = boundaries.array()
+    values[~np.isin(values, boundary_ids)] = 0
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with HDF5File(mesh.mpi_comm(), str(output_path), "w") as hdf5:
+        hdf5.write(mesh, "/mesh")
+        hdf5.write(boundaries, "/boundaries")
+        hdf5.write(domains, "/domains")
+
+    # Probe points and mesh info are not changed by the refinement
+    mesh_path = Path(mesh_path)
+    for suffix in ["_probe_point.json", "_solid_probe.json", "_info.json"]:
+        sidecar_path = mesh_path.with_name(mesh_path.stem + suffix)
+        if sidecar_path.exists():
+            output_path.with_name(output_path.stem + suffix).write_text(sidecar_path.read_text())
+
+    return output_path
+
+
+def interpolate_checkpoint(checkpoint_folder: Union[str, Path], mesh_path: Union[str, Path],
+                           output_folder: Union[str, Path], **variables: Any) -> Path:
+    """
+    Interpolate the solution in a turtleFSI checkpoint onto another mesh of the same geometry, e.g. from a coarse to
+    a fine mesh, and write it as a turtleFSI checkpoint that a simulation on the other mesh can be restarted from.
+    Vertices of the other mesh just outside the mesh of the checkpoint, e.g. on curved walls, are extrapolated from
+    the closest cell. If the time step size is changed, the solution of the previous time step (d2, v2 and p2) is
+    interpolated linearly in time to t - dt, such that time derivatives like (d1 - d2) / dt are preserved. Run in
+    serial.
+
+    Args:
+        checkpoint_folder (str or Path): Checkpoint folder of turtleFSI, with default_variables.json and the
+            checkpoint_<name>.xdmf files of the displacement (d), velocity (v) and pressure (p).
+        mesh_path (str or Path): Path to the mesh to interpolate the solution onto.
+        output_folder (str or Path): Checkpoint folder to write the interpolated solution to.
+        **variables: Problem parameters to update in default_variables.json, e.g. the time step size.
+
+    Returns:
+        Path: Path to the output checkpoint folder.
+    """
+    checkpoint_folder = Path(checkpoint_folder)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    with open(checkpoint_folder / "default_variables.json") as f:
+        default_variables = json.load(f)
+
+    checkpoint_mesh, _, _ = load_mesh_and_data(default_variables["mesh_path"])
+    mesh, _, _ = load_mesh_and_data(mesh_path)
+    degrees = dict(d=default_variables["d_deg"], v=default_variables["v_deg"], p=default_variables["p_deg"])
+
+    allow_extrapolation = parameters["allow_extrapolation"]
+    parameters["allow_extrapolation"] = True
+    functions = {}
+    for path in sorted(checkpoint_folder.glob("checkpoint_*.xdmf")):
+        name = path.stem[len("checkpoint_"):]
+        space = FunctionSpace if name.startswith("p") else VectorFunctionSpace
+        f = Function(space(checkpoint_mesh, "CG", degrees[name[0]]))
+        with XDMFFile(checkpoint_mesh.mpi_comm(), str(path)) as xdmf:
+            xdmf.read_checkpoint(f, name)
+        functions[name] = interpolate(f, space(mesh, "CG", degrees[name[0]]))
+    parameters["allow_extrapolation"] = allow_extrapolation
+
+    # Move the previous time step from t - dt of the checkpoint to t - dt of the new time step size
+    dt = default_variables.get("dt")
+    weight = variables.get("dt", dt) / dt if dt else 1.0
+    for name, f in functions.items():
+        current = functions.get(f"{name[0]}1")
+        if name.endswith("2") and current is not None and weight != 1.0:
+            values = (1 - weight) * current.vector().get_local() + weight * f.vector().get_local()
+            f.vector().set_local(values)
+            f.vector().apply("insert")
+
+    for name, f in functions.items():
+        with XDMFFile(mesh.mpi_comm(), str(output_folder / f"checkpoint_{name}.xdmf")) as xdmf:
+            xdmf.write_checkpoint(f, name)
+
+    default_variables.update(variables, mesh_path=str(mesh_path))
+    if MPI.rank(MPI.comm_world) == 0:
+        with open(output_folder / "default_variables.json", "w") as f:
+            json.dump(default_variables, f, indent=4)
+
+    return output_folder
+
+
 class MeshInfo(NamedTuple):
     """
     Represents mesh information.
@@ -154,49 +384,33 @@ def load_solid_probe_points(mesh_path: Union[str, Path]) -> np.ndarray:
     return solid_probe_points
 
 
-def print_probe_points(v: Function, p: Function, probe_points: List[np.ndarray]) -> None:
+def print_probe_points(velocity: np.ndarray, pressure: np.ndarray) -> None:
     """
     Print velocity and pressure at probe points.
 
     Args:
-        v (dolfin.Function): Velocity function with components v.sub(0), v.sub(1), and v.sub(2).
-        p (dolfin.Function): Pressure function.
-        probe_points (list): List of probe points.
+        velocity (np.ndarray): Velocity at the probe points with shape (num_points, 3), e.g. from `ProbeSampler`.
+        pressure (np.ndarray): Pressure at the probe points with shape (num_points, 1).
 
     Returns:
         None
     """
-    # make sure that extrapolation is not allowed
-    if v.get_allow_extrapolation():
-        v.set_allow_extrapolation(False)
-
-    if p.get_allow_extrapolation():
-        p.set_allow_extrapolation(False)
-
-    for i, point in enumerate(probe_points):
-        u_eval = peval(v, [float(x) for x in point.tolist()])
-        pp = peval(p, [float(x) for x in point.tolist()])
-
-        if MPI.rank(MPI.comm_world) == 0:
-            print(f"Probe Point {i}: Velocity: ({u_eval[0]}, {u_eval[1]}, {u_eval[2]}) | Pressure: {pp}")
+    if MPI.rank(MPI.comm_world) == 0:
+        for i, (u_eval, pp) in enumerate(zip(velocity, pressure)):
+            print(f"Probe Point {i}: Velocity: ({u_eval[0]}, {u_eval[1]}, {u_eval[2]}) | Pressure: {pp[0]}")
 
 
-def print_solid_probe_points(d: Function, probe_points: List[np.ndarray]) -> None:
+def print_solid_probe_points(displacement: np.ndarray) -> None:
     """
     Print displacement at probe points.
 
     Args:
-        d (dolfin.Function): Displacement function with components d.sub(0), d.sub(1), and d.sub(2).
-        probe_points (list): List of probe points.
+        displacement (np.ndarray): Displacement at the probe points with shape (num_points, 3),
+            e.g. from `ProbeSampler`.
     """
-    # make sure that extrapolation is not allowed
-    if d.get_allow_extrapolation():
-        d.set_allow_extrapolation(False)
-
-    for i, point in enumerate(probe_points):
-        d_eval = peval(d, [float(x) for x in point.tolist()])
-        if MPI.rank(MPI.comm_world) == 0:
-            print(f"Probe Point {i}: Displacement: {d_eval[0], d_eval[1], d_eval[2]}")
+    if MPI.rank(MPI.comm_world) == 0:
+        for i, d_eval in enumerate(displacement):
+            print(f"Probe Point {i}: Displacement: ({d_eval[0]}, {d_eval[1]}, {d_eval[2]})")
 
 
 def peval(f: Function, x: Union[float, List[float]]) -> np.ndarray:
@@ -250,152 +464,42 @@ def local_project(f: Function, V: FunctionSpace, local_rhs: bool = False) -> Fun
     return projected_u
 
 
-def calculate_and_print_flow_properties(dt: float, mesh: Mesh, v: Function, inlet_area: float, mu_f: float,
-                                        rho_f: float, n: Expression, dsi: Measure, local_rhs: bool = False) -> None:
+def checkpoint_and_stop(message: str, **namespace) -> Dict[str, bool]:
     """
-    Calculate and print flow properties.
+    Write a checkpoint of the current state and tell turtleFSI to stop the time loop, e.g. when a monitor flags the
+    run as collapsed or converged in `post_solve`.
 
     Args:
-        dt (float): Time step size.
-        mesh (dolfin.Mesh): Mesh object.
-        v (dolfin.Function): Velocity field.
-        inlet_area (float): Inlet area.
-        mu_f (float): Fluid dynamic viscosity.
-        rho_f (float): Fluid density.
-        n (dolfin.Expression): FacetNormal expression.
-        dsi (dolfin.Measure): Measure for inlet boundary.
-        local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
-            If False (default), solve using a global right-hand side assembly.
+        message (str): Reason for stopping the simulation, printed on rank 0.
+        **namespace: The turtleFSI namespace, as passed to `post_solve`.
 
     Returns:
-        None
+        dict: Variables to update the turtleFSI namespace with.
     """
-    # Calculate the DG vector of velocity magnitudes
-    DG = FunctionSpace(mesh, "DG", 0)
-    V_vector = local_project(sqrt(inner(v, v)), DG, local_rhs).vector().get_local()
-
-    # Calculate flow rate at the inlet
-    flow_rate_inlet = abs(assemble(inner(v, n) * dsi))
-
-    # Calculate local mean, min, and max velocities
-    local_V_mean = V_vector.mean()
-    local_V_min = V_vector.min()
-    local_V_max = V_vector.max()
-
-    comm = mesh.mpi_comm()
-    # Gather data from all processes
-    V_mean = comm.gather(local_V_mean, 0)
-    V_min = comm.gather(local_V_min, 0)
-    V_max = comm.gather(local_V_max, 0)
-
-    # compute the minimum cell diameter in the mesh
-    h = mesh.hmin()
-    h_min = MPI.min(MPI.comm_world, h)
-
-    if MPI.rank(comm) == 0:
-        # Calculate mean, min, and max velocities
-        v_mean = np.mean(V_mean)
-        v_min = min(V_min)
-        v_max = max(V_max)
-
-        # Calculate diameter at the inlet and Reynolds numbers
-        diam_inlet = np.sqrt(4 * inlet_area / np.pi)
-        Re_mean = rho_f * v_mean * diam_inlet / mu_f
-        Re_min = rho_f * v_min * diam_inlet / mu_f
-        Re_max = rho_f * v_max * diam_inlet / mu_f
-
-        # Calculate CFL numbers
-        CFL_mean = v_mean * dt / h_min * v.ufl_element().degree()
-        CFL_min = v_min * dt / h_min * v.ufl_element().degree()
-        CFL_max = v_max * dt / h_min * v.ufl_element().degree()
+    if MPI.rank(MPI.comm_world) == 0:
+        print(f"{message} Writing a checkpoint and stopping the simulation.")
+    checkpoint(**namespace)
 
-        # Print the flow properties
-        print("Flow Properties:")
-        print(f"  Flow Rate at Inlet: {flow_rate_inlet}")
-        print(f"  Velocity (mean, min, max): {v_mean}, {v_min}, {v_max}")
-        print(f"  CFL (mean, min, max): {CFL_mean}, {CFL_min}, {CFL_max}")
-        print(f"  Reynolds Numbers (mean, min, max): {Re_mean}, {Re_min}, {Re_max}")
+    return dict(stop=True)
 
 
-def compute_minimum_jacobian(mesh: Mesh, d: Function, local_rhs: bool = False) -> float:
+def _find_wrapped_solver(up_sol, solver_type: type):
     """
-    Compute the minimum Jacobian of the mesh. The minimum Jacobian is a measure of the mesh distortion.
-    The value 1 indicates no distortion, while a value less than 0 indicates mesh entanglement.
+    Find a solver of a given type in a chain of solver proxies, which wrap each other through their `solver`
+    attribute, e.g. a `_TimedSolver` wrapping a `_RecordingSolver`.
 
     Args:
-        mesh (dolfin.Mesh): The mesh object.
-        d (dolfin.Function): The displacement function.
-        local_rhs (bool, optional): If True, solve using a local right-hand side assembly.
+        up_sol: Linear solver of the turtleFSI Newton solver, possibly wrapped by proxies.
+        solver_type (type): Type of the solver to find.
 
     Returns:
-        float: The minimum Jacobian of the displacement.
+        The first solver of the given type in the chain, or None if there is none.
     """
-    # Create a function space for the Jacobian
-    DG = FunctionSpace(mesh, "DG", 0)
-    # compute the Jacobian of the displacement
-    jacobian = J_(d)
-    # project the Jacobian to the DG function space
-    projected_jacobian = local_project(jacobian, DG, local_rhs)
-    min_jacobian = np.min(projected_jacobian.vector().get_local())
-    global_min_jacobian = MPI.min(MPI.comm_world, min_jacobian)
-
-    if MPI.rank(MPI.comm_world) == 0:
-        print(f"Minimum Jacobian: {global_min_jacobian}")
-
-        if global_min_jacobian <= 0:
-            print("Warning: Negative Jacobian detected.")
-
-    return min_jacobian
-
-
-class InterfacePressure(UserExpression):
-    """
-    An expression for the fluid-solid interface pressure based on Fourier coefficients.
-    """
-    def __init__(self, t, t_ramp_start, t_ramp_end, An, Bn, period, P_mean, **kwargs):
-        """
-        Initialize the interface pressure expression.
-        """
-        self.t = t
-        self.t_ramp_start = t_ramp_start
-        self.t_ramp_end = t_ramp_end
-        self.An = An
-        self.Bn = Bn
-        self.omega = (2.0 * np.pi / period)
-        self.P_mean = P_mean
-        self.p_0 = 0.0  # Initial pressure
-        self.P = self.p_0  # Apply initial pressure to inner pressure variable
-        super().__init__(**kwargs)
-
-    def update(self, t):
-        """
-        Update the interface pressure at a given time.
-        """
-        self.t = t
-        # apply a sigmoid ramp to the pressure
-        if self.t < self.t_ramp_start:
-            ramp_factor = 0.0
-        if self.t_ramp_start <= self.t < self.t_ramp_end:
-            ramp_factor = -0.5 * np.cos(np.pi * (self.t - self.t_ramp_start) / (self.t_ramp_end - self.t_ramp_start)) \
-                + 0.5
-        if self.t >= self.t_ramp_end:
-            ramp_factor = 1.0
-        if MPI.rank(MPI.comm_world) == 0:
-            print("ramp_factor = {} m^3/s".format(ramp_factor))
-
-        # Calculate Pn (normalized pressure) from Fourier Coefficients
-        Pn = 0 + 0j
-        for i in range(len(self.An)):
-            Pn = Pn + (self.An[i] - self.Bn[i] * 1j) * np.exp(1j * i * self.omega * self.t)
-        Pn = abs(Pn)
-
-        # Multiply by mean pressure and ramp factor
-        self.P = ramp_factor * Pn * self.P_mean
-        if MPI.rank(MPI.comm_world) == 0:
-            print("Instantaneous normal stress prescribed at the FSI interface {} Pa".format(self.P))
-
-    def eval(self, value, x):
-        value[0] = self.P
-
-    def value_shape(self):
-        return ()
+    solver = up_sol
+    while solver is not None:
+        if isinstance(solver, solver_type):
+            return solver
+        # Look up the attribute directly, since the proxies forward unknown attributes to the wrapped solver
+        solver = getattr(solver, "__dict__", {}).get("solver")
+
+    return None
@@ -0,0 +1,172 @@
+"""
+Linear solver strategies for the Newton solver of turtleFSI. By default, turtleFSI solves each Newton iteration with
+a direct LU factorization (linear_solver="mumps"), whose memory and time grow superlinearly with the size of the mesh.
+The strategies below instead use PETSc Krylov solvers with domain decomposition, block (field-split) or Schur
+complement preconditioners for the displacement-velocity-pressure system. A problem file selects a strategy with the
+`solver_strategy` parameter, creates the solver with `create_linear_solver` and installs it in `pre_solve`:
+
+    up_sol = krylov_solver.install(up_sol) if krylov_solver is not None else up_sol
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from petsc4py import PETSc
+from dolfin import FunctionSpace, MPI, PETScKrylovSolver
+
+from vasp.simulations.simulation_common import _find_wrapped_solver
+
+# PETSc options of each strategy, without the options prefix of the solver. "mumps" keeps the direct solver of
+# turtleFSI
+SOLVER_STRATEGIES: Dict[str, Optional[Dict[str, Any]]] = {
+    "mumps": None,
+    # GMRES with restricted additive Schwarz, with ILU(1) on each overlapping subdomain (one per process)
+    "gmres_asm": dict(ksp_type="gmres", ksp_gmres_restart=200, ksp_rtol=1e-8, ksp_max_it=1000, pc_type="asm",
+                      pc_asm_overlap=1, sub_ksp_type="preonly", sub_pc_type="ilu", sub_pc_factor_levels=1),
+    # Flexible GMRES with block Gauss-Seidel over the displacement (elliptic, algebraic multigrid) and the
+    # velocity-pressure system (additive Schwarz with ILU)
+    "fgmres_block": dict(ksp_type="fgmres", ksp_gmres_restart=200, ksp_rtol=1e-8, ksp_max_it=1000,
+                         pc_type="fieldsplit", pc_fieldsplit_type="multiplicative",
+                         fieldsplit_d_ksp_type="preonly", fieldsplit_d_pc_type="hypre",
+                         fieldsplit_d_pc_hypre_type="boomeramg",
+                         fieldsplit_vp_ksp_type="preonly", fieldsplit_vp_pc_type="asm", fieldsplit_vp_pc_asm_overlap=1,
+                         fieldsplit_vp_sub_pc_type="ilu", fieldsplit_vp_sub_pc_factor_levels=1),
+    # Flexible GMRES with a lower triangular Schur complement factorization of the pressure, where the Schur
+    # complement is approximated by B diag(A)^-1 B^T and solved with algebraic multigrid
+    "fgmres_schur": dict(ksp_type="fgmres", ksp_gmres_restart=200, ksp_rtol=1e-8, ksp_max_it=1000,
+                         pc_type="fieldsplit", pc_fieldsplit_type="schur", pc_fieldsplit_schur_fact_type="lower",
+                         pc_fieldsplit_schur_precondition="selfp",
+                         fieldsplit_dv_ksp_type="preonly", fieldsplit_dv_pc_type="asm", fieldsplit_dv_pc_asm_overlap=1,
+                         fieldsplit_dv_sub_pc_type="ilu", fieldsplit_dv_sub_pc_factor_levels=1,
+                         fieldsplit_p_ksp_type="preonly", fieldsplit_p_pc_type="hypre",
+                         fieldsplit_p_pc_hypre_type="boomeramg"),
+}
+
+# Sub spaces of the mixed function space (d, v, p and, with biharmonic mesh lifting, w) in each field of the
+# field-split strategies. The auxiliary displacement w of the biharmonic mesh lifting belongs to the displacement.
+SOLVER_FIELDS: Dict[str, Dict[str, List[int]]] = {
+    "fgmres_block": dict(d=[0, 3], vp=[1, 2]),
+    "fgmres_schur": dict(dv=[0, 1, 3], p=[2]),
+}
+
+
+def get_field_index_sets(DVP: FunctionSpace, fields: Dict[str, Sequence[int]]) -> Dict[str, PETSc.IS]:
+    """
+    Get the PETSc index sets of the locally owned degrees of freedom of each field of a mixed function space.
+
+    Args:
+        DVP (dolfin.FunctionSpace): Mixed function space of the displacement, velocity and pressure.
+        fields (dict): Sub spaces in each field, keyed by the name of the field. Sub spaces that are not in the mixed
+            function space are skipped.
+
+    Returns:
+        dict: Index set of each field, in global numbering.
+    """
+    comm = DVP.mesh().mpi_comm()
+    index_sets = {}
+    for name, sub_spaces in fields.items():
+        dofs = [np.asarray(DVP.sub(i).dofmap().dofs()) for i in sub_spaces if i < DVP.num_sub_spaces()]
+        dofs = np.sort(np.concatenate(dofs)).astype(PETSc.IntType)
+        index_sets[name] = PETSc.IS().createGeneral(dofs, comm=comm)
+
+    return index_sets
+
+
+class KrylovSolver:
+    """
+    Krylov solver with the interface of the linear solver `up_sol` of the turtleFSI Newton solver. The Newton solver
+    sets the operator each time the Jacobian is recomputed, and the preconditioner is then rebuilt every
+    `preconditioner_reuse` times, and otherwise reused with the new Jacobian. Within a time step, the preconditioner
+    is always reused between Newton iterations where the Jacobian is not recomputed.
+    """
+    def __init__(self, DVP: FunctionSpace, options: Dict[str, Any], fields: Optional[Dict[str, Sequence[int]]] = None,
+                 preconditioner_reuse: int = 1, prefix: str = "vasp_") -> None:
+        """
+        Initialize the solver.
+
+        Args:
+            DVP (dolfin.FunctionSpace): Mixed function space of the displacement, velocity and pressure.
+            options (dict): PETSc options, without the options prefix.
+            fields (dict, optional): Sub spaces in each field of a field-split preconditioner, see `SOLVER_FIELDS`.
+            preconditioner_reuse (int): Number of Jacobians that each preconditioner is used for.
+            prefix (str): PETSc options prefix of the solver.
+        """
+        self.preconditioner_reuse = max(int(preconditioner_reuse), 1)
+        self.num_operators = 0
+        self.iterations: List[int] = []
+
+        petsc_options = PETSc.Options()
+        for key, value in options.items():
+            petsc_options.setValue(prefix + key, value)
+
+        self.solver = PETScKrylovSolver(DVP.mesh().mpi_comm())
+        self.solver.set_options_prefix(prefix)
+        # The Newton solver checks the residual, so an inexact solve does not stop the simulation
+        self.solver.parameters["error_on_nonconvergence"] = False
+        self.solver.set_from_options()
+
+        # The field-split index sets must be set after the preconditioner type
+        if fields is not None:
+            index_sets = get_field_index_sets(DVP, fields)
+            self.solver.ksp().getPC().setFieldSplitIS(*index_sets.items())
+
+    def install(self, up_sol):
+        """
+        Replace the linear solver of the turtleFSI Newton solver with this solver, unless it is already used,
+        possibly wrapped by a proxy such as the one of `AdaptiveJacobianPolicy`.
+
+        Args:
+            up_sol: Linear solver of the turtleFSI Newton solver.
+
+        Returns:
+            The linear solver to update `up_sol` with in the turtleFSI namespace.
+        """
+        return up_sol if _find_wrapped_solver(up_sol, KrylovSolver) is self else self
+
+    def set_operator(self, A) -> None:
+        self.solver.set_operator(A)
+        self.solver.ksp().setReusePreconditioner(self.num_operators % self.preconditioner_reuse != 0)
+        self.num_operators += 1
+
+    def solve(self, *args) -> int:
+        # The last two arguments are always the solution and right hand side vectors
+        if len(args) == 3:
+            self.set_operator(args[0])
+        x, b = args[-2], args[-1]
+        num_iterations = self.solver.solve(x, b)
+        self.iterations.append(num_iterations)
+
+        return num_iterations
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+
+def create_linear_solver(solver_strategy: Optional[str], DVP: FunctionSpace,
+                         solver_options: Optional[Dict[str, Any]] = None,
+                         preconditioner_reuse: int = 1) -> Optional[KrylovSolver]:
+    """
+    Create the linear solver of a solver strategy.
+
+    Args:
+        solver_strategy (str, optional): Name of a strategy in `SOLVER_STRATEGIES`. None or "mumps" keeps the direct
+            solver of turtleFSI.
+        DVP (dolfin.FunctionSpace): Mixed function space of the displacement, velocity and pressure.
+        solver_options (dict, optional): PETSc options that override the options of the strategy, e.g.
+            dict(ksp_rtol=1e-6, ksp_monitor=None).
+        preconditioner_reuse (int): Number of Jacobians that each preconditioner is used for.
+
+    Returns:
+        KrylovSolver: The solver, or None if the direct solver of turtleFSI is kept.
+    """
+    if solver_strategy not in SOLVER_STRATEGIES and solver_strategy is not None:
+        raise ValueError(f"Unknown solver strategy '{solver_strategy}', expected one of {list(SOLVER_STRATEGIES)}")
+
+    options = SOLVER_STRATEGIES.get(solver_strategy)
+    if options is None:
+        return None
+
+    if MPI.rank(MPI.comm_world) == 0:
+        print(f"Using the linear solver strategy '{solver_strategy}'")
+
+    return KrylovSolver(DVP, dict(options, **(solver_options or {})), SOLVER_FIELDS.get(solver_strategy),
+                        preconditioner_reuse)
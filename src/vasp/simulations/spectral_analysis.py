@@ -0,0 +1,146 @@
+"""
+In-situ spectral analysis of signals sampled during a simulation, e.g. the velocity at the probe points.
+"""
+from typing import Union, Dict, Optional, Sequence
+from pathlib import Path
+
+import h5py
+import numpy as np
+from dolfin import MPI
+
+
+class SpectralAnalyzer:
+    """
+    In-situ short-time Fourier transform of signals sampled at each time step, e.g. the velocity magnitude at probe
+    points. The last `window_size` samples of each signal are kept in a ring buffer, and every
+    `window_size - overlap` time steps a spectrogram frame is computed in the same way as `get_spectrogram` in the
+    spectrogram post-processing (periodogram with "spectrum" scaling, zero padded to twice the window size,
+    averaged over the signals). For each frame, the power in a set of frequency bands, the chromagram and the
+    spectral bandedness index (SBI) are computed as well, and everything is appended to an HDF5 file with one group
+    per signal name. This avoids saving the full solution at every time step when only the spectra are needed.
+    Only rank 0 computes and writes the frames, so the signals must be global, e.g. as returned by `ProbeSampler`.
+    """
+    def __init__(self, dt: float, window_size: int, output_path: Union[str, Path], overlap: float = 0.75,
+                 window: str = "hann", bands: Optional[Sequence[Sequence[float]]] = None, n_chroma: int = 24) -> None:
+        """
+        Initialize the spectral analyzer.
+
+        Args:
+            dt (float): Time step size, i.e. the sampling interval.
+            window_size (int): Number of samples per STFT window.
+            output_path (str or Path): Path to the HDF5 file with the spectrogram data.
+            overlap (float): Fraction of overlap between consecutive windows.
+            window (str): Window function, see scipy.signal.get_window.
+            bands (Sequence, optional): Frequency bands [[f_low, f_high], ...] in Hz for the band powers.
+                By default, octave bands from 25 Hz up to the Nyquist frequency are used.
+            n_chroma (int): Number of chroma bins.
+        """
+        self.fs = 1.0 / dt
+        self.dt = dt
+        self.window_size = window_size
+        self.hop = max(window_size - int(overlap * window_size), 1)
+        self.output_path = Path(output_path)
+        self.rank = MPI.rank(MPI.comm_world)
+        self.n_chroma = n_chroma
+
+        # scipy and the chroma filters are only imported by problem files running the spectral analysis
+        from scipy.signal import get_window
+        from vasp.automatedPostprocessing.postprocessing_h5py.chroma_filters import chroma_filterbank
+
+        self.window = get_window(window, window_size)
+        self.nfft = 2 * window_size
+        self.frequencies = np.fft.rfftfreq(self.nfft, dt)
+        if bands is None:
+            edges = 25.0 * 2.0 ** np.arange(np.ceil(np.log2(self.fs / 2 / 25.0)) + 1)
+            bands = [[low, min(high, self.fs / 2)] for low, high in zip(edges[:-1], edges[1:])]
+        self.bands = np.asarray(bands, dtype=float).reshape(-1, 2)
+        self._band_masks = [(self.frequencies >= low) & (self.frequencies < high) for low, high in self.bands]
+        self._chroma_filters = chroma_filterbank(sr=self.fs, n_fft=self.nfft, tuning=0.0, n_chroma=n_chroma,
+                                                 ctroct=5, octwidth=2)
+
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._num_samples = 0
+        self._first_time = 0.0
+
+    def update(self, t: float, **signals: np.ndarray) -> None:
+        """
+        Add the samples of one time step, and compute and write a frame when a new window is complete.
+
+        Args:
+            t (float): Time.
+            **signals (np.ndarray): Samples of each signal at time t, keyed by name, with shape (num_signals,).
+        """
+        if self.rank != 0:
+            return
+
+        index = self._num_samples % self.window_size
+        for name, values in signals.items():
+            values = np.asarray(values, dtype=float).ravel()
+            if name not in self._buffers:
+                self._buffers[name] = np.zeros((self.window_size, values.size))
+            self._buffers[name][index] = values
+
+        if self._num_samples == 0:
+            self._first_time = t
+        self._num_samples += 1
+
+        if self._num_samples >= self.window_size and (self._num_samples - self.window_size) % self.hop == 0:
+            # Time at the center of the window, as for the bins of scipy.signal.spectrogram
+            window_start = self._first_time + (self._num_samples - self.window_size) * self.dt
+            frame_time = window_start + self.window_size / 2 * self.dt
+            self.write_frame(frame_time, {name: self.compute_frame(name) for name in self._buffers})
+
+    def compute_frame(self, name: str) -> Dict[str, np.ndarray]:
+        """
+        Compute the spectrogram frame of the current window of a signal.
+
+        Args:
+            name (str): Signal name.
+
+        Returns:
+            Dict[str, np.ndarray]: Power spectrum averaged over the signals, band powers, chroma and SBI.
+        """
+        # Order the ring buffer from the oldest to the newest sample
+        start = self._num_samples % self.window_size
+        samples = np.roll(self._buffers[name], -start, axis=0)
+        samples = samples - samples.mean(axis=0)
+
+        spectrum = np.fft.rfft(samples * self.window[:, None], n=self.nfft, axis=0)
+        power = np.abs(spectrum) ** 2 / self.window.sum() ** 2
+        power[1:-1] *= 2
+        power = np.nanmean(power, axis=1)
+
+        band_power = np.array([power[mask].sum() for mask in self._band_masks])
+
+        # Chroma normalized to sum to one, and SBI as one minus the normalized chroma entropy
+        chroma = self._chroma_filters @ power
+        chroma = chroma / max(chroma.sum(), np.finfo(float).tiny)
+        entropy = -np.sum(chroma * np.log(np.maximum(chroma, np.finfo(float).tiny))) / np.log(self.n_chroma)
+
+        return dict(power=power, band_power=band_power, chroma=chroma, sbi=np.array(1.0 - entropy))
+
+    def write_frame(self, t: float, frames: Dict[str, Dict[str, np.ndarray]]) -> None:
+        """
+        Append one frame of each signal to the HDF5 file.
+
+        Args:
+            t (float): Time at the center of the window.
+            frames (dict): Frame of each signal, as returned by `compute_frame`.
+        """
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.output_path, "a") as f:
+            if "frequencies" not in f:
+                f["frequencies"] = self.frequencies
+                f["bands"] = self.bands
+                f.attrs["fs"] = self.fs
+                f.attrs["window_size"] = self.window_size
+                f.attrs["hop"] = self.hop
+            for name, frame in frames.items():
+                group = f.require_group(name)
+                for key, value in [("time", np.array(t))] + list(frame.items()):
+                    if key not in group:
+                        group.create_dataset(key, shape=(0,) + value.shape, maxshape=(None,) + value.shape,
+                                             dtype=np.float64, chunks=(64,) + value.shape)
+                    dataset = group[key]
+                    dataset.resize(dataset.shape[0] + 1, axis=0)
+                    dataset[-1] = value
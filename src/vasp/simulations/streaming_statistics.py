@@ -0,0 +1,202 @@
+"""
+Statistics of the solution, e.g. the mean, variance and phase averages, updated during a simulation without storing
+the solution at every time step.
+"""
+import json
+from typing import Union, Dict, Optional
+from pathlib import Path
+
+import numpy as np
+from dolfin import MPI, FunctionSpace, Function, XDMFFile
+
+
+class StreamingStatistics:
+    """
+    In-situ statistics of fields over time, computed with Welford's algorithm such that the mean and variance are
+    updated from a single time step at a time without storing the time series. Optionally, the fields are also
+    averaged per phase bin of a periodic cycle, e.g. the cardiac cycle. The state of the statistics can be
+    checkpointed and loaded again, such that a restarted simulation continues the statistics.
+    """
+    def __init__(self, spaces: Dict[str, FunctionSpace], period: Optional[float] = None, num_phases: int = 0) -> None:
+        """
+        Initialize the statistics.
+
+        Args:
+            spaces (Dict[str, dolfin.FunctionSpace]): Function spaces of the fields, keyed by field name.
+            period (float, optional): Period of the cycle used for the phase averages.
+            num_phases (int): Number of phase bins per cycle. If 0, no phase averages are computed.
+        """
+        if num_phases > 0 and period is None:
+            raise ValueError("A period is required to compute phase averages.")
+        self.spaces = spaces
+        self.period = period
+        self.num_phases = num_phases
+        self.count = 0
+        self.phase_count = np.zeros(num_phases, dtype=np.int64)
+
+        # Statistics are kept as arrays of the owned dofs of each field
+        self.mean: Dict[str, np.ndarray] = {}
+        self.m2: Dict[str, np.ndarray] = {}
+        self.phase_mean: Dict[str, np.ndarray] = {}
+        for name, V in spaces.items():
+            local_size = V.dofmap().ownership_range()[1] - V.dofmap().ownership_range()[0]
+            self.mean[name] = np.zeros(local_size)
+            self.m2[name] = np.zeros(local_size)
+            self.phase_mean[name] = np.zeros((num_phases, local_size))
+
+    def phase_bin(self, t: float) -> int:
+        """
+        Get the phase bin of a given time.
+
+        Args:
+            t (float): Time.
+
+        Returns:
+            int: Index of the phase bin.
+        """
+        # The small offset avoids round-off moving time steps on a bin edge between bins from cycle to cycle
+        phase = (t / self.period) % 1.0
+        return int(phase * self.num_phases + 1e-8) % self.num_phases
+
+    def update(self, t: float, **functions: Function) -> None:
+        """
+        Add one time step to the statistics.
+
+        Args:
+            t (float): Time.
+            **functions (dolfin.Function): Fields at time t, keyed by the same names as the function spaces.
+        """
+        self.count += 1
+        if self.num_phases > 0:
+            phase = self.phase_bin(t)
+            self.phase_count[phase] += 1
+
+        for name, f in functions.items():
+            x = f.vector().get_local()
+            mean = self.mean[name]
+            delta = x - mean
+            mean += delta / self.count
+            self.m2[name] += delta * (x - mean)
+            if self.num_phases > 0:
+                self.phase_mean[name][phase] += (x - self.phase_mean[name][phase]) / self.phase_count[phase]
+
+    def variance(self, name: str) -> np.ndarray:
+        """
+        Get the (population) variance of a field.
+
+        Args:
+            name (str): Field name.
+
+        Returns:
+            np.ndarray: Variance at the owned dofs.
+        """
+        return self.m2[name] / max(self.count, 1)
+
+    def rms(self, name: str) -> np.ndarray:
+        """
+        Get the root mean square of a field, i.e. sqrt(mean^2 + variance).
+
+        Args:
+            name (str): Field name.
+
+        Returns:
+            np.ndarray: Root mean square at the owned dofs.
+        """
+        return np.sqrt(self.mean[name] ** 2 + self.variance(name))
+
+    def _function(self, name: str, values: np.ndarray) -> Function:
+        """
+        Create a function of a field from an array of owned dof values.
+        """
+        f = Function(self.spaces[name])
+        f.vector().set_local(values)
+        f.vector().apply("insert")
+
+        return f
+
+    def save(self, folder: Union[str, Path]) -> None:
+        """
+        Checkpoint the state of the statistics, e.g. alongside the checkpoint written by turtleFSI.
+        The fields are written with XDMFFile.write_checkpoint, so the state can be loaded with a different number
+        of processes.
+
+        Args:
+            folder (str or Path): Checkpoint folder.
+        """
+        folder = Path(folder)
+        comm = next(iter(self.spaces.values())).mesh().mpi_comm()
+        for name in self.spaces:
+            arrays = [("mean", [self.mean[name]]), ("m2", [self.m2[name]]), ("phase_mean", self.phase_mean[name])]
+            for kind, values in arrays:
+                with XDMFFile(comm, str(folder / f"statistics_{name}_{kind}.xdmf")) as f:
+                    for i, value in enumerate(values):
+                        f.write_checkpoint(self._function(name, value), f"{name}_{kind}", i,
+                                           XDMFFile.Encoding.HDF5, i > 0)
+
+        if MPI.rank(comm) == 0:
+            with open(folder / "statistics.json", "w") as f:
+                json.dump(dict(count=self.count, period=self.period, num_phases=self.num_phases,
+                               phase_count=self.phase_count.tolist()), f)
+
+    def load(self, folder: Union[str, Path]) -> bool:
+        """
+        Load the state of the statistics from a checkpoint folder, if it exists.
+
+        Args:
+            folder (str or Path): Checkpoint folder.
+
+        Returns:
+            bool: True if the statistics were loaded.
+        """
+        folder = Path(folder)
+        state_path = folder / "statistics.json"
+        if not state_path.exists():
+            return False
+
+        with open(state_path) as f:
+            state = json.load(f)
+        if state["num_phases"] != self.num_phases or (self.num_phases > 0 and state["period"] != self.period):
+            raise ValueError(f"Statistics in {folder} have {state['num_phases']} phase bins and period "
+                             f"{state['period']}, expected {self.num_phases} and {self.period}.")
+
+        self.count = state["count"]
+        self.phase_count = np.array(state["phase_count"], dtype=np.int64)
+        comm = next(iter(self.spaces.values())).mesh().mpi_comm()
+        for name, V in self.spaces.items():
+            f = Function(V)
+            for kind in ["mean", "m2", "phase_mean"]:
+                with XDMFFile(comm, str(folder / f"statistics_{name}_{kind}.xdmf")) as xdmf:
+                    for i in range(self.num_phases if kind == "phase_mean" else 1):
+                        xdmf.read_checkpoint(f, f"{name}_{kind}", i)
+                        if kind == "phase_mean":
+                            self.phase_mean[name][i] = f.vector().get_local()
+                        else:
+                            getattr(self, kind)[name][:] = f.vector().get_local()
+
+        return True
+
+    def write(self, folder: Union[str, Path]) -> None:
+        """
+        Write the mean, standard deviation, root mean square and phase averages of each field to XDMF files
+        named <name>_mean.xdmf, <name>_std.xdmf, <name>_rms.xdmf and <name>_phase_mean.xdmf.
+
+        Args:
+            folder (str or Path): Output folder.
+        """
+        folder = Path(folder)
+        comm = next(iter(self.spaces.values())).mesh().mpi_comm()
+        for name in self.spaces:
+            fields = [("mean", self.mean[name]), ("std", np.sqrt(self.variance(name))), ("rms", self.rms(name))]
+            for kind, values in fields:
+                data_name = f"{name}_{kind}.xdmf"
+                with XDMFFile(comm, str(folder / data_name)) as f:
+                    f.write_checkpoint(self._function(name, values), data_name, 0, XDMFFile.Encoding.HDF5)
+
+            if self.num_phases > 0:
+                data_name = f"{name}_phase_mean.xdmf"
+                with XDMFFile(comm, str(folder / data_name)) as f:
+                    # Phase averages are stored at the center time of each phase bin
+                    for i, values in enumerate(self.phase_mean[name]):
+                        time = (i + 0.5) * self.period / self.num_phases
+                        f.write_checkpoint(self._function(name, values), data_name, time, XDMFFile.Encoding.HDF5,
+                                           i > 0)
@@ -0,0 +1,120 @@
+"""
+Structured telemetry of a simulation, written per time step to an HDF5 file, and read by `vasp-log-plotter`.
+"""
+import json
+from typing import List, Union, Tuple, Dict, Optional, Sequence
+from pathlib import Path
+
+import h5py
+import numpy as np
+from dolfin import MPI
+
+
+class TelemetryWriter:
+    """
+    Structured per time step telemetry, e.g. flow rate, CFL and Reynolds numbers, minimum Jacobian and probe values.
+    The records are buffered in memory and appended every `flush_interval` calls to `record` to an HDF5 file with
+    one group per quantity, holding a chunked "time" dataset and a chunked "values" dataset with one row per record.
+    Each quantity keeps its own times, so quantities may be recorded at different time steps, e.g. diagnostics run
+    at their own cadence by `DiagnosticsScheduler`. Only rank 0 writes, so the recorded values must be global, i.e.
+    equal on all ranks.
+    """
+    def __init__(self, path: Union[str, Path], flush_interval: int = 10, parameters: Optional[dict] = None) -> None:
+        """
+        Initialize the telemetry writer.
+
+        Args:
+            path (str or Path): Path to the HDF5 file. Records are appended if the file already exists.
+            flush_interval (int): Number of calls to `record` between each write to the file.
+            parameters (dict, optional): Simulation parameters, stored as a JSON attribute of the file.
+        """
+        self.path = Path(path)
+        self.flush_interval = max(int(flush_interval), 1)
+        self.rank = MPI.rank(MPI.comm_world)
+        self._num_buffered = 0
+        self._buffer: Dict[str, Tuple[List[float], List[np.ndarray]]] = {}
+
+        if self.rank == 0 and parameters is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with h5py.File(self.path, "a") as f:
+                f.attrs["parameters"] = json.dumps(parameters, default=str)
+
+    def record(self, t: float, **values: Union[float, np.ndarray]) -> None:
+        """
+        Record values at a given time. Each quantity must have the same shape in every record.
+
+        Args:
+            t (float): Time.
+            **values (float or np.ndarray): Values, keyed by the name of the quantity.
+        """
+        if self.rank != 0:
+            return
+
+        for name, value in values.items():
+            times, rows = self._buffer.setdefault(name, ([], []))
+            times.append(t)
+            rows.append(np.asarray(value, dtype=np.float64))
+
+        self._num_buffered += 1
+        if self._num_buffered >= self.flush_interval:
+            self.flush()
+
+    def record_sequence(self, t: float, **values: Sequence[float]) -> None:
+        """
+        Record a sequence of values of each quantity at a given time, e.g. the residual of each Newton iteration of
+        a time step, as one record per value. Unlike `record`, this does not count towards `flush_interval`.
+
+        Args:
+            t (float): Time.
+            **values (Sequence[float]): Sequence of values, keyed by the name of the quantity.
+        """
+        if self.rank != 0:
+            return
+
+        for name, sequence in values.items():
+            times, rows = self._buffer.setdefault(name, ([], []))
+            for value in sequence:
+                times.append(t)
+                rows.append(np.asarray(value, dtype=np.float64))
+
+    def flush(self) -> None:
+        """
+        Append the buffered records to the HDF5 file.
+        """
+        if self.rank != 0 or not self._buffer:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.path, "a") as f:
+            for name, (times, rows) in self._buffer.items():
+                values = np.stack(rows)
+                if name not in f:
+                    group = f.create_group(name)
+                    group.create_dataset("time", shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(1024,))
+                    chunks = (max(1, 8192 // max(int(np.prod(values.shape[1:])), 1)),) + values.shape[1:]
+                    group.create_dataset("values", shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                                         dtype=np.float64, chunks=chunks)
+                group = f[name]
+                size = group["time"].shape[0]
+                group["time"].resize((size + len(times),))
+                group["time"][size:] = times
+                group["values"].resize(size + len(times), axis=0)
+                group["values"][size:] = values
+
+        self._buffer = {}
+        self._num_buffered = 0
+
+
+def load_telemetry(path: Union[str, Path]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Load a telemetry file written by `TelemetryWriter`.
+
+    Args:
+        path (str or Path): Path to the HDF5 file.
+
+    Returns:
+        Dict[str, Tuple[np.ndarray, np.ndarray]]: Times with shape (num_records,) and values with shape
+            (num_records, ...) of each quantity.
+    """
+    with h5py.File(path, "r") as f:
+        return {name: (group["time"][()], group["values"][()]) for name, group in f.items()}
@@ -0,0 +1,334 @@
+"""
+Timing of the time steps of a simulation and of the hooks of the problem files.
+"""
+import functools
+import json
+from contextlib import contextmanager
+from time import perf_counter
+from typing import List, Union, Dict, Optional, Callable, Any, Iterator
+from pathlib import Path
+
+import numpy as np
+from mpi4py import MPI as mpi
+from dolfin import MPI
+
+from vasp.simulations.simulation_common import _find_wrapped_solver
+
+
+class HookTimers:
+    """
+    Registry of the wall-clock time spent in the hooks of a problem file, e.g. `create_bcs`, `pre_solve`,
+    `post_solve` and `finished`, and in named sections within them, such as the diagnostics run by
+    `DiagnosticsScheduler`. The hooks are timed by decorating them in the problem file:
+
+        hook_timers = HookTimers()
+
+        @hook_timers.timed
+        def post_solve(**namespace):
+            ...
+
+        @hook_timers.timed(report=True)
+        def finished(**namespace):
+            ...
+
+    where the timings are summarized over all ranks and printed after `finished`.
+    """
+    def __init__(self) -> None:
+        # Time of each call, and start of the last call, of each hook and section
+        self.times: Dict[str, List[float]] = {}
+        self.starts: Dict[str, float] = {}
+
+    def add(self, name: str, elapsed: float) -> None:
+        """
+        Add the time of one call to a hook or section.
+
+        Args:
+            name (str): Name of the hook or section.
+            elapsed (float): Wall-clock time in seconds.
+        """
+        self.times.setdefault(name, []).append(elapsed)
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """
+        Time a section of code, e.g. `with hook_timers.section("probes"):`.
+
+        Args:
+            name (str): Name of the section.
+        """
+        start = self.starts[name] = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def timed(self, hook: Optional[Callable] = None, *, report: bool = False) -> Callable:
+        """
+        Decorate a hook of a problem file, such that each call is timed under the name of the hook.
+
+        Args:
+            hook (Callable, optional): The hook. If None, a decorator is returned.
+            report (bool): If True, print the summary of all timings after each call, e.g. for `finished`.
+
+        Returns:
+            Callable: The timed hook, or a decorator if `hook` is None.
+        """
+        if hook is None:
+            return functools.partial(self.timed, report=report)
+
+        @functools.wraps(hook)
+        def timed_hook(*args, **kwargs):
+            with self.section(hook.__name__):
+                result = hook(*args, **kwargs)
+            if report:
+                self.report()
+            return result
+
+        return timed_hook
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Compute the minimum, mean and maximum over all ranks of the total time of each hook and section, and the
+        mean time per call. Collective.
+
+        Returns:
+            dict: Number of calls, total time (min, mean, max) and time per call in seconds, keyed by name.
+        """
+        comm = mpi.COMM_WORLD
+        names = sorted(set().union(*comm.allgather(list(self.times))))
+        totals = np.array([sum(self.times.get(name, [])) for name in names])
+        calls = np.array([len(self.times.get(name, [])) for name in names], dtype=np.float64)
+
+        min_totals, max_totals, sum_totals, max_calls = (np.empty_like(totals) for _ in range(4))
+        comm.Allreduce(totals, min_totals, op=mpi.MIN)
+        comm.Allreduce(totals, max_totals, op=mpi.MAX)
+        comm.Allreduce(totals, sum_totals, op=mpi.SUM)
+        comm.Allreduce(calls, max_calls, op=mpi.MAX)
+        mean_totals = sum_totals / comm.Get_size()
+
+        return {name: dict(calls=int(max_calls[i]), min=float(min_totals[i]), mean=float(mean_totals[i]),
+                           max=float(max_totals[i]), per_call=float(mean_totals[i] / max(max_calls[i], 1)))
+                for i, name in enumerate(names)}
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Print the summary of the timings on rank 0. Collective.
+
+        Returns:
+            dict: The summary, see `summary`.
+        """
+        summary = self.summary()
+        if MPI.rank(MPI.comm_world) == 0:
+            print("Time spent in hooks and diagnostics, over all ranks (s):")
+            print(f"  {'name':<24}{'calls':>8}{'min':>12}{'mean':>12}{'max':>12}{'per call':>12}")
+            for name, stats in summary.items():
+                print(f"  {name:<24}{stats['calls']:>8}{stats['min']:>12.4e}{stats['mean']:>12.4e}"
+                      f"{stats['max']:>12.4e}{stats['per_call']:>12.4e}")
+
+        return summary
+
+
+class _TimedSolver:
+    """
+    Proxy of the linear solver used by the turtleFSI Newton solver, which accumulates the wall-clock time spent in
+    `solve`, including the factorization of the Jacobian by direct solvers. All other attributes are forwarded to
+    the wrapped solver.
+    """
+    def __init__(self, solver) -> None:
+        self.solver = solver
+        self.elapsed = 0.0
+
+    def solve(self, *args):
+        start = perf_counter()
+        result = self.solver.solve(*args)
+        self.elapsed += perf_counter() - start
+
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+
+class StepTimer(HookTimers):
+    """
+    Wall-clock time of the phases of each time step of turtleFSI: `pre_solve`, the assembly and the linear solves of
+    the Newton solver, and `post_solve`. The hooks are timed as by `HookTimers`, and the time between the end of
+    `pre_solve` and the start of `post_solve` is split into the linear solves, timed by wrapping the linear solver
+    `up_sol`, and the assembly, which also includes the residual norms of the Newton solver and the update of the
+    solutions of the previous time steps.
+
+    Decorate `pre_solve` and `post_solve` with `timed`, and in `pre_solve`, update `up_sol` in the turtleFSI
+    namespace with the solver returned by `time_linear_solver`.
+    """
+    PHASES = ("pre_solve", "assembly", "linear_solve", "post_solve", "total")
+
+    def __init__(self, warmup_steps: int = 1) -> None:
+        """
+        Initialize the timer.
+
+        Args:
+            warmup_steps (int): Number of first time steps left out of `step_summary`, e.g. where the forms are
+                compiled.
+        """
+        super().__init__()
+        self.warmup_steps = warmup_steps
+        self._solver: Optional[_TimedSolver] = None
+
+    def time_linear_solver(self, up_sol):
+        """
+        Time the linear solves of the Newton solver in the coming time step.
+
+        Args:
+            up_sol: Linear solver of the turtleFSI Newton solver.
+
+        Returns:
+            The timed linear solver, to update `up_sol` with in the turtleFSI namespace.
+        """
+        # The timed solver may be wrapped by other proxies, e.g. the one of `AdaptiveJacobianPolicy`
+        timed_solver = _find_wrapped_solver(up_sol, _TimedSolver)
+        if timed_solver is None:
+            up_sol = timed_solver = _TimedSolver(up_sol)
+        timed_solver.elapsed = 0.0
+        self._solver = timed_solver
+
+        return up_sol
+
+    def add(self, name: str, elapsed: float) -> None:
+        super().add(name, elapsed)
+        # The time step is complete at the end of post_solve
+        if name == "post_solve" and "pre_solve" in self.starts:
+            newton = self.starts["post_solve"] - self.starts["pre_solve"] - self.times["pre_solve"][-1]
+            linear_solve = self._solver.elapsed if self._solver is not None else 0.0
+            super().add("linear_solve", linear_solve)
+            super().add("assembly", newton - linear_solve)
+            super().add("total", self.starts["post_solve"] + elapsed - self.starts["pre_solve"])
+
+    def step_time(self) -> float:
+        """
+        Get the wall-clock time since the start of the current time step, i.e. the start of `pre_solve`.
+
+        Returns:
+            float: Time in seconds on this rank.
+        """
+        return perf_counter() - self.starts["pre_solve"]
+
+    def step_summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Compute the mean, minimum and maximum time per time step of each phase over the time steps after the warmup,
+        on the slowest rank, i.e. the maximum over all ranks. Collective.
+
+        Returns:
+            dict: Mean, minimum and maximum time in seconds, keyed by phase.
+        """
+        times = np.array([self.times.get(phase, [])[self.warmup_steps:] for phase in self.PHASES])
+        times = times.reshape(len(self.PHASES), -1)
+        local = np.full((len(self.PHASES), 3), np.nan)
+        if times.shape[1] > 0:
+            local = np.column_stack([times.mean(axis=1), times.min(axis=1), times.max(axis=1)])
+        stats = np.empty_like(local)
+        mpi.COMM_WORLD.Allreduce(local, stats, op=mpi.MAX)
+
+        return {phase: dict(mean=float(mean), min=float(min_), max=float(max_))
+                for phase, (mean, min_, max_) in zip(self.PHASES, stats)}
+
+    def write(self, path: Union[str, Path], **metadata) -> None:
+        """
+        Write the summary of the timings of the time steps to a JSON file on rank 0. Collective.
+
+        Args:
+            path (str or Path): Path to the JSON file.
+            **metadata: Additional values to store in the file, e.g. the number of degrees of freedom.
+        """
+        results = dict(metadata, num_processes=MPI.size(MPI.comm_world),
+                       num_steps=max(len(self.times.get("total", [])) - self.warmup_steps, 0),
+                       time_per_step=self.step_summary())
+
+        if MPI.rank(MPI.comm_world) == 0:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(results, f, indent=4)
+
+
+class DiagnosticsScheduler:
+    """
+    Run each diagnostic of a problem file, e.g. probe sampling, flow properties or the Jacobian monitor, at its own
+    cadence instead of at every time step. The schedule maps the name of each diagnostic to its options:
+
+    - every (int): Run every `every` time steps, 0 to never run. Defaults to 1.
+    - start (float): Only run at times t >= start. Defaults to the start of the simulation.
+    - end (float): Only run at times t <= end. Defaults to the end of the simulation.
+
+    Diagnostics that are not in the schedule are run at every time step. Each run is timed by `HookTimers`.
+    """
+    OPTIONS = ("every", "start", "end")
+
+    def __init__(self, schedule: Optional[Dict[str, Dict[str, float]]] = None,
+                 timers: Optional[HookTimers] = None) -> None:
+        """
+        Initialize the scheduler.
+
+        Args:
+            schedule (dict, optional): Options of each diagnostic, keyed by the name of the diagnostic.
+            timers (HookTimers, optional): Registry where each diagnostic is timed under its name.
+        """
+        self.schedule = dict(schedule or {})
+        self.timers = timers
+        for name, options in self.schedule.items():
+            unknown = set(options) - set(self.OPTIONS)
+            if unknown:
+                raise ValueError(f"Unknown schedule options {sorted(unknown)} for diagnostic '{name}', " +
+                                 f"expected {list(self.OPTIONS)}")
+
+    def every(self, name: str) -> int:
+        """
+        Get the number of time steps between each run of a diagnostic.
+
+        Args:
+            name (str): Name of the diagnostic.
+
+        Returns:
+            int: Number of time steps between each run.
+        """
+        return int(self.schedule.get(name, {}).get("every", 1))
+
+    def due(self, name: str, counter: int, t: float) -> bool:
+        """
+        Check if a diagnostic runs at the current time step.
+
+        Args:
+            name (str): Name of the diagnostic.
+            counter (int): Time step number.
+            t (float): Time.
+
+        Returns:
+            bool: True if the diagnostic runs at this time step.
+        """
+        options = self.schedule.get(name, {})
+        every = self.every(name)
+        start, end = options.get("start"), options.get("end")
+        # Allow for round-off in the accumulated time
+        eps = 1e-12 * max(abs(t), 1.0)
+
+        return every > 0 and counter % every == 0 and (start is None or t >= start - eps) and \
+            (end is None or t <= end + eps)
+
+    def run(self, name: str, counter: int, t: float, diagnostic: Callable, *args, **kwargs) -> Optional[Any]:
+        """
+        Run a diagnostic if it is due at the current time step.
+
+        Args:
+            name (str): Name of the diagnostic.
+            counter (int): Time step number.
+            t (float): Time.
+            diagnostic (Callable): The diagnostic, called with the remaining arguments.
+
+        Returns:
+            The result of the diagnostic, or None if it is not due.
+        """
+        if not self.due(name, counter, t):
+            return None
+        if self.timers is None:
+            return diagnostic(*args, **kwargs)
+        with self.timers.section(name):
+            return diagnostic(*args, **kwargs)
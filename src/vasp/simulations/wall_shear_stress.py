@@ -0,0 +1,218 @@
+"""
+In-situ wall shear stress and time-averaged hemodynamic indices, computed from the velocity during a simulation.
+"""
+import json
+from typing import List, Union
+from pathlib import Path
+
+import numpy as np
+from dolfin import Mesh, MPI, HDF5File, FunctionSpace, Function, XDMFFile, VectorFunctionSpace, BoundaryMesh, \
+    FunctionAssigner, PETScDMCollection
+
+
+def create_fluid_mesh(mesh_path: Union[str, Path], fluid_domain_id: Union[int, List[int]],
+                      solid_domain_id: Union[int, List[int]]) -> Path:
+    """
+    Get the fluid mesh <mesh_path stem>_fluid.h5 that the WSS is computed on, as created by `vasp-separate-mesh`.
+    A missing fluid mesh is created with `separate_mesh`, which is only supported in serial.
+
+    Args:
+        mesh_path (str or Path): Path to the mesh of the simulation.
+        fluid_domain_id (int or list): ID of the fluid domain.
+        solid_domain_id (int or list): ID of the solid domain.
+
+    Returns:
+        Path: Path to the fluid mesh.
+    """
+    # separate_mesh is only imported by simulations computing the WSS
+    from vasp.automatedPostprocessing.postprocessing_mesh.separate_mesh import separate_mesh
+
+    mesh_path = Path(mesh_path)
+    fluid_mesh_path = mesh_path.with_name(mesh_path.stem + "_fluid.h5")
+    if not fluid_mesh_path.exists() and MPI.size(MPI.comm_world) == 1:
+        separate_mesh(mesh_path, fluid_domain_id, solid_domain_id)
+
+    return fluid_mesh_path
+
+
+class WallShearStress:
+    """
+    In-situ wall shear stress (WSS) and time-averaged hemodynamic indices, computed from the velocity in memory
+    instead of reading the saved velocity back in `compute_hemodynamics`. The velocity is transferred from the FSI
+    mesh to the fluid mesh created by `vasp-separate-mesh`, and the WSS is computed with the same `Stress` object as
+    in the post-processing, with the projection factorized once. At each update, the time-averaged WSS magnitude
+    (TAWSS), the mean WSS vector and the temporal WSS gradient (TWSSG) are accumulated, while the WSS itself is only
+    written every `save_step` updates. As in the post-processing, the WSS is computed in the reference configuration.
+    """
+    def __init__(self, V: FunctionSpace, fluid_mesh_path: Union[str, Path], mu_f: float, dt: float,
+                 output_folder: Union[str, Path], save_step: int = 0) -> None:
+        """
+        Initialize the wall shear stress computation.
+
+        Args:
+            V (dolfin.FunctionSpace): Velocity function space on the FSI mesh.
+            fluid_mesh_path (str or Path): Path to the fluid mesh, e.g. mesh_fluid.h5 from `vasp-separate-mesh`.
+            mu_f (float): Dynamic viscosity of the fluid.
+            dt (float): Time between two updates, used for the temporal WSS gradient.
+            output_folder (str or Path): Folder for the WSS and the hemodynamic indices.
+            save_step (int): Number of updates between each time the WSS is written. If 0, the WSS is not written.
+        """
+        fluid_mesh_path = Path(fluid_mesh_path)
+        assert fluid_mesh_path.exists(), f"Fluid mesh {fluid_mesh_path} not found. Make sure to create it with " \
+            "separate_mesh (vasp-separate-mesh) in serial first."
+        self.dt = dt
+        self.save_step = save_step
+        self.output_folder = Path(output_folder)
+        self.count = 0
+
+        self.mesh = Mesh()
+        with HDF5File(MPI.comm_world, str(fluid_mesh_path), "r") as mesh_file:
+            mesh_file.read(self.mesh, "mesh", False)
+        self.comm = self.mesh.mpi_comm()
+        boundary_mesh = BoundaryMesh(self.mesh, "exterior")
+
+        # Velocity on the fluid mesh, interpolated from the FSI mesh with a transfer matrix assembled once
+        V_fluid = VectorFunctionSpace(self.mesh, "CG", V.ufl_element().degree())
+        self.u = Function(V_fluid)
+        self.transfer_matrix = PETScDMCollection.create_transfer_matrix(V, V_fluid)
+
+        # The post-processing, and thereby VaMPy, is only imported by simulations computing the WSS
+        from vasp.automatedPostprocessing.postprocessing_fenics.compute_hemodynamics import Stress
+
+        self.Vv_boundary = VectorFunctionSpace(boundary_mesh, "DG", 1)
+        self.V_boundary = FunctionSpace(boundary_mesh, "DG", 1)
+        self.stress = Stress(u=self.u, V_dg=VectorFunctionSpace(self.mesh, "DG", 1), V_sub=self.Vv_boundary,
+                             mu_f=mu_f, mesh=self.mesh, boundary_mesh=boundary_mesh)
+
+        # Magnitude of vectors on the boundary, computed per dof node as in the post-processing
+        self._magnitude_tmp = Function(self.Vv_boundary)
+        self._magnitude = Function(self.V_boundary)
+        self._assigner = FunctionAssigner(self.V_boundary, self.Vv_boundary.sub(0))
+        self._gradient = Function(self.Vv_boundary)
+
+        self.indices = dict(TAWSS=Function(self.V_boundary), WSS_mean=Function(self.Vv_boundary),
+                            TWSSG=Function(self.V_boundary), WSS_prev=Function(self.Vv_boundary))
+
+        self.wss_file = None
+        if save_step > 0:
+            self.output_folder.mkdir(parents=True, exist_ok=True)
+            self.wss_file = XDMFFile(self.comm, str(self.output_folder / "WSS.xdmf"))
+            self.wss_file.parameters["rewrite_function_mesh"] = False
+            self.wss_file.parameters["flush_output"] = True
+
+    def magnitude(self, f: Function) -> np.ndarray:
+        """
+        Compute the magnitude of a vector function on the boundary at each dof node.
+
+        Args:
+            f (dolfin.Function): Vector function in the DG1 vector space of the boundary.
+
+        Returns:
+            np.ndarray: Magnitude at the owned dofs of the scalar DG1 space of the boundary.
+        """
+        block_size = self.Vv_boundary.dofmap().block_size()
+        work_vec = f.vector().get_local()
+        norm = np.linalg.norm(work_vec.reshape(-1, block_size), axis=1)
+        work_vec[:] = 0
+        work_vec[::block_size] = norm
+        self._magnitude_tmp.vector().set_local(work_vec)
+        self._magnitude_tmp.vector().apply("insert")
+        self._assigner.assign(self._magnitude, self._magnitude_tmp.sub(0))
+
+        return self._magnitude.vector().get_local()
+
+    def update(self, t: float, u: Function) -> None:
+        """
+        Compute the WSS of a velocity field and add it to the time-averaged indices.
+
+        Args:
+            t (float): Time.
+            u (dolfin.Function): Velocity on the FSI mesh.
+        """
+        self.u.vector()[:] = self.transfer_matrix * u.vector()
+        tau = self.stress()
+
+        self.indices["TAWSS"].vector()[:] += self.magnitude(tau)
+        self.indices["WSS_mean"].vector().axpy(1, tau.vector())
+
+        # The gradient is computed from the previous update, so the first update only stores the WSS
+        tau_prev = self.indices["WSS_prev"]
+        if self.count > 0:
+            self._gradient.vector().zero()
+            self._gradient.vector().axpy(1 / self.dt, tau.vector())
+            self._gradient.vector().axpy(-1 / self.dt, tau_prev.vector())
+            self.indices["TWSSG"].vector()[:] += self.magnitude(self._gradient)
+        tau_prev.vector().zero()
+        tau_prev.vector().axpy(1, tau.vector())
+        self.count += 1
+
+        if self.wss_file is not None and self.count % self.save_step == 0:
+            tau.rename("WSS", "WSS")
+            self.wss_file.write_checkpoint(tau, "WSS", t, XDMFFile.Encoding.HDF5, append=self.count > self.save_step)
+
+    def save(self, folder: Union[str, Path]) -> None:
+        """
+        Checkpoint the accumulated indices, e.g. alongside the checkpoint written by turtleFSI.
+
+        Args:
+            folder (str or Path): Checkpoint folder.
+        """
+        folder = Path(folder)
+        for name, f in self.indices.items():
+            with XDMFFile(self.comm, str(folder / f"wss_{name}.xdmf")) as xdmf:
+                xdmf.write_checkpoint(f, name, 0, XDMFFile.Encoding.HDF5)
+
+        if MPI.rank(self.comm) == 0:
+            with open(folder / "wss.json", "w") as f:
+                json.dump(dict(count=self.count), f)
+
+    def load(self, folder: Union[str, Path]) -> bool:
+        """
+        Load the accumulated indices from a checkpoint folder, if it exists.
+
+        Args:
+            folder (str or Path): Checkpoint folder.
+
+        Returns:
+            bool: True if the indices were loaded.
+        """
+        folder = Path(folder)
+        state_path = folder / "wss.json"
+        if not state_path.exists():
+            return False
+
+        with open(state_path) as f:
+            self.count = json.load(f)["count"]
+        for name, f in self.indices.items():
+            with XDMFFile(self.comm, str(folder / f"wss_{name}.xdmf")) as xdmf:
+                xdmf.read_checkpoint(f, name, 0)
+
+        return True
+
+    def write(self) -> None:
+        """
+        Write the time-averaged hemodynamic indices TAWSS, TWSSG, OSI, RRT and ECAP, defined as in
+        `compute_hemodynamics`, to XDMF files in the output folder.
+        """
+        if self.wss_file is not None:
+            self.wss_file.close()
+        if self.count == 0:
+            return
+
+        tawss = self.indices["TAWSS"].vector().get_local() / self.count
+        twssg = self.indices["TWSSG"].vector().get_local() / max(self.count - 1, 1)
+        wss_mean = Function(self.Vv_boundary)
+        wss_mean.vector().axpy(1 / self.count, self.indices["WSS_mean"].vector())
+        wss_mean_magnitude = self.magnitude(wss_mean)
+
+        osi = 0.5 * (1 - wss_mean_magnitude / tawss)
+        values = dict(TAWSS=tawss, TWSSG=twssg, OSI=osi, RRT=1 / wss_mean_magnitude, ECAP=osi / tawss)
+
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        for name, value in values.items():
+            index = Function(self.V_boundary)
+            index.vector().set_local(value)
+            index.vector().apply("insert")
+            index.rename(name, name)
+            with XDMFFile(self.comm, str(self.output_folder / f"{name}.xdmf")) as xdmf:
+                xdmf.write_checkpoint(index, name, 0, XDMFFile.Encoding.HDF5, append=False)
@@ -0,0 +1,131 @@
+"""
+Coarse-to-fine warm start of a simulation. The first part of a simulation, where the boundary conditions are ramped
+up, is run on a coarse mesh of the same geometry with a larger time step, e.g. a mesh generated with
+vasp-generate-mesh with a larger coarsening factor, such that the boundary ids are the same. The displacement,
+velocity and pressure at the end of the ramp are interpolated onto the production mesh and written as a turtleFSI
+checkpoint, which the production simulation is restarted from, e.g.
+
+    vasp-warm-start --problem aneurysm --coarse-mesh-path mesh/file_aneurysm_coarse.h5 \\
+        --mesh-path mesh/file_aneurysm.h5 --t-warm 0.25 --coarse-dt 0.002 --mpirun "mpirun -np 8"
+    mpirun -np 64 turtleFSI -p aneurysm --restart-folder warm_start/fine
+
+The restarted simulation uses the parameters of the problem file, with the production mesh and time step.
+"""
+import argparse
+import json
+import shlex
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional
+
+from dolfin import MPI
+
+from vasp.automatedPreprocessing.warm_cache import import_problem, get_problem_parameters
+from vasp.simulations.simulation_common import interpolate_checkpoint
+
+# Problem parameters with the end time of the ramps of the boundary conditions
+RAMP_PARAMETERS = ["vel_t_ramp", "p_t_ramp_end"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", type=str, required=True,
+                        help="Name of a problem file in vasp.simulations (e.g. aneurysm, avf, offset_stenosis)")
+    parser.add_argument("--coarse-mesh-path", type=Path, required=True, help="Path to the coarse mesh")
+    parser.add_argument("--mesh-path", type=Path, required=True, help="Path to the production mesh")
+    parser.add_argument("--t-warm", type=float, default=None,
+                        help="End time of the coarse run (default: end of the ramps in the problem parameters)")
+    parser.add_argument("--coarse-dt", type=float, required=True, help="Time step size of the coarse run")
+    parser.add_argument("--dt", type=float, default=None,
+                        help="Time step size of the production run (default: from the problem file)")
+    parser.add_argument("--T", type=float, default=None,
+                        help="End time of the production run (default: from the problem file)")
+    parser.add_argument("--mpirun", type=str, default="mpirun -np 1", help="Command to run the coarse run with")
+    parser.add_argument("--folder", type=Path, default=Path("warm_start"),
+                        help="Folder for the coarse run and the checkpoint of the production run")
+    return parser.parse_args()
+
+
+def get_ramp_end(problem_parameters: Dict) -> Optional[float]:
+    """
+    Get the time at which all ramps of the boundary conditions of a problem have ended.
+
+    Args:
+        problem_parameters (dict): Problem parameters.
+
+    Returns:
+        float: End time of the ramps, or None if the problem has no ramp parameters.
+    """
+    ramp_ends = [float(problem_parameters[name]) for name in RAMP_PARAMETERS if name in problem_parameters]
+
+    return max(ramp_ends) if ramp_ends else None
+
+
+def run_warm_start(problem: str, coarse_mesh_path: Path, mesh_path: Path, t_warm: Optional[float], coarse_dt: float,
+                   dt: Optional[float], T: Optional[float], mpirun: str, folder: Path) -> Path:
+    """
+    Run a problem on a coarse mesh until the end of the ramp, and interpolate the solution onto the production mesh.
+
+    Args:
+        problem (str): Name of a problem file in vasp.simulations.
+        coarse_mesh_path (Path): Path to the coarse mesh.
+        mesh_path (Path): Path to the production mesh.
+        t_warm (float, optional): End time of the coarse run. Defaults to the end of the ramps of the problem.
+        coarse_dt (float): Time step size of the coarse run.
+        dt (float, optional): Time step size of the production run. Defaults to the one of the problem file.
+        T (float, optional): End time of the production run. Defaults to the one of the problem file.
+        mpirun (str): Command to run the coarse run with.
+        folder (Path): Folder for the coarse run and the checkpoint of the production run.
+
+    Returns:
+        Path: Folder to restart the production run from.
+    """
+    problem_parameters = get_problem_parameters(import_problem(problem))
+    t_warm = t_warm if t_warm is not None else get_ramp_end(problem_parameters)
+    assert t_warm is not None, f"The problem {problem} has no ramp parameters, set the end time with --t-warm"
+    dt = dt if dt is not None else problem_parameters["dt"]
+    T = T if T is not None else problem_parameters["T"]
+
+    # Write a checkpoint after the last coarse time step only. The end time is half a time step before the last time
+    # step, so exactly num_steps time steps are run
+    num_steps = max(int(round(t_warm / coarse_dt)), 1)
+    coarse_folder = folder.resolve() / "coarse"
+    cmd = (mpirun + f" turtleFSI -p {problem} -dt {coarse_dt} -T {(num_steps - 0.5) * coarse_dt}" +
+           f" --folder {coarse_folder} --sub-folder 1 --new-arguments mesh_path={coarse_mesh_path.resolve()}" +
+           f" checkpoint_step={num_steps} save_step={num_steps + 1}")
+    print(f"--- Running {num_steps} time steps on {coarse_mesh_path.name}: {cmd}")
+    coarse_folder.mkdir(parents=True, exist_ok=True)
+    # turtleFSI looks for the problem file in the working directory
+    with open(coarse_folder / "log.txt", "w") as log:
+        subprocess.run(shlex.split(cmd), cwd=Path(__file__).parent, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    # Continue from the end of the coarse run, with the parameters of the problem file and the production time step
+    coarse_checkpoint = coarse_folder / "1" / "Checkpoint"
+    with open(coarse_checkpoint / "default_variables.json") as f:
+        t = json.load(f).get("t", num_steps * coarse_dt)
+    restart_folder = folder.resolve() / "fine"
+    print(f"--- Interpolating the solution at t={t} onto {mesh_path.name}")
+    interpolate_checkpoint(coarse_checkpoint, mesh_path.resolve(), restart_folder / "Checkpoint", dt=dt, T=T,
+                           counter=int(round(t / dt)), checkpoint_step=problem_parameters["checkpoint_step"],
+                           save_step=problem_parameters["save_step"], folder=problem_parameters["folder"])
+
+    return restart_folder
+
+
+def main() -> None:
+    assert MPI.size(MPI.comm_world) == 1, "This script only runs in serial, and launches the coarse run itself."
+
+    args = parse_arguments()
+    restart_folder = run_warm_start(args.problem, args.coarse_mesh_path, args.mesh_path, args.t_warm, args.coarse_dt,
+                                    args.dt, args.T, args.mpirun, args.folder)
+    print(f"--- Restart the production run with: turtleFSI -p {args.problem} --restart-folder {restart_folder}")
+
+
+if __name__ == "__main__":
+    main()
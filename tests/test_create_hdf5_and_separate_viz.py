@@ -2,6 +2,9 @@ import pytest
 import subprocess
 import h5py
 import numpy as np
+from dolfin import UnitCubeMesh, VectorFunctionSpace, Function, Expression, interpolate, HDF5File
+
+from vasp.automatedPostprocessing.postprocessing_fenics.create_hdf5 import HDF5FunctionWriter
 
 # Define the list of input geometrical data paths
 # Since we will run turtleFSI from src/vasp/simulations/, we need to go up one level
@@ -219,3 +222,118 @@ def test_create_hdf5_with_time(input_mesh, tmpdir):
     displacement_xdmf_path = tmpdir / "1" / "Visualization_separate_domain" / "displacement_solid.xdmf"
     assert displacement_h5_path.exists(), "Separate visualization for displacement does not exist"
     assert displacement_xdmf_path.exists(), "Separate visualization for displacement does not exist"
+
+
+@pytest.mark.parametrize("input_mesh", [input_data_paths[0]])
+def test_create_hdf5_parallel(input_mesh, tmpdir):
+    """
+    Test create_hdf5 function in parallel, where the time steps are split between the processes
+    """
+    # 1. run turtleFSI to create some simulation results
+    cmd = ("turtleFSI -p cylinder -dt 0.001 -T 0.002 --verbose True" +
+           f" --theta 0.51 --folder {tmpdir} --sub-folder 1 --save-deg 2 --new-arguments mesh_path={input_mesh}")
+    _ = subprocess.check_output(cmd, shell=True, cwd="src/vasp/simulations/")
+    # 2. run vasp-refine-mesh to refine the mesh
+    cmd = (f"vasp-refine-mesh --folder {tmpdir}/1/")
+    _ = subprocess.check_output(cmd, shell=True)
+
+    # 3. run vasp-separate-mesh to separate the mesh
+    cmd = (f"vasp-separate-mesh --folder {tmpdir}/1/")
+    _ = subprocess.check_output(cmd, shell=True)
+
+    # 4. run vasp-create-hdf5 with more processes than time steps, where the last process writes no segment
+    velocity_hdf5_path = tmpdir / "1" / "Visualization_separate_domain" / "u.h5"
+    cmd = (f"mpirun -np 4 vasp-create-hdf5 --folder {tmpdir}/1/")
+    _ = subprocess.check_output(cmd, shell=True)
+    with h5py.File(velocity_hdf5_path, "r") as f:
+        assert f["velocity"].attrs["count"] == 3, "Processes without time steps should not be combined"
+
+    # 5. run vasp-create-hdf5 again with two processes to create the hdf5 file
+    cmd = (f"mpirun -np 2 vasp-create-hdf5 --folder {tmpdir}/1/")
+    _ = subprocess.check_output(cmd, shell=True)
+
+    # 6. check if the hdf5 file and the segments of both processes exist, and the segments of the earlier run are gone
+    assert velocity_hdf5_path.exists(), "Velocity hdf5 file does not exist"
+    displacement_hdf5_path = tmpdir / "1" / "Visualization_separate_domain" / "d_solid.h5"
+    assert displacement_hdf5_path.exists(), "Displacement hdf5 file does not exist"
+    segment_paths = sorted((tmpdir / "1" / "Visualization_separate_domain" / "segments").listdir())
+    assert [path.basename for path in segment_paths] == ["d_solid_0.h5", "d_solid_1.h5", "u_0.h5", "u_1.h5"], \
+        f"Unexpected segments {segment_paths}"
+
+    # 7. check if the combined hdf5 file has the same values and layout as in serial
+    with h5py.File(velocity_hdf5_path, "r") as f:
+        assert f["velocity"].attrs["count"] == 3, "Not all time steps were combined"
+        assert all(name in f["velocity"] for name in ["cells", "cell_dofs", "x_cell_dofs"]), \
+            "Function basis was not copied"
+        first_time = f["velocity/vector_0"][0]
+        assert np.isclose(first_time, 4.38261949610407E-6, atol=1e-10)
+        last_time = f["velocity/vector_2"][0]
+        assert np.isclose(last_time, 8.137814761280497E-6, atol=1e-10)
+        timestamps = [f[f"velocity/vector_{i}"].attrs["timestamp"] for i in range(3)]
+        assert np.all(np.diff(timestamps) > 0), "Time steps are not in order"
+
+    with h5py.File(displacement_hdf5_path, "r") as f:
+        first_time = f["displacement/vector_0"][0]
+        assert np.isclose(first_time, 2.235075700301419E-9, atol=1e-10)
+        last_time = f["displacement/vector_2"][0]
+        assert np.isclose(last_time, 1.3776599148439903E-8, atol=1e-10)
+
+    # 7. create separate visualization from the combined files
+    cmd = (f"vasp-create-separate-domain-viz --folder {tmpdir}/1/")
+    _ = subprocess.check_output(cmd, shell=True)
+
+    velocity_xdmf_path = tmpdir / "1" / "Visualization_separate_domain" / "velocity_fluid.xdmf"
+    assert velocity_xdmf_path.exists(), "Separate visualization for velocity does not exist"
+
+
+def test_hdf5_function_writer(tmpdir):
+    """
+    Test that the h5py writer writes vertex values in the same layout as HDF5File, including the attributes and
+    integer types, such that they can be read back with HDF5File
+    """
+    mesh = UnitCubeMesh(2, 2, 2)
+    V = VectorFunctionSpace(mesh, "CG", 1)
+    expression = Expression(("t * x[0]", "x[1] * x[2]", "t + x[2]"), t=0.0, degree=1)
+    times = [0.1, 0.2, 0.3]
+    values = []
+    for t in times:
+        expression.t = t
+        values.append(np.array([expression(vertex) for vertex in mesh.coordinates()]))
+
+    output_path = tmpdir / "u.h5"
+    writer = HDF5FunctionWriter(V, output_path, "velocity")
+    writer.write(times[:2], values[:2])
+    writer.write(times[2:], values[2:])
+    writer.close()
+
+    # Compare the layout with the output of HDF5File
+    reference_path = tmpdir / "u_reference.h5"
+    with HDF5File(mesh.mpi_comm(), str(reference_path), "w") as hdf5:
+        hdf5.write(interpolate(expression, V), "/velocity", times[2])
+    with h5py.File(output_path, "r") as f, h5py.File(reference_path, "r") as reference:
+        assert f["velocity"].attrs["count"] == 3, "Not all time steps were written"
+        for name in ["cells", "cell_dofs", "x_cell_dofs"]:
+            assert np.array_equal(f[f"velocity/{name}"][()], reference[f"velocity/{name}"][()]), \
+                f"{name} differs from HDF5File"
+            assert f[f"velocity/{name}"].dtype == reference[f"velocity/{name}"].dtype, \
+                f"Integer type of {name} differs from HDF5File"
+        assert sorted(f["velocity"].attrs) == sorted(reference["velocity"].attrs), "Attributes differ from HDF5File"
+        assert f["velocity"].attrs["signature"] == reference["velocity"].attrs["signature"], "Signature differs"
+        assert np.allclose(f["velocity/vector_2"][()], reference["velocity/vector_0"][()]), \
+            "Vector differs from HDF5File"
+        vector, reference_vector = f["velocity/vector_2"], reference["velocity/vector_0"]
+        assert sorted(vector.attrs) == sorted(reference_vector.attrs), "Vector attributes differ from HDF5File"
+        assert np.array_equal(vector.attrs["partitions"], reference_vector.attrs["partitions"]), \
+            "Partitions differ from HDF5File"
+        assert vector.attrs["partitions"].dtype == reference_vector.attrs["partitions"].dtype, \
+            "Integer type of the partitions differs from HDF5File"
+
+    # Read back with HDF5File, which uses the function basis and the partitions
+    u = Function(V)
+    with HDF5File(mesh.mpi_comm(), str(output_path), "r") as hdf5:
+        for i, t in enumerate(times):
+            hdf5.read(u, f"/velocity/vector_{i}")
+            expression.t = t
+            assert np.isclose(hdf5.attributes(f"/velocity/vector_{i}")["timestamp"], t), "Unexpected timestamp"
+            assert np.allclose(u.vector().get_local(), interpolate(expression, V).vector().get_local()), \
+                f"Unexpected values at t={t}"
@@ -6,8 +6,13 @@ import subprocess
 import argparse
 from pathlib import Path
 
+import h5py
+import numpy as np
 import matplotlib.testing.compare as mpl_compare
 
+from vasp.automatedPostprocessing.log_plotter import parse_telemetry_file
+from vasp.simulations.telemetry import TelemetryWriter
+
 
 test_cases = [
     ("offset_stenosis_5_cycles.log", ["--plot-cpu-time", "--end-cycle=3"], "cpu_time.png"),
@@ -126,6 +131,89 @@ def test_plot_all(tmpdir):
         assert result is None, f"Images differ: {result}"
 
 
+def test_parse_telemetry_file(tmpdir):
+    """
+    Test that a telemetry file is read into the same structure as a parsed log file.
+    """
+    telemetry_path = Path(tmpdir) / "telemetry.h5"
+    time = np.array([0.001, 0.002, 0.003])
+    probe_velocity = np.arange(3 * 2 * 3, dtype=float).reshape(3, 2, 3)
+    with h5py.File(telemetry_path, "w") as f:
+        f.attrs["parameters"] = '{"T": 0.003, "dt": 0.001, "T_Cycle": 0.951}'
+        for name, values in [("time_step", np.array([1, 2, 3])), ("flow_rate", np.array([1.0, 2.0, 3.0])),
+                             ("min_jacobian", np.array([1.0, 0.9, 0.8])), ("probe_velocity", probe_velocity),
+                             ("probe_pressure", np.ones((3, 2, 1)))]:
+            f.create_group(name)
+            f[name]["time"] = time
+            f[name]["values"] = values
+
+    parameters, data = parse_telemetry_file(str(telemetry_path))
+
+    assert parameters["T_Cycle"] == 0.951, "Parameters were not read from the telemetry file"
+    assert np.allclose(data["time"], time), f"Unexpected time {data['time']}"
+    assert data["time_step"].tolist() == [1, 2, 3], f"Unexpected time steps {data['time_step']}"
+    assert np.allclose(data["flow_properties"]["flow_rate"], [1.0, 2.0, 3.0]), "Unexpected flow rate"
+    assert data["flow_properties"]["cfl_mean"].size == 0, "Missing quantities should be empty"
+    assert np.allclose(data["min_jacobian"], [1.0, 0.9, 0.8]), "Unexpected minimum Jacobian"
+    assert sorted(data["probe_points"].keys()) == [0, 1], "Unexpected probe points"
+    assert np.allclose(data["probe_points"][1]["velocity"], probe_velocity[:, 1]), "Unexpected probe velocity"
+    assert np.allclose(data["probe_points"][1]["magnitude"], np.linalg.norm(probe_velocity[:, 1], axis=1))
+    assert np.allclose(data["probe_points"][0]["pressure"], 1.0), "Unexpected probe pressure"
+
+
+def test_parse_telemetry_file_from_writer(tmpdir):
+    """
+    Test that the CPU time and the Newton iterations recorded by the simulations are read like from a log file.
+    """
+    telemetry_path = Path(tmpdir) / "telemetry.h5"
+    telemetry = TelemetryWriter(telemetry_path, flush_interval=2, parameters=dict(T=0.002, dt=0.001, T_Cycle=0.951))
+    residuals = {0.001: [1.0, 1e-4], 0.002: [1.0, 1e-3, 1e-7]}
+    for counter, (t, newton_atol) in enumerate(residuals.items(), start=1):
+        telemetry.record(t, time_step=counter, cpu_time=0.5 * counter)
+        telemetry.record_sequence(t, newton_atol=newton_atol, newton_rtol=[0.1 * r for r in newton_atol])
+    telemetry.flush()
+
+    parameters, data = parse_telemetry_file(str(telemetry_path))
+
+    assert parameters["dt"] == 0.001, "Parameters were not written by the telemetry writer"
+    assert data["time_step"].tolist() == [1, 2], f"Unexpected time steps {data['time_step']}"
+    assert np.allclose(data["cpu_time"], [0.5, 1.0]), f"Unexpected CPU time {data['cpu_time']}"
+    assert np.allclose(data["times"]["cpu_time"], [0.001, 0.002]), "Unexpected time of the CPU time"
+    assert np.allclose(data["newton_iteration"]["atol"], [1.0, 1e-4, 1.0, 1e-3, 1e-7]), "Unexpected Newton atol"
+    assert np.allclose(data["newton_iteration"]["rtol"], [0.1, 1e-5, 0.1, 1e-4, 1e-8]), "Unexpected Newton rtol"
+
+
+def test_parse_sparse_telemetry_file(tmpdir):
+    """
+    Test that quantities recorded at different steps are each read with their own time, and are averaged over the
+    cycles using their own records.
+    """
+    telemetry_path = Path(tmpdir) / "telemetry.h5"
+    time = np.arange(1, 41) * 0.001
+    with h5py.File(telemetry_path, "w") as f:
+        f.attrs["parameters"] = '{"T": 0.04, "dt": 0.001, "T_Cycle": 0.02}'
+        for name, record_time, values in [("time_step", time, np.arange(1, 41)), ("cpu_time", time, np.ones(40)),
+                                          ("flow_rate", time[1::4], np.tile([1.0, 2.0, 3.0, 4.0, 5.0], 2))]:
+            f.create_group(name)
+            f[name]["time"] = record_time
+            f[name]["values"] = values
+
+    _, data = parse_telemetry_file(str(telemetry_path))
+
+    assert np.allclose(data["times"]["cpu_time"], time), "Unexpected time of the CPU time"
+    assert np.allclose(data["times"]["flow_rate"], time[1::4]), "Flow rate was not read with its own time"
+    assert data["times"]["cfl"].size == 0, "Missing quantities should have an empty time"
+
+    command = ["vasp-log-plotter", str(telemetry_path), "--save", f"--output-directory={tmpdir}", "--compute-average",
+               "--plot-flow-rate"]
+    subprocess.run(command, check=True)
+    assert (Path(tmpdir) / "flow_rate.png").exists(), "Sparse flow rate was not averaged and plotted"
+
+    # No records fall within cycles that were never simulated
+    result = subprocess.run(command + ["--start-cycle=3", "--end-cycle=4"], capture_output=True, text=True)
+    assert result.returncode != 0 and "between cycle 3 and cycle 4" in result.stderr, result.stderr
+
+
 # Reference image generation and command-line argument handling functions
 
 
@@ -1,14 +1,17 @@
 import subprocess
+import h5py
 import pytest
 from pathlib import Path
 import numpy as np
 
 import vtk
-from dolfin import Mesh, HDF5File, XDMFFile, FunctionSpace, Function
+from dolfin import Mesh, HDF5File, XDMFFile, FunctionSpace, Function, Measure, assemble
 from vampy.automatedPreprocessing.preprocessing_common import read_polydata
 
 from vasp.automatedPreprocessing.automated_preprocessing import read_command_line, \
     run_pre_processing
+from vasp.automatedPreprocessing.preprocessing_common import reorder_mesh, mesh_bandwidth
+from vasp.simulations.simulation_common import load_mesh_and_data
 
 # Define test cases for testing command line options for vasp-generate-mesh script
 command_line_test_cases = [
@@ -21,6 +24,7 @@ command_line_test_cases = [
     (["-i", "tests/test_data/cylinder/cylinder.vtp", "-mf", "xml"], "--- Writing Dolfin file"),
     (["-i", "tests/test_data/cylinder/cylinder.vtp", "-mf", "hdf5"], "--- Converting XML mesh to HDF5"),
     (["-i", "tests/test_data/cylinder/cylinder.vtp", "-mf", "xdmf"], "--- Converting VTU mesh to XDMF"),
+    (["-i", "tests/test_data/cylinder/cylinder.vtp", "-rm", "rcm"], "--- Reordering mesh with rcm"),
     (["-i", "tests/test_data/tube/tube.stl", "-sc", "0.001", "-c", "1"], "--- Scale model by factor 0.001"),
     (["-i", "tests/test_data/artery/artery.stl", "-m", "curvature", "-c", "1.6"], "Number of cells: 135660"),
     (["-i", "tests/test_data/tube/tube.stl", "-m", "diameter"], "Number of cells: 14223"),
@@ -515,3 +519,33 @@ def test_xdmf_mesh_format(tmpdir):
         f"VTU mesh has {mesh_vtu.GetNumberOfPoints()} points, expected {expected_num_points}"
     assert mesh_xdmf.num_cells() == expected_num_cells, \
         f"XDMF mesh has {mesh_xdmf.num_cells()} cells, expected {expected_num_cells}"
+
+
+@pytest.mark.parametrize("method", ["rcm", "hilbert"])
+def test_reorder_mesh(method, tmpdir):
+    """
+    Test that a reordered mesh has the same cells and markers as the original mesh.
+    """
+    mesh_path = Path("tests/test_data/cylinder/cylinder.h5")
+    reordered_path = reorder_mesh(mesh_path, Path(tmpdir) / "cylinder_reordered.h5", method)
+
+    with h5py.File(mesh_path, "r") as original, h5py.File(reordered_path, "r") as reordered:
+        original_bandwidth = mesh_bandwidth(original["mesh/topology"][()])
+        reordered_bandwidth = mesh_bandwidth(reordered["mesh/topology"][()])
+        assert np.allclose(np.sort(original["mesh/coordinates"][()], axis=0),
+                           np.sort(reordered["mesh/coordinates"][()], axis=0)), "Vertices changed by the reordering"
+    if method == "rcm":
+        assert reordered_bandwidth < original_bandwidth, "Reverse Cuthill-McKee did not reduce the bandwidth"
+
+    original_mesh, original_boundaries, original_domains = load_mesh_and_data(mesh_path)
+    mesh, boundaries, domains = load_mesh_and_data(reordered_path)
+    assert mesh.num_cells() == original_mesh.num_cells(), "Number of cells changed by the reordering"
+
+    # The marked volumes and areas are the same
+    markers = [(domains, original_domains, "dx"), (boundaries, original_boundaries, "ds")]
+    for marker, original_marker, measure in markers:
+        for marker_id in np.unique(original_marker.array()):
+            original_size = assemble(1 * Measure(measure, domain=original_mesh, subdomain_data=original_marker)(
+                int(marker_id)))
+            size = assemble(1 * Measure(measure, domain=mesh, subdomain_data=marker)(int(marker_id)))
+            assert np.isclose(size, original_size), f"Size of marker {marker_id} changed by the reordering"
@@ -1,13 +1,32 @@
+import json
+import time
 from pathlib import Path
 
+import h5py
 import pytest
 import numpy as np
-from dolfin import Mesh, cpp
+from scipy.signal import spectrogram
+from dolfin import Mesh, cpp, UnitCubeMesh, VectorFunctionSpace, FunctionSpace, Expression, interpolate, \
+    MeshFunction, facets, CompiledSubDomain, Function, HDF5File, BoundaryMesh, XDMFFile, assemble, dx, Measure, \
+    parameters
 
+from vasp.automatedPostprocessing.log_plotter import parse_telemetry_file
 from vasp.automatedPreprocessing.automated_preprocessing import read_command_line, \
     run_pre_processing
-from vasp.simulations.simulation_common import load_mesh_and_data, load_mesh_info, \
-    load_probe_points
+from vasp.simulations.boundary_conditions import fourier_series_magnitude, PeriodicWaveform, PeriodicInletCache
+from vasp.simulations.jacobian_policy import AdaptiveJacobianPolicy, record_newton_iterations, newton_iterations
+from vasp.simulations.periodic_convergence import PeriodicConvergenceMonitor
+from vasp.simulations.probe_sampler import ProbeSampler, load_probe_time_series
+from vasp.simulations.region_output import RegionWriter, load_region_output
+from vasp.simulations.regions import region_from_parameters, remark_entities
+from vasp.simulations.separate_domain import SeparateDomainWriter, create_separate_domain_meshes
+from vasp.simulations.simulation_common import load_mesh_and_data, load_mesh_info, load_probe_points, \
+    save_partitioned_mesh, get_partition_path, is_valid_partition, refine_mesh_and_data, interpolate_checkpoint
+from vasp.simulations.spectral_analysis import SpectralAnalyzer
+from vasp.simulations.streaming_statistics import StreamingStatistics
+from vasp.simulations.telemetry import TelemetryWriter, load_telemetry
+from vasp.simulations.timers import StepTimer, HookTimers, DiagnosticsScheduler
+from vasp.simulations.wall_shear_stress import WallShearStress
 
 
 @pytest.fixture(scope="function")
@@ -103,6 +122,111 @@ def test_load_mesh_and_data(temporary_hdf5_file):
             f"Known domain ID ({known_domain_id}) not found in loaded domains."
 
 
+def test_save_partitioned_mesh(temporary_hdf5_file, tmpdir):
+    """
+    Test that a partitioned mesh is saved, loaded instead of the original mesh, and invalidated by mesh changes.
+    """
+    partition_folder = Path(tmpdir) / "Partitions"
+    partition_path = save_partitioned_mesh(temporary_hdf5_file, partition_folder)
+
+    assert partition_path == get_partition_path(temporary_hdf5_file, partition_folder), "Unexpected partition path"
+    assert partition_path.exists(), f"Partitioned mesh {partition_path} was not saved"
+    assert is_valid_partition(temporary_hdf5_file, partition_path), "Partition should be valid for the same mesh"
+
+    mesh, boundaries, domains = load_mesh_and_data(temporary_hdf5_file, partition_folder)
+    original_mesh, original_boundaries, original_domains = load_mesh_and_data(temporary_hdf5_file, tmpdir)
+
+    assert mesh.num_cells() == original_mesh.num_cells(), "Partitioned mesh has a different number of cells"
+    assert np.array_equal(np.sort(domains.array()), np.sort(original_domains.array())), "Domains differ"
+    assert np.array_equal(np.sort(boundaries.array()), np.sort(original_boundaries.array())), "Boundaries differ"
+
+    # Changing the mesh file invalidates the partition
+    with open(temporary_hdf5_file, "ab") as f:
+        f.write(b"\0")
+    assert not is_valid_partition(temporary_hdf5_file, partition_path), "Partition should be invalid after a change"
+
+
+def test_refine_mesh_and_data(tmpdir):
+    """
+    Test that a refined mesh keeps the domain markers and the marked boundary area.
+    """
+    mesh = UnitCubeMesh(2, 2, 2)
+    domains = MeshFunction("size_t", mesh, 3, 1)
+    domains.array()[:8] = 2
+    boundaries = MeshFunction("size_t", mesh, 2, 0)
+    CompiledSubDomain("on_boundary && near(x[0], 0)").mark(boundaries, 3)
+
+    mesh_path = Path(tmpdir) / "mesh.h5"
+    with HDF5File(mesh.mpi_comm(), str(mesh_path), "w") as hdf5:
+        hdf5.write(mesh, "/mesh")
+        hdf5.write(boundaries, "/boundaries")
+        hdf5.write(domains, "/domains")
+
+    refinement_algorithm = parameters["refinement_algorithm"]
+    refined_path = refine_mesh_and_data(mesh_path, Path(tmpdir) / "refined.h5", levels=1)
+    refined_mesh, refined_boundaries, refined_domains = load_mesh_and_data(refined_path)
+
+    assert parameters["refinement_algorithm"] == refinement_algorithm, "The refinement algorithm was not restored"
+
+    assert refined_mesh.num_cells() == 8 * mesh.num_cells(), "Each refinement should split every cell into eight"
+    assert np.sum(refined_domains.array() == 2) == 8 * 8, "Domain markers were not transferred"
+    assert set(np.unique(refined_boundaries.array())) == {0, 3}, "Unexpected boundary markers"
+    ds_refined = Measure("ds", domain=refined_mesh, subdomain_data=refined_boundaries)
+    assert np.isclose(assemble(1 * ds_refined(3)), 1.0), "Marked boundary area changed by the refinement"
+
+
+def test_interpolate_checkpoint(tmpdir):
+    """
+    Test that a checkpoint on a coarse mesh is interpolated onto a fine mesh, that the parameters are updated, and
+    that the previous time step is moved to the new time step size.
+    """
+    checkpoint_folder = Path(tmpdir) / "coarse" / "Checkpoint"
+    checkpoint_folder.mkdir(parents=True)
+    mesh_paths = {}
+    for name, n in [("coarse", 2), ("fine", 4)]:
+        mesh = UnitCubeMesh(n, n, n)
+        mesh_paths[name] = Path(tmpdir) / f"{name}.h5"
+        with HDF5File(mesh.mpi_comm(), str(mesh_paths[name]), "w") as hdf5:
+            hdf5.write(mesh, "/mesh")
+            hdf5.write(MeshFunction("size_t", mesh, 2, 0), "/boundaries")
+            hdf5.write(MeshFunction("size_t", mesh, 3, 1), "/domains")
+
+    # Linear fields are interpolated exactly
+    coarse_mesh, _, _ = load_mesh_and_data(mesh_paths["coarse"])
+    fields = dict(d1=Expression(("x[0]", "x[1]", "2 * x[2]"), degree=1), v1=Expression(("x[1]", "0", "0"), degree=1),
+                  p1=Expression("x[0] + x[1] + x[2]", degree=1),
+                  d2=Expression(("x[0] - 0.002", "x[1]", "2 * x[2] - 0.004"), degree=1),
+                  v2=Expression(("x[1]", "0", "0"), degree=1), p2=Expression("x[0] + x[1] + x[2] - 0.02", degree=1))
+    for name, expression in fields.items():
+        space = FunctionSpace if name.startswith("p") else VectorFunctionSpace
+        with XDMFFile(str(checkpoint_folder / f"checkpoint_{name}.xdmf")) as xdmf:
+            xdmf.write_checkpoint(interpolate(expression, space(coarse_mesh, "CG", 1)), name)
+    with open(checkpoint_folder / "default_variables.json", "w") as f:
+        json.dump(dict(mesh_path=str(mesh_paths["coarse"]), d_deg=1, v_deg=1, p_deg=1, t=0.2, dt=0.002), f)
+
+    output_folder = interpolate_checkpoint(checkpoint_folder, mesh_paths["fine"], Path(tmpdir) / "fine" / "Checkpoint",
+                                           dt=0.001, counter=200)
+
+    with open(output_folder / "default_variables.json") as f:
+        default_variables = json.load(f)
+    assert default_variables["mesh_path"] == str(mesh_paths["fine"]), "Mesh path was not updated"
+    assert default_variables["dt"] == 0.001 and default_variables["counter"] == 200, "Parameters were not updated"
+    assert default_variables["t"] == 0.2, "Time of the checkpoint changed"
+
+    # The previous time step is at t - 0.001 instead of t - 0.002, with the same time derivative
+    fields.update(d2=Expression(("x[0] - 0.001", "x[1]", "2 * x[2] - 0.002"), degree=1),
+                  p2=Expression("x[0] + x[1] + x[2] - 0.01", degree=1))
+    fine_mesh, _, _ = load_mesh_and_data(mesh_paths["fine"])
+    for name, expression in fields.items():
+        space = FunctionSpace if name.startswith("p") else VectorFunctionSpace
+        V = space(fine_mesh, "CG", 1)
+        f = Function(V)
+        with XDMFFile(str(output_folder / f"checkpoint_{name}.xdmf")) as xdmf:
+            xdmf.read_checkpoint(f, name)
+        assert np.allclose(f.vector().get_local(), interpolate(expression, V).vector().get_local()), \
+            f"{name} was not interpolated onto the fine mesh"
+
+
 def test_load_mesh_info(temporary_hdf5_file):
     """
     Test the load_mesh_info function with specific expected values.
@@ -175,3 +299,622 @@ def test_load_probe_points(temporary_hdf5_file):
     # Check if the loaded probe points match the expected data
     assert np.allclose(loaded_probe_points, expected_probe_points), \
         f"Loaded probe points:\n{loaded_probe_points}\n do not match expected values:\n{expected_probe_points}"
+
+
+def test_probe_sampler(tmpdir):
+    """
+    Test that the ProbeSampler reproduces linear fields exactly and writes a readable binary time series.
+    """
+    mesh = UnitCubeMesh(4, 4, 4)
+    v = interpolate(Expression(("x[0]", "2 * x[1]", "x[0] + x[2]"), degree=1), VectorFunctionSpace(mesh, "CG", 2))
+    p = interpolate(Expression("1 + x[0] - x[1]", degree=1), FunctionSpace(mesh, "CG", 1))
+
+    # The last point is outside the mesh and should be reported as NaN
+    probe_points = np.array([[0.1, 0.2, 0.3], [0.5, 0.5, 0.5], [0.9, 0.05, 0.7], [2.0, 2.0, 2.0]])
+    output_path = Path(tmpdir) / "probes.bin"
+    sampler = ProbeSampler(mesh, probe_points, output_path)
+
+    for t in [0.1, 0.2]:
+        values = sampler.sample(velocity=v, pressure=p)
+        sampler.write(t, values)
+
+    x, y, z = probe_points[:3].T
+    expected_velocity = np.column_stack([x, 2 * y, x + z])
+    expected_pressure = 1 + x - y
+
+    assert np.allclose(values["velocity"][:3], expected_velocity), \
+        f"Sampled velocity {values['velocity'][:3]} does not match expected values {expected_velocity}"
+    assert np.allclose(values["pressure"][:3, 0], expected_pressure), \
+        f"Sampled pressure {values['pressure'][:3, 0]} does not match expected values {expected_pressure}"
+    assert np.isnan(values["velocity"][3]).all(), "Point outside the mesh should be NaN"
+
+    times, series = load_probe_time_series(output_path)
+
+    assert np.allclose(times, [0.1, 0.2]), f"Loaded times {times} do not match expected values [0.1, 0.2]"
+    assert series["velocity"].shape == (2, 4, 3), f"Unexpected shape of velocity series {series['velocity'].shape}"
+    assert series["pressure"].shape == (2, 4, 1), f"Unexpected shape of pressure series {series['pressure'].shape}"
+    assert np.allclose(series["velocity"][-1, :3], expected_velocity)
+
+
+@pytest.mark.parametrize("region, expected_inside", [
+    ([0.5, 0.5, 0.5, 0.3], [True, False, False]),  # sphere
+    ([0.0, 0.6, 0.0, 0.6, 0.0, 0.6], [True, False, True]),  # box
+    ([0.5, 0.5, 0.0, 0.5, 0.5, 1.0, 0.2], [True, False, False]),  # cylinder
+    ([[0.5, 0.5, 0.5, 0.3], [0.9, 0.9, 0.9, 0.2]], [True, True, False]),  # union of spheres
+])
+def test_region_from_parameters(region, expected_inside):
+    """
+    Test the region predicates created from region parameters.
+    """
+    points = np.array([[0.5, 0.5, 0.5], [0.9, 0.9, 0.95], [0.1, 0.1, 0.1]])
+    inside = region_from_parameters(region)(points)
+
+    assert inside.tolist() == expected_inside, f"Region {region}: got {inside.tolist()}, expected {expected_inside}"
+
+
+def test_remark_entities():
+    """
+    Test that remark_entities gives the same markers as looping over the facet midpoints.
+    """
+    mesh = UnitCubeMesh(4, 4, 4)
+    boundaries = MeshFunction("size_t", mesh, 2, 0)
+    boundaries.array()[::2] = 22
+    boundaries.array()[1::2] = 33
+    expected = boundaries.array().copy()
+
+    center = np.array([0.5, 0.5, 0.5])
+    radius = 0.4
+    for facet in facets(mesh):
+        mid = facet.midpoint()
+        if np.linalg.norm(mid.array() - center) > radius:
+            expected[facet.index()] = 11
+
+    remark_entities(boundaries, region_from_parameters([0.5, 0.5, 0.5, radius]), {22: 11, 33: 11})
+
+    assert (boundaries.array() == expected).all(), "Re-marked facets do not match the reference loop"
+
+
+def test_periodic_waveform():
+    """
+    Test that the tabulated periodic waveform matches the direct Fourier series evaluation.
+    """
+    An = np.array([1.0, 0.3, -0.1])
+    Bn = np.array([0.0, 0.2, 0.05])
+    period = 0.951
+    dt = 0.951 / 100
+
+    # Reference: explicit loop over the harmonics
+    def reference(t):
+        return abs(sum((An[i] - Bn[i] * 1j) * np.exp(1j * i * 2 * np.pi / period * t) for i in range(len(An))))
+
+    waveform = PeriodicWaveform(lambda t: fourier_series_magnitude(An, Bn, period, t), period, dt)
+    assert waveform.table is not None, "Waveform should be tabulated when the period is a multiple of dt"
+
+    for step in [0, 1, 57, 100, 333]:
+        t = step * dt
+        assert np.isclose(waveform(t), reference(t)), f"Tabulated waveform differs from reference at t={t}"
+
+    # Period not a multiple of the time step falls back to direct evaluation
+    waveform = PeriodicWaveform(lambda t: fourier_series_magnitude(An, Bn, period, t), period, 0.0013)
+    assert waveform.table is None, "Waveform should not be tabulated when the period is not a multiple of dt"
+    assert np.isclose(waveform(0.5), reference(0.5)), "Direct evaluation differs from reference"
+
+
+class _TravellingWave:
+    """
+    Minimal stand-in for a Womersley component, counting the number of evaluations.
+    """
+    def __init__(self, component):
+        self.component = component
+        self.scale_value = 1.0
+        self.t = 0.0
+        self.evaluations = 0
+
+    def set_t(self, t):
+        self.t = t
+
+    def eval(self, value, x):
+        self.evaluations += 1
+        value[0] = self.scale_value * (self.component + 1) * np.sin(2 * np.pi * self.t) * (1 + x[1] + x[2])
+
+
+def test_periodic_inlet_cache(tmpdir):
+    """
+    Test that the inlet cache reproduces the expressions, only evaluates them over the first cycle, and that
+    a saved cycle is loaded from disk by a new cache.
+    """
+    mesh = UnitCubeMesh(4, 4, 4)
+    boundaries = MeshFunction("size_t", mesh, 2, 0)
+    CompiledSubDomain("on_boundary && near(x[0], 0)").mark(boundaries, 2)
+    V = FunctionSpace(mesh, "CG", 1)
+    dt = 0.1
+    expressions = [_TravellingWave(i) for i in range(3)]
+    cache = PeriodicInletCache(expressions, V, boundaries, 2, period=1.0, dt=dt, cache_folder=tmpdir,
+                               signature="test")
+    assert isinstance(cache.table, np.memmap), "Table should be tabulated into a memory mapped file"
+
+    x = V.tabulate_dof_coordinates().reshape(-1, 3)
+    for step in range(25):
+        t = step * dt
+        cache.update(t, scale=0.5)
+        for i, function in enumerate(cache.functions):
+            expected = 0.5 * (i + 1) * np.sin(2 * np.pi * t) * (1 + x[cache.dofs, 1] + x[cache.dofs, 2])
+            assert np.allclose(function.vector().get_local()[cache.dofs], expected), \
+                f"Inlet values of component {i} at t={t} do not match the expression"
+
+    assert expressions[0].evaluations == 10 * cache.dofs.size, "Expressions should only be evaluated for one cycle"
+    assert cache.cache_path.exists(), "Tabulated cycle was not saved"
+    assert not list(Path(tmpdir).glob("*.tmp.npy")), "Temporary table was not moved to the cache file"
+
+    # A new cache with the same key loads the cycle instead of evaluating the expressions
+    expressions = [_TravellingWave(i) for i in range(3)]
+    cache = PeriodicInletCache(expressions, V, boundaries, 2, period=1.0, dt=dt, cache_folder=tmpdir,
+                               signature="test")
+    cache.update(0.3)
+    assert expressions[0].evaluations == 0, "Cached cycle should be loaded from disk"
+    assert np.allclose(cache.functions[2].vector().get_local()[cache.dofs],
+                       3 * np.sin(2 * np.pi * 0.3) * (1 + x[cache.dofs, 1] + x[cache.dofs, 2]))
+
+    # Without a cache folder, a table larger than the memory limit is not tabulated
+    expressions = [_TravellingWave(i) for i in range(3)]
+    cache = PeriodicInletCache(expressions, V, boundaries, 2, period=1.0, dt=dt, max_memory=0)
+    assert cache.table is None, "Table larger than the memory limit should not be allocated"
+    for step in range(12):
+        cache.update(step * dt)
+    assert expressions[0].evaluations == 12 * cache.dofs.size, "Expressions should be evaluated at every step"
+
+
+def test_streaming_statistics(tmpdir):
+    """
+    Test the streaming mean, variance and phase averages, and that they survive a checkpoint and restart.
+    """
+    mesh = UnitCubeMesh(2, 2, 2)
+    V = FunctionSpace(mesh, "CG", 1)
+    period = 1.0
+    dt = 0.125
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(24, V.dofmap().ownership_range()[1] - V.dofmap().ownership_range()[0]))
+
+    statistics = StreamingStatistics(dict(p=V), period=period, num_phases=4)
+    f = Function(V)
+    for step, sample in enumerate(samples[:12]):
+        f.vector().set_local(sample)
+        f.vector().apply("insert")
+        statistics.update(step * dt, p=f)
+
+    # Checkpoint and continue in a new object, as after a restart
+    statistics.save(tmpdir)
+    statistics = StreamingStatistics(dict(p=V), period=period, num_phases=4)
+    assert statistics.load(tmpdir), "Statistics checkpoint was not found"
+    for step, sample in enumerate(samples[12:], start=12):
+        f.vector().set_local(sample)
+        f.vector().apply("insert")
+        statistics.update(step * dt, p=f)
+
+    assert statistics.count == 24, f"Expected 24 time steps, got {statistics.count}"
+    assert np.allclose(statistics.mean["p"], samples.mean(axis=0)), "Streaming mean does not match"
+    assert np.allclose(statistics.variance("p"), samples.var(axis=0)), "Streaming variance does not match"
+    assert np.allclose(statistics.rms("p"), np.sqrt((samples ** 2).mean(axis=0))), "Streaming RMS does not match"
+
+    # Two time steps per phase bin and cycle, i.e. steps 2 and 3 (mod 8) are in the second bin
+    phase_steps = [step for step in range(24) if step % 8 in [2, 3]]
+    assert np.allclose(statistics.phase_mean["p"][1], samples[phase_steps].mean(axis=0)), \
+        "Phase average does not match"
+
+    statistics.write(tmpdir)
+    for kind in ["mean", "std", "rms", "phase_mean"]:
+        assert (Path(tmpdir) / f"p_{kind}.xdmf").exists(), f"p_{kind}.xdmf was not written"
+
+
+def test_telemetry_writer(tmpdir):
+    """
+    Test that buffered telemetry records are flushed to the HDF5 file and can be loaded again.
+    """
+    telemetry_path = Path(tmpdir) / "telemetry.h5"
+    telemetry = TelemetryWriter(telemetry_path, flush_interval=3, parameters=dict(dt=0.1))
+    for step in range(5):
+        telemetry.record(step * 0.1, flow_rate=2.0 * step, probe_velocity=np.full((4, 3), step))
+
+    # Only the first three records have been flushed
+    assert load_telemetry(telemetry_path)["flow_rate"][0].size == 3, "Records were not flushed every 3 steps"
+
+    telemetry.flush()
+    records = load_telemetry(telemetry_path)
+
+    assert np.allclose(records["flow_rate"][0], [0.0, 0.1, 0.2, 0.3, 0.4]), "Unexpected telemetry times"
+    assert np.allclose(records["flow_rate"][1], [0.0, 2.0, 4.0, 6.0, 8.0]), "Unexpected telemetry values"
+    assert records["probe_velocity"][1].shape == (5, 4, 3), "Unexpected shape of array records"
+
+
+def test_sparse_telemetry(tmpdir):
+    """
+    Test that telemetry recorded at the cadence of a diagnostics schedule is read with the times of each quantity.
+    """
+    telemetry_path = Path(tmpdir) / "telemetry.h5"
+    telemetry = TelemetryWriter(telemetry_path, flush_interval=4, parameters=dict(dt=0.001, T=0.008, T_Cycle=0.004))
+    diagnostics = DiagnosticsScheduler(dict(flow_properties=dict(every=2), jacobian=dict(every=4)))
+    for counter in range(1, 9):
+        t = counter * 0.001
+        records = dict(time_step=counter, cpu_time=1.0)
+        flow_properties = diagnostics.run("flow_properties", counter, t, lambda: dict(flow_rate=float(counter)))
+        if flow_properties is not None:
+            records.update(flow_properties)
+        min_jacobian = diagnostics.run("jacobian", counter, t, lambda: 1.0 / counter)
+        if min_jacobian is not None:
+            records.update(min_jacobian=min_jacobian)
+        telemetry.record(t, **records)
+    telemetry.flush()
+
+    _, data = parse_telemetry_file(str(telemetry_path))
+
+    assert np.allclose(data["time"], np.arange(1, 9) * 0.001), f"Unexpected time {data['time']}"
+    assert np.allclose(data["times"]["flow_rate"], [0.002, 0.004, 0.006, 0.008]), "Unexpected flow rate times"
+    assert np.allclose(data["flow_properties"]["flow_rate"], [2.0, 4.0, 6.0, 8.0]), "Unexpected flow rate"
+    assert np.allclose(data["times"]["min_jacobian"], [0.004, 0.008]), "Unexpected minimum Jacobian times"
+    assert np.allclose(data["min_jacobian"], [0.25, 0.125]), "Unexpected minimum Jacobian"
+
+
+def test_adaptive_jacobian_policy():
+    """
+    Test that the Jacobian is only recomputed when the Newton convergence of the previous time step degrades.
+    """
+    policy = AdaptiveJacobianPolicy(max_contraction=0.2, max_iterations=4, max_age=10, verbose=False)
+
+    # Fast convergence with a fresh Jacobian
+    assert not policy.refactorize([1.0, 1e-2, 1e-5, 1e-11], factorizations=1), "Fast convergence should reuse"
+    assert policy.age == 1, f"Unexpected Jacobian age {policy.age}"
+
+    # Linear convergence with a small contraction rate is still accepted
+    assert not policy.refactorize([1.0, 0.1, 0.01, 0.001], factorizations=0), "Contraction 0.1 should reuse"
+    assert policy.age == 2, f"Unexpected Jacobian age {policy.age}"
+
+    # Slow contraction or too many iterations triggers a recompute
+    assert policy.refactorize([1.0, 0.5, 0.25], factorizations=0), "Contraction 0.5 should recompute"
+    assert np.isclose(policy.contraction, 0.5), f"Unexpected contraction rate {policy.contraction}"
+    assert policy.refactorize([1.0, 0.1, 0.01, 1e-3, 1e-4], factorizations=0), "5 iterations should recompute"
+
+    # The maximum age forces a recompute even with fast convergence
+    policy = AdaptiveJacobianPolicy(max_contraction=0.2, max_iterations=4, max_age=3, verbose=False)
+    decisions = [policy.refactorize([1.0, 1e-3], factorizations=int(step == 0)) for step in range(3)]
+    assert decisions == [False, False, True], f"Unexpected decisions {decisions}"
+
+
+def test_step_timer():
+    """
+    Test that the linear solves are timed separately from the rest of the Newton solver.
+    """
+    class SleepingSolver:
+        def solve(self, x, b):
+            time.sleep(0.05)
+
+        def set_operator(self, A):
+            pass
+
+    timer = StepTimer(warmup_steps=1)
+
+    @timer.timed
+    def pre_solve(up_sol):
+        return timer.time_linear_solver(up_sol)
+
+    @timer.timed
+    def post_solve():
+        time.sleep(0.01)
+
+    up_sol = SleepingSolver()
+    for step in range(3):
+        up_sol = pre_solve(up_sol)
+        up_sol.set_operator(None)
+        up_sol.solve(None, None)
+        time.sleep(0.01)
+        post_solve()
+
+    summary = timer.step_summary()
+
+    assert len(timer.times["total"]) == 3, "Unexpected number of timed steps"
+    assert timer.summary()["linear_solve"]["calls"] == 3, "Linear solves should be reported with the hooks"
+    assert summary["post_solve"]["min"] >= 0.01, "post_solve was not timed"
+    assert summary["linear_solve"]["min"] >= 0.05, "Linear solve was not timed"
+    assert 0.01 <= summary["assembly"]["min"] < 0.05, "Assembly should not include the linear solve"
+    assert summary["total"]["mean"] >= summary["linear_solve"]["mean"] + summary["assembly"]["mean"], \
+        "Total time should include all phases"
+
+
+def test_adaptive_jacobian_policy_with_step_timer():
+    """
+    Test that the Jacobian policy and the step timer find their solver proxies when wrapped by each other, instead
+    of wrapping the linear solver again at every time step.
+    """
+    class Vector:
+        def __init__(self, value):
+            self.value = value
+
+        def norm(self, norm_type):
+            return self.value
+
+    class Solver:
+        def solve(self, x, b):
+            x.value = 0.1 * b.value
+
+        def set_operator(self, A):
+            pass
+
+    policy = AdaptiveJacobianPolicy(max_contraction=0.2, max_iterations=4, verbose=False)
+    timer = StepTimer(warmup_steps=0)
+    up_sol = Solver()
+    solvers = []
+    for step in range(3):
+        with timer.section("pre_solve"):
+            updates = policy(up_sol)
+            up_sol = timer.time_linear_solver(updates["up_sol"])
+        solvers.append(up_sol)
+        if step == 0:
+            up_sol.set_operator(None)
+        for residual in [1.0, 1e-2, 1e-4]:
+            up_sol.solve(Vector(0.0), Vector(residual))
+        with timer.section("post_solve"):
+            pass
+
+    assert solvers[1] is solvers[0] and solvers[2] is solvers[0], "Linear solver was wrapped again"
+    assert isinstance(up_sol.solver.solver, Solver), "Linear solver should be wrapped once by each proxy"
+    assert updates["recompute_tstep"] > 1, "Fast convergence should reuse the Jacobian"
+    assert policy.age == 2 and policy.iterations == 3, "Policy did not see the Newton iterations"
+
+
+def test_record_newton_iterations():
+    """
+    Test that the Newton iterations of each time step are recorded, also when the linear solver is wrapped by the
+    Jacobian policy and the step timer.
+    """
+    class Vector:
+        def __init__(self, value):
+            self.value = value
+
+        def norm(self, norm_type):
+            return self.value
+
+    class Solver:
+        def solve(self, x, b):
+            x.value = 0.1 * b.value
+
+        def set_operator(self, A):
+            pass
+
+    policy = AdaptiveJacobianPolicy(verbose=False)
+    timer = StepTimer()
+    up_sol = Solver()
+    assert newton_iterations(up_sol) == dict(newton_atol=[], newton_rtol=[]), "Nothing should be recorded"
+    for step in range(2):
+        updates = policy(up_sol)
+        up_sol = record_newton_iterations(timer.time_linear_solver(updates["up_sol"]))
+        for residual in [1.0, 1e-2, 1e-4][:step + 2]:
+            up_sol.solve(Vector(0.0), Vector(residual))
+
+    iterations = newton_iterations(up_sol)
+
+    assert np.allclose(iterations["newton_atol"], [1.0, 1e-2, 1e-4]), "Unexpected residuals of the last time step"
+    assert np.allclose(iterations["newton_rtol"], [0.1, 1e-3, 1e-5]), "Unexpected increments of the last time step"
+    assert isinstance(up_sol.solver.solver, Solver), "Linear solver should be wrapped once by each proxy"
+
+
+def test_hook_timers():
+    """
+    Test that decorated hooks and the diagnostics run by the scheduler are timed and summarized.
+    """
+    hook_timers = HookTimers()
+
+    @hook_timers.timed
+    def post_solve(value, **namespace):
+        time.sleep(0.01)
+        return dict(value=value)
+
+    @hook_timers.timed(report=True)
+    def finished(**namespace):
+        pass
+
+    diagnostics = DiagnosticsScheduler(dict(probes=dict(every=2, start=0.003), jacobian=dict(every=0)), hook_timers)
+    results = {}
+    for counter in range(1, 7):
+        t = counter * 0.001
+        assert post_solve(counter, t=t) == dict(value=counter), "Decorated hook should return the result of the hook"
+        results[counter] = diagnostics.run("probes", counter, t, lambda x: 2 * x, counter)
+        assert diagnostics.run("jacobian", counter, t, lambda: 1.0) is None, "Disabled diagnostic should not run"
+        assert diagnostics.run("flow_properties", counter, t, lambda: 1.0) == 1.0, "Unscheduled should always run"
+
+    finished()
+    summary = hook_timers.summary()
+
+    assert [counter for counter, value in results.items() if value is not None] == [4, 6], "Unexpected cadence"
+    assert results[4] == 8, "Diagnostic should return its result"
+    assert summary["post_solve"]["calls"] == 6, "Unexpected number of post_solve calls"
+    assert summary["post_solve"]["min"] >= 0.06, "post_solve was not timed"
+    assert summary["probes"]["calls"] == 2, "Unexpected number of probe calls"
+    assert "finished" in summary and "jacobian" not in summary, "Unexpected timed names"
+
+    with pytest.raises(ValueError):
+        DiagnosticsScheduler(dict(probes=dict(every=2, stride=3)))
+
+
+def test_periodic_convergence_monitor(monkeypatch):
+    """
+    Test that the monitor flags a decaying transient as converged once consecutive cycles match.
+    """
+    period, dt = 0.1, 0.01
+    monitor = PeriodicConvergenceMonitor(period, dt, tolerance=1e-2, num_cycles=2, verbose=False)
+    converged_step = None
+    for step in range(1, 201):
+        t = step * dt
+        flow_rate = 1.5 + np.sin(2 * np.pi * t / period) + np.exp(-10 * t)
+        probe_pressure = np.array([1.0, 2.0]) * (2 + np.cos(2 * np.pi * t / period))
+        differences = monitor.update(t, flow_rate=flow_rate, probe_pressure=probe_pressure, time_step=step)
+        if differences:
+            assert set(differences) == {"flow_rate", "probe_pressure"}, "Unexpected signals compared"
+            assert np.isclose(differences["probe_pressure"], 0), "Periodic signal should not differ between cycles"
+        if monitor.converged:
+            converged_step = step
+            break
+
+    # The flow rate in the cycles of time steps 51-60 and 61-70 are the first to differ by less than 1e-2 from the
+    # previous cycle, which is detected when the next cycle starts
+    assert converged_step == 71, f"Expected convergence at time step 71, got {converged_step}"
+    assert monitor.num_periodic_cycles == 2, "Unexpected number of consecutive periodic cycles"
+
+    # Stopping writes a checkpoint of the turtleFSI namespace
+    written = []
+    monkeypatch.setattr("vasp.simulations.simulation_common.checkpoint", lambda **namespace: written.append(namespace))
+    assert monitor.stop(t=0.71, counter=71) == dict(stop=True), "turtleFSI was not told to stop"
+    assert written == [dict(t=0.71, counter=71)], "The checkpoint was not written"
+
+
+def test_spectral_analyzer(tmpdir):
+    """
+    Test that the in-situ spectrogram frames match scipy.signal.spectrogram averaged over the signals.
+    """
+    dt = 1e-3
+    window_size = 64
+    times = np.arange(1000) * dt
+    signals = np.stack([np.sin(2 * np.pi * 150 * times), np.cos(2 * np.pi * 300 * times)], axis=1)
+
+    spectra_path = Path(tmpdir) / "spectra.h5"
+    analyzer = SpectralAnalyzer(dt, window_size, spectra_path, overlap=0.75, bands=[[100, 200], [200, 400]])
+    for t, values in zip(times, signals):
+        analyzer.update(t, velocity=values)
+
+    _, bins, Pxx = spectrogram(signals.T, fs=1 / dt, nperseg=window_size, noverlap=int(0.75 * window_size),
+                               nfft=2 * window_size, window="hann", scaling="spectrum")
+    Pxx = Pxx.mean(axis=0)
+
+    with h5py.File(spectra_path, "r") as f:
+        frame_times = f["velocity/time"][()]
+        power = f["velocity/power"][()]
+        band_power = f["velocity/band_power"][()]
+        chroma = f["velocity/chroma"][()]
+        sbi = f["velocity/sbi"][()]
+
+    assert np.allclose(frame_times, bins), "Frame times differ from the spectrogram bins"
+    assert np.allclose(power, Pxx.T), "Power spectra differ from scipy.signal.spectrogram"
+    assert np.allclose(band_power[:, 0], band_power[:, 1], rtol=0.1), "Unexpected band power of the two tones"
+    assert np.allclose(chroma.sum(axis=1), 1.0), "Chroma is not normalized"
+    assert np.all((sbi >= 0) & (sbi <= 1)), "SBI is not in [0, 1]"
+
+
+def test_wall_shear_stress(tmpdir):
+    """
+    Test the in-situ WSS with Hagen-Poiseuille flow in a pipe with radius 1 and mu = 1, where u = 1 - r^2 gives
+    WSS = 2 Pa at the wall, as in test_compute_hemodynamics.
+    """
+    fluid_mesh_path = Path(__file__).parent / "test_data/hemodynamics_data/Mesh/mesh_fluid.h5"
+    mesh = Mesh()
+    with HDF5File(mesh.mpi_comm(), str(fluid_mesh_path), "r") as infile:
+        infile.read(mesh, "mesh", False)
+
+    V = VectorFunctionSpace(mesh, "CG", 2)
+    u = interpolate(Expression(("1 - x[1]*x[1] - x[2]*x[2]", "0", "0"), degree=2), V)
+
+    output_folder = Path(tmpdir) / "Hemodynamic_indices"
+    wall_shear_stress = WallShearStress(V, fluid_mesh_path, mu_f=1.0, dt=0.1, output_folder=output_folder, save_step=2)
+    for step in range(3):
+        wall_shear_stress.update(step * 0.1, u)
+    wall_shear_stress.write()
+
+    assert (output_folder / "WSS.xdmf").exists(), "WSS was not written at the save step"
+
+    # Average TAWSS over the wall, excluding the two ends of the pipe
+    boundary_mesh = BoundaryMesh(mesh, "exterior")
+    marker = MeshFunction("size_t", boundary_mesh, boundary_mesh.topology().dim(), 0)
+    CompiledSubDomain("x[0] > 0.1 && x[0] < 4.9").mark(marker, 1)
+    V_boundary = FunctionSpace(boundary_mesh, "DG", 1)
+    indices = {}
+    for name in ["TAWSS", "TWSSG"]:
+        indices[name] = Function(V_boundary)
+        with XDMFFile(mesh.mpi_comm(), str(output_folder / f"{name}.xdmf")) as infile:
+            infile.read_checkpoint(indices[name], name, 0)
+
+    dx_wall = dx(domain=boundary_mesh, subdomain_data=marker, subdomain_id=1)
+    tawss_average = assemble(indices["TAWSS"] * dx_wall) / assemble(1 * dx_wall)
+
+    assert 1.95 < tawss_average < 2.05, f"Unexpected average TAWSS {tawss_average}"
+    assert np.allclose(indices["TWSSG"].vector().get_local(), 0), "TWSSG of a steady flow should be zero"
+
+
+def test_region_writer(tmpdir):
+    """
+    Test that the region writer writes the vertex values inside a region and domain in a time-major layout.
+    """
+    mesh = UnitCubeMesh(4, 4, 4)
+    domains = MeshFunction("size_t", mesh, mesh.topology().dim(), 1)
+    CompiledSubDomain("x[2] <= 0.5 + DOLFIN_EPS").mark(domains, 2)
+
+    V = VectorFunctionSpace(mesh, "CG", 2)
+    Q = FunctionSpace(mesh, "CG", 1)
+    u_expression = Expression(("t * x[0]", "x[1] * x[1]", "x[2] + t"), t=0.0, degree=2)
+    p_expression = Expression("t * (x[0] + x[1])", t=0.0, degree=1)
+
+    output_path = Path(tmpdir) / "region.h5"
+    writer = RegionWriter(mesh, output_path, region=region_from_parameters([0.5, 0.5, 0.5, 0.4]), domains=domains,
+                          domain_ids=[2], flush_interval=2)
+    times = [0.1, 0.2, 0.3]
+    for t in times:
+        u_expression.t = t
+        p_expression.t = t
+        writer.write(t, v=interpolate(u_expression, V), p=interpolate(p_expression, Q))
+    writer.close()
+
+    coordinates, saved_times, fields = load_region_output(output_path)
+    x, y, z = coordinates.T
+
+    assert np.allclose(saved_times, times), "Unexpected times in the region output"
+    assert coordinates.shape[0] > 0, "No vertices were selected"
+    assert np.all(region_from_parameters([0.5, 0.5, 0.5, 0.4])(coordinates)), "Vertex outside the region"
+    assert np.all(z <= 0.5 + 1e-12), "Vertex outside the selected domain"
+    assert fields["v"].shape == (3, coordinates.shape[0], 3), f"Unexpected shape {fields['v'].shape}"
+    for i, t in enumerate(times):
+        assert np.allclose(fields["v"][i], np.column_stack([t * x, y ** 2, z + t])), "Unexpected velocity values"
+        assert np.allclose(fields["p"][i, :, 0], t * (x + y)), "Unexpected pressure values"
+    assert output_path.with_suffix(".xdmf").exists(), "XDMF file was not written"
+
+
+def test_separate_domain_writer(tmpdir):
+    """
+    Test that the separate domain writer writes the fluid velocity and solid displacement on the refined fluid and
+    solid meshes, such that they can be read back as in compute_hemodynamics and compute_stress_strain.
+    """
+    mesh = UnitCubeMesh(2, 2, 2)
+    domains = MeshFunction("size_t", mesh, mesh.topology().dim(), 1)
+    CompiledSubDomain("x[2] >= 0.5 - DOLFIN_EPS").mark(domains, 2)
+    boundaries = MeshFunction("size_t", mesh, mesh.topology().dim() - 1, 0)
+    mesh_path = Path(tmpdir) / "mesh.h5"
+    with HDF5File(mesh.mpi_comm(), str(mesh_path), "w") as hdf5:
+        hdf5.write(mesh, "/mesh")
+        hdf5.write(boundaries, "/boundaries")
+        hdf5.write(domains, "/domains")
+
+    fluid_mesh_path, solid_mesh_path = create_separate_domain_meshes(mesh_path, 1, 2, save_deg=2)
+    assert fluid_mesh_path.name == "mesh_refined_fluid.h5", f"Unexpected fluid mesh {fluid_mesh_path}"
+    assert solid_mesh_path.name == "mesh_refined_solid.h5", f"Unexpected solid mesh {solid_mesh_path}"
+
+    V = VectorFunctionSpace(mesh, "CG", 2)
+    expressions = dict(velocity=Expression(("t * x[0] * x[1]", "x[2] * x[2]", "t"), t=0.0, degree=2),
+                       displacement=Expression(("x[0]", "t * x[1] * x[2]", "x[0] * x[0]"), t=0.0, degree=2))
+    output_folder = Path(tmpdir) / "Visualization_separate_domain"
+    writer = SeparateDomainWriter(V, V, fluid_mesh_path, solid_mesh_path, output_folder)
+    times = [0.1, 0.2]
+    for t in times:
+        for expression in expressions.values():
+            expression.t = t
+        writer.write(t, v=interpolate(expressions["velocity"], V), d=interpolate(expressions["displacement"], V))
+    writer.close()
+
+    assert (output_folder / "mesh.h5").exists(), "Fluid mesh was not written"
+    for name, file_name, domain_mesh_path in [("velocity", "u.h5", fluid_mesh_path),
+                                              ("displacement", "d_solid.h5", solid_mesh_path)]:
+        domain_mesh = Mesh()
+        with HDF5File(domain_mesh.mpi_comm(), str(domain_mesh_path), "r") as mesh_file:
+            mesh_file.read(domain_mesh, "mesh", False)
+        f = Function(VectorFunctionSpace(domain_mesh, "CG", 1))
+        with HDF5File(domain_mesh.mpi_comm(), str(output_folder / file_name), "r") as hdf5:
+            for i, t in enumerate(times):
+                expressions[name].t = t
+                hdf5.read(f, f"/{name}/vector_{i}")
+                expected = interpolate(expressions[name], f.function_space())
+                assert np.allclose(f.vector().get_local(), expected.vector().get_local()), \
+                    f"Unexpected {name} at t={t}"
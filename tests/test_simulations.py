@@ -1,6 +1,10 @@
+import json
+import os
 import pytest
 import subprocess
 import re
+from pathlib import Path
+
 import numpy as np
 
 
@@ -209,3 +213,159 @@ def test_aneurysm_problem(input_mesh, tmpdir):
     print(f"Reynolds number mean, min, max: {reynolds_number_mean_min_max}")
     assert np.isclose(reynolds_number_mean_min_max, expected_re_number).all(), \
         "Reynolds number mean, min, max does not match expected value."
+
+
+def test_warm_cache(tmpdir):
+    """
+    Test that vasp-warm-cache compiles the forms of a problem file for several degrees, and that a simulation
+    reuses the compiled forms without compiling new ones.
+    """
+    cache_dir = Path(tmpdir) / "jit_cache"
+    env = dict(os.environ, DIJITSO_CACHE_DIR=str(cache_dir))
+    mesh_path = Path("tests/test_data/cylinder/cylinder.h5").resolve()
+    cmd = (f"vasp-warm-cache --problem cylinder --mesh-path {mesh_path} --v-deg 1 2 "
+           f"--folder {Path(tmpdir) / 'warm_cache'}")
+    result = subprocess.check_output(cmd, shell=True, env=env).decode()
+
+    output_match = re.findall(r"--- Compiling forms of cylinder with d_deg=(\d+), v_deg=(\d+), p_deg=(\d+)", result)
+
+    assert [int(v_deg) for _, v_deg, _ in output_match] == [1, 2], "Forms were not compiled for all degrees."
+    assert result.count("--- Done in") == 2, "Warm-up did not finish for all degrees."
+
+    compiled = {path.relative_to(cache_dir) for path in cache_dir.rglob("*.so")}
+    assert len(compiled) > 0, "No forms were compiled into the cache."
+
+    cmd = ("turtleFSI -p cylinder -T 0.002 --folder {} --sub-folder 1 --new-arguments "
+           "mesh_path=../../../tests/test_data/cylinder/cylinder.h5 v_deg=2".format(Path(tmpdir) / "simulation"))
+    subprocess.check_output(cmd, shell=True, cwd="src/vasp/simulations/", env=env)
+
+    new_entries = {path.relative_to(cache_dir) for path in cache_dir.rglob("*.so")} - compiled
+    assert len(new_entries) == 0, f"The simulation compiled forms that were not in the cache: {new_entries}"
+
+
+def test_parameter_sweep_variants():
+    """
+    Test that a parameter sweep runs all combinations of values, and measures the distance between variants.
+    """
+    from vasp.simulations.parameter_sweep import get_variants, parameter_distance
+
+    variants = get_variants({"P_mean": [10000, 12000], "Q_mean": [1.0e-06, 1.25e-06, 1.5e-06]})
+    assert len(variants) == 6, "Not all combinations of the swept parameters were run."
+    assert variants[1] == {"P_mean": 10000, "Q_mean": 1.25e-06}, "Variants are not ordered as the values."
+    assert get_variants([{"mu_s": 1e5}]) == [{"mu_s": 1e5}], "Explicit variants were not kept."
+
+    assert parameter_distance(variants[0], variants[0]) == 0, "Distance of a variant to itself is not zero."
+    assert parameter_distance(variants[0], variants[1]) < parameter_distance(variants[0], variants[2]), \
+        "Closer parameters should give a smaller distance."
+    solid = [dict(solid_properties=[dict(material_model="MooneyRivlin", C01=c)]) for c in [1e4, 2e4]]
+    assert np.isclose(parameter_distance(*solid), 0.25), "Nested parameters were not compared."
+    assert parameter_distance(dict(material_model="StVenantKirchhoff"), dict(material_model="MooneyRivlin")) == 1, \
+        "Different non-numeric values should give a distance of one."
+
+
+def test_parameter_sweep_young_modulus():
+    """
+    Test that the Young modulus is converted to the Lame parameters, and rejected for problems with solid_properties.
+    """
+    from vasp.simulations.parameter_sweep import convert_young_modulus
+
+    variant = convert_young_modulus(dict(E_s=1e6, P_mean=10000), dict(nu_s=0.45))
+    assert "E_s" not in variant and variant["P_mean"] == 10000, "Only E_s should be replaced."
+    assert np.isclose(variant["mu_s"], 1e6 / 2.9), "Unexpected shear modulus."
+    assert np.isclose(variant["lambda_s"], 0.45 * 2 * variant["mu_s"] / 0.1), "Unexpected first Lame parameter."
+
+    with pytest.raises(ValueError):
+        convert_young_modulus(dict(E_s=1e6), dict(nu_s=0.45, solid_properties=[dict(dx_s_id=2, mu_s=1e5)]))
+
+
+@pytest.mark.parametrize("problem, ramp_end", [("aneurysm", 0.25), ("offset_stenosis", 0.25), ("avf", 0.2)])
+def test_warm_start_ramp_end(problem, ramp_end):
+    """
+    Test that the warm start runs until the end of the ramps in the parameters of the problem file.
+    """
+    from vasp.automatedPreprocessing.warm_cache import import_problem, get_problem_parameters
+    from vasp.simulations.warm_start import get_ramp_end
+
+    problem_parameters = get_problem_parameters(import_problem(problem))
+    assert np.isclose(get_ramp_end(problem_parameters), ramp_end), f"Unexpected end of the ramps of {problem}"
+    assert get_ramp_end(dict(T=1.0)) is None, "Problems without ramp parameters should have no ramp end"
+
+
+def _write_checkpoint(checkpoint_folder, t, **variables):
+    checkpoint_folder.mkdir(parents=True, exist_ok=True)
+    for name in ["d1", "v1", "p1", "d2", "v2", "p2"]:
+        (checkpoint_folder / f"checkpoint_{name}.xdmf").write_text(name)
+    with open(checkpoint_folder / "default_variables.json", "w") as f:
+        json.dump(dict(variables, t=t), f)
+
+
+def test_parameter_sweep_checkpoints(tmpdir):
+    """
+    Test that the latest checkpoint of a variant is found, and copied to another variant at the same phase of the
+    cardiac cycle.
+    """
+    from vasp.simulations.parameter_sweep import find_last_checkpoint, prepare_warm_start
+
+    folder = Path(tmpdir) / "variant_000"
+    assert find_last_checkpoint(folder) is None, "A variant without checkpoints should have no checkpoint."
+
+    # The checkpoint the variant was warm started from is not a result of the variant
+    _write_checkpoint(folder / "warm_start" / "Checkpoint", 3.0, P_mean=10000)
+    assert find_last_checkpoint(folder) is None, "The warm start checkpoint should not be a result of the variant."
+
+    _write_checkpoint(folder / "1" / "Checkpoint", 2.5, P_mean=10000)
+    checkpoint_folder, t = find_last_checkpoint(folder)
+    assert checkpoint_folder == folder / "1" / "Checkpoint" and t == 2.5, "The latest checkpoint was not found."
+
+    restart_folder = Path(tmpdir) / "variant_001" / "warm_start"
+    prepare_warm_start(checkpoint_folder, t, restart_folder, dict(P_mean=12000, dt=0.001, T_Cycle=0.951))
+
+    assert (restart_folder / "Checkpoint" / "checkpoint_d2.xdmf").read_text() == "d2", "Checkpoint was not copied."
+    with open(restart_folder / "Checkpoint" / "default_variables.json") as f:
+        default_variables = json.load(f)
+    assert default_variables["P_mean"] == 12000, "Parameters of the variant were not set."
+    # 2.5 s is at 0.598 s into the third cycle, which continues at the same phase of the second cycle
+    assert np.isclose(default_variables["t"], 0.951 + 2.5 - 2 * 0.951), "Time was not moved to the second cycle."
+    assert default_variables["counter"] == round(default_variables["t"] / 0.001), "Time step counter does not match."
+
+
+def test_parameter_sweep_warm_start(tmpdir, monkeypatch):
+    """
+    Test that each variant is warm started from the finished variant with the closest parameters.
+    """
+    from vasp.simulations import parameter_sweep
+
+    class FakeProcess:
+        """Runs a variant instantly by writing a checkpoint to its results folder."""
+        def __init__(self, cmd, **kwargs):
+            if "--restart-folder" in cmd:
+                restart_folder = Path(cmd[cmd.index("--restart-folder") + 1])
+                with open(restart_folder / "Checkpoint" / "default_variables.json") as f:
+                    variables = json.load(f)
+                folder = Path(variables["folder"])
+            else:
+                folder = Path(cmd[cmd.index("--folder") + 1])
+            _write_checkpoint(folder / "1" / "Checkpoint", 1.5)
+            self.returncode = 0
+
+        def poll(self):
+            return self.returncode
+
+    monkeypatch.setattr(parameter_sweep.subprocess, "run", lambda *args, **kwargs: None)
+    monkeypatch.setattr(parameter_sweep.subprocess, "Popen", FakeProcess)
+    monkeypatch.setattr(parameter_sweep.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(parameter_sweep, "import_problem", lambda problem: None)
+    monkeypatch.setattr(parameter_sweep, "get_problem_parameters",
+                        lambda module: dict(dt=0.001, T=2.0, T_Cycle=0.951, nu_s=0.45))
+
+    variants = parameter_sweep.get_variants({"P_mean": [10000, 20000, 10100]})
+    sweep = parameter_sweep.run_sweep("aneurysm", Path(tmpdir) / "mesh.h5", variants, {}, num_processes=1,
+                                      num_slots=1, mpirun="mpirun -np {num_processes}", folder=Path(tmpdir) / "sweep")
+
+    warm_starts = {variant["name"]: variant["warm_start"] for variant in sweep["variants"]}
+    order = [variant["name"] for variant in sweep["variants"]]
+    assert order == ["variant_000", "variant_002", "variant_001"], f"Unexpected order of the variants {order}"
+    assert warm_starts == dict(variant_000=None, variant_002="variant_000", variant_001="variant_002"), \
+        f"Variants were not warm started from the closest finished variant: {warm_starts}"
+    assert (Path(tmpdir) / "sweep" / "variant_001" / "warm_start" / "Checkpoint" / "checkpoint_d1.xdmf").exists(), \
+        "Checkpoint was not copied to the warm-started variant."
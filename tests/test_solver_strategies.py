@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from dolfin import UnitCubeMesh, VectorElement, FiniteElement, MixedElement, FunctionSpace, TrialFunctions, \
+    TestFunctions, Function, Constant, inner, grad, div, dx, assemble, LUSolver
+
+from vasp.simulations.jacobian_policy import AdaptiveJacobianPolicy
+from vasp.simulations.solver_strategies import SOLVER_STRATEGIES, create_linear_solver, get_field_index_sets
+
+
+@pytest.fixture(scope="module")
+def mixed_system():
+    """
+    Fixture for a coupled displacement-velocity-pressure system on a unit cube, and its solution with LU.
+    """
+    mesh = UnitCubeMesh(4, 4, 4)
+    de = VectorElement("CG", mesh.ufl_cell(), 1)
+    pe = FiniteElement("CG", mesh.ufl_cell(), 1)
+    DVP = FunctionSpace(mesh, MixedElement([de, de, pe]))
+    d, v, p = TrialFunctions(DVP)
+    phi, psi, gamma = TestFunctions(DVP)
+
+    a = (inner(grad(d), grad(phi)) + inner(d, phi) + inner(grad(v), grad(psi)) + inner(v, psi)
+         + inner(grad(p), grad(gamma)) + p * gamma - 0.1 * p * div(psi) + 0.1 * div(v) * gamma
+         + 0.1 * inner(v, phi)) * dx
+    L = (inner(Constant((1.0, 0.0, 0.0)), phi) + inner(Constant((0.0, 1.0, 0.0)), psi) + Constant(1.0) * gamma) * dx
+    A = assemble(a)
+    b = assemble(L)
+
+    reference = Function(DVP)
+    LUSolver(A).solve(reference.vector(), b)
+
+    return DVP, A, b, reference
+
+
+def test_mumps_keeps_direct_solver(mixed_system):
+    """
+    Test that the "mumps" strategy keeps the direct solver of turtleFSI.
+    """
+    DVP = mixed_system[0]
+    assert create_linear_solver("mumps", DVP) is None, "mumps should keep the direct solver"
+    assert create_linear_solver(None, DVP) is None, "None should keep the direct solver"
+    with pytest.raises(ValueError):
+        create_linear_solver("cg_magic", DVP)
+
+
+def test_field_index_sets(mixed_system):
+    """
+    Test that the index sets of the fields cover all degrees of freedom exactly once.
+    """
+    DVP = mixed_system[0]
+    index_sets = get_field_index_sets(DVP, dict(d=[0, 3], vp=[1, 2]))
+    sizes = {name: index_set.getSizes()[1] for name, index_set in index_sets.items()}
+
+    assert sizes["d"] == DVP.sub(0).dim(), "Displacement field has the wrong size"
+    assert sizes["d"] + sizes["vp"] == DVP.dim(), "Fields do not cover the mixed space"
+
+
+@pytest.mark.parametrize("solver_strategy", [name for name in SOLVER_STRATEGIES if name != "mumps"])
+def test_solver_strategy(mixed_system, solver_strategy):
+    """
+    Test that each Krylov solver strategy reproduces the direct solution, and reuses the preconditioner.
+    """
+    DVP, A, b, reference = mixed_system
+    solver = create_linear_solver(solver_strategy, DVP, dict(ksp_rtol=1e-10), preconditioner_reuse=2)
+
+    # The solver is installed once, also when wrapped by a proxy
+    up_sol = solver.install(LUSolver())
+    assert up_sol is solver, "The Krylov solver should replace the direct solver"
+    policy_updates = AdaptiveJacobianPolicy(verbose=False)(up_sol)
+    assert solver.install(policy_updates["up_sol"]) is policy_updates["up_sol"], "The proxy should be kept"
+
+    solution = Function(DVP)
+    up_sol.set_operator(A)
+    up_sol.solve(solution.vector(), b)
+    assert not solver.ksp().getReusePreconditioner(), "The first preconditioner should be built"
+
+    up_sol.set_operator(A)
+    assert solver.ksp().getReusePreconditioner(), "The preconditioner should be reused for the second Jacobian"
+
+    error = np.linalg.norm(solution.vector().get_local() - reference.vector().get_local())
+    assert error < 1e-6 * np.linalg.norm(reference.vector().get_local()), \
+        f"{solver_strategy} does not match the direct solution"
+    assert solver.iterations[0] > 0, "Number of Krylov iterations was not recorded"